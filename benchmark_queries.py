@@ -0,0 +1,271 @@
+##Benchmark harness for the query functions in the flight, pilot, destination and log_out modules
+#Builds synthetic databases at several sizes (see generate_synthetic_data.py), runs each public query with representative
+#parameters and records p50/p95/p99 latency, rows per second and peak Python memory. Results are saved as JSON, and can be
+#compared against an earlier run to flag regressions beyond a threshold
+#
+#Example: python benchmark_queries.py --sizes 1000,10000,100000 --output after.json --baseline before.json --threshold 0.2
+#
+#Functions that prompt for input (add_new_*, update_destination, reassign_pilot, update_flight_status) are not benchmarked.
+#Functions that write run against a throw-away copy of each database, so the generated datasets are never changed
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+import db_interaction_connection
+from db_interaction_connection import reset_pool
+from generate_synthetic_data import generate_dataset
+
+import db_interaction_flight_queries as flight_queries
+import db_interaction_pilot_queries as pilot_queries
+import db_interaction_destination_queries as destination_queries
+import db_interaction_log_out as log_out
+
+DEFAULT_SIZES = [1000, 10000, 100000]
+DEFAULT_ITERATIONS = 20
+WARMUP_ITERATIONS = 2
+
+def _count_rows(result):
+    #Number of rows in a query result (lists, generators, single values)
+    if result is None:
+        return 0
+    if isinstance(result, (list, tuple)):
+        return len(result)
+    if isinstance(result, (int, float, str, dict)):
+        return 1
+    return sum(1 for _ in result)
+
+def _sample_parameters(db_path, seed):
+    #Picks representative parameters (existing IDs, countries and dates) from the database
+    rng = random.Random(seed)
+    conn = sqlite3.connect(db_path)
+    try:
+        flight = conn.execute("SELECT flight_ID, personal_ID, destination_ID, arrival_destination_ID, departure_date_time FROM Flights ORDER BY flight_ID LIMIT 1 OFFSET ?",
+                              (rng.randrange(conn.execute("SELECT COUNT(*) FROM Flights").fetchone()[0]),)).fetchone()
+        departure_country = conn.execute("SELECT country FROM Destinations WHERE destination_ID = ?", (flight[2],)).fetchone()[0]
+        arrival_country = conn.execute("SELECT country FROM Destinations WHERE destination_ID = ?", (flight[3],)).fetchone()[0]
+        writable_flights = [row[0] for row in conn.execute("SELECT flight_ID FROM Flights WHERE status IN ('NotDeparted', 'Delayed') LIMIT 5000")]
+    finally:
+        conn.close()
+
+    return {
+        "flight_id": flight[0],
+        "pilot_id": flight[1],
+        "destination_id": flight[2],
+        "arrival_id": flight[3],
+        "date": flight[4][:10],
+        "departure_country": departure_country,
+        "arrival_country": arrival_country,
+        "writable_flights": writable_flights,
+        "rng": rng,
+    }
+
+def _benchmarks(params):
+    #List of (name, function) pairs. Each function runs one query and returns how many rows it produced
+    def view(function, *args):
+        def run():
+            printed = [0]
+            def count_table(rows, headers):  #Stands in for main.format_table, counting the rows it would have printed
+                for _ in rows:
+                    printed[0] += 1
+            result = function(*args, count_table)
+            return printed[0] or _count_rows(result)
+        return run
+
+    def query(function, *args):
+        return lambda: _count_rows(function(*args))
+
+    def uncached(function, *args):
+        #Flight lookups are normally served from the read-through cache after the first call, so clear it to time the query itself
+        def run():
+            flight_queries.invalidate_flight_cache()
+            return _count_rows(function(*args))
+        return run
+
+    def status_events():
+        flights = params["writable_flights"]
+        events = [(params["rng"].choice(flights), "Delayed", None) for _ in range(100)]
+        return _count_rows(flight_queries.apply_status_events(events))
+
+    def cancel():
+        flight_queries.cancel_flight_by_id(params["rng"].choice(params["writable_flights"]))
+        return 1
+
+    return [
+        ("flight.get_flights_by_status(all)", uncached(flight_queries.get_flights_by_status, "all")),
+        ("flight.get_flights_by_status(Delayed)", uncached(flight_queries.get_flights_by_status, "Delayed")),
+        ("flight.get_flights_by_arrival_id", uncached(flight_queries.get_flights_by_arrival_id, params["arrival_id"])),
+        ("flight.get_flights_by_destination_id", uncached(flight_queries.get_flights_by_destination_id, params["destination_id"])),
+        ("flight.get_flights_by_destination_country", uncached(flight_queries.get_flights_by_destination_country, params["departure_country"])),
+        ("flight.get_flights_by_arrival_country", uncached(flight_queries.get_flights_by_arrival_country, params["arrival_country"])),
+        ("flight.get_flights_by_date", uncached(flight_queries.get_flights_by_date, params["date"])),
+        ("flight.get_flights_arriving_on", uncached(flight_queries.get_flights_arriving_on, params["date"])),
+        ("flight.get_flights_by_status(Delayed) cached", query(flight_queries.get_flights_by_status, "Delayed")),
+        ("flight.iter_flights_by_status(all)", uncached(flight_queries.iter_flights_by_status, "all")),
+        ("flight.iter_flights_by_status(Delayed)", uncached(flight_queries.iter_flights_by_status, "Delayed")),
+        ("flight.iter_flights_by_date", uncached(flight_queries.iter_flights_by_date, params["date"])),
+        ("flight.iter_flights_arriving_on", uncached(flight_queries.iter_flights_arriving_on, params["date"])),
+        ("flight.apply_status_events(100)", status_events),
+        ("flight.cancel_flight_by_id", cancel),
+        ("pilot.view_all_pilots", view(pilot_queries.view_all_pilots)),
+        ("pilot.count_total_pilots", query(pilot_queries.count_total_pilots)),
+        ("pilot.view_all_flights_for_pilot", view(pilot_queries.view_all_flights_for_pilot, params["pilot_id"])),
+        ("pilot.view_active_flights_for_pilot", view(pilot_queries.view_active_flights_for_pilot, params["pilot_id"])),
+        ("pilot.delete_pilot_by_id(assigned)", query(pilot_queries.delete_pilot_by_id, params["pilot_id"])),
+        ("destination.view_all_destinations", view(destination_queries.view_all_destinations)),
+        ("destination.find_flights_by_destination", view(destination_queries.find_flights_by_destination, params["destination_id"])),
+        ("destination.view_destinations_by_cost", view(destination_queries.view_destinations_by_cost)),
+        ("destination.view_unassigned_destinations", view(destination_queries.view_unassigned_destinations)),
+        ("destination.delete_destination_by_id(assigned)", query(destination_queries.delete_destination_by_id, params["destination_id"])),
+        ("log_out.get_delay_events", query(log_out.get_delay_events)),
+        ("log_out.get_total_delay_by_flight", query(log_out.get_total_delay_by_flight)),
+        ("log_out.get_average_delay_duration", query(log_out.get_average_delay_duration)),
+        ("log_out.view_delayed_flights_with_duration", view(log_out.view_delayed_flights_with_duration)),
+        ("log_out.view_average_delay_duration", query(log_out.view_average_delay_duration)),
+    ]
+
+def _percentile(sorted_values, percent):
+    #Nearest-rank percentile of an already sorted list
+    index = max(0, min(len(sorted_values) - 1, int(round(percent / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+def run_benchmark(name, function, iterations):
+    '''
+    Time one benchmark. Returns a dict of latency percentiles (ms), rows per call, rows per second and peak memory (KiB)
+    '''
+    with contextlib.redirect_stdout(io.StringIO()):  #The view functions print tables, which would swamp the timings
+        for _ in range(WARMUP_ITERATIONS):
+            function()
+
+        latencies = []
+        rows = 0
+        for _ in range(iterations):
+            began = time.perf_counter()
+            rows = function()
+            latencies.append(time.perf_counter() - began)
+
+        #Memory is measured on one extra run, as tracing slows Python code down and would distort the timings above
+        tracemalloc.start()
+        function()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    latencies.sort()
+    mean = sum(latencies) / len(latencies)
+    return {
+        "iterations": iterations,
+        "p50_ms": round(_percentile(latencies, 50) * 1000, 3),
+        "p95_ms": round(_percentile(latencies, 95) * 1000, 3),
+        "p99_ms": round(_percentile(latencies, 99) * 1000, 3),
+        "mean_ms": round(mean * 1000, 3),
+        "rows": rows,
+        "rows_per_s": round(rows / mean, 1) if mean > 0 else None,
+        "peak_memory_kib": round(peak / 1024, 1),
+    }
+
+def prepare_database(data_dir, flights, seed):
+    '''
+    Return the path of a generated database with "flights" flights, building it the first time it is asked for
+    '''
+    os.makedirs(data_dir, exist_ok=True)
+    path = os.path.join(data_dir, f"bench_{flights}_seed{seed}.db")
+    if not os.path.exists(path):
+        with contextlib.redirect_stdout(io.StringIO()):
+            generate_dataset(path, pilots=max(10, flights // 50), destinations=max(10, flights // 500), flights=flights, seed=seed)
+    return path
+
+def run_suite(sizes, iterations, seed, data_dir, only=None):
+    '''
+    Run every benchmark against a database of each size. Returns the results as a JSON-ready dict
+    '''
+    results = {
+        "meta": {
+            "created": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "iterations": iterations,
+            "seed": seed,
+        },
+        "results": {},
+    }
+
+    previous_path = db_interaction_connection.DB_PATH
+    try:
+        for flights in sizes:
+            source = prepare_database(data_dir, flights, seed)
+            with tempfile.TemporaryDirectory() as scratch:
+                copy = os.path.join(scratch, "bench.db")
+                shutil.copyfile(source, copy)
+                reset_pool(db_path=copy)
+
+                params = _sample_parameters(copy, seed)
+                size_results = {}
+                for name, function in _benchmarks(params):
+                    if only and only not in name:
+                        continue
+                    size_results[name] = run_benchmark(name, function, iterations)
+                    print(f"[{flights:>9,} flights] {name:<50} p50 {size_results[name]['p50_ms']:>10.3f}ms  "
+                          f"p95 {size_results[name]['p95_ms']:>10.3f}ms  rows {size_results[name]['rows']:>8}", file=sys.stderr)
+                results["results"][str(flights)] = size_results
+                reset_pool(db_path=previous_path)  #Closes pooled connections before the copy is deleted
+    finally:
+        reset_pool(db_path=previous_path)
+    return results
+
+def compare_results(baseline, current, threshold, metric="p50_ms"):
+    '''
+    Compare two result sets. Returns a list of (size, query, baseline value, current value, change) for every query
+    whose "metric" got worse by more than "threshold" (0.2 = 20%)
+    '''
+    regressions = []
+    for size, queries in current["results"].items():
+        for name, stats in queries.items():
+            before = baseline.get("results", {}).get(size, {}).get(name)
+            if not before or not before.get(metric):
+                continue
+            change = (stats[metric] - before[metric]) / before[metric]
+            if change > threshold:
+                regressions.append((size, name, before[metric], stats[metric], change))
+    return regressions
+
+#Entry point: run the benchmarks, save them, and compare against a baseline if this script is executed directly
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the FlyMe query functions")
+    parser.add_argument("--sizes", default=",".join(str(size) for size in DEFAULT_SIZES), help="comma separated numbers of flights")
+    parser.add_argument("--iterations", type=int, default=DEFAULT_ITERATIONS)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--data-dir", default=".benchmark_data", help="where generated databases are kept between runs")
+    parser.add_argument("--only", default=None, help="only run benchmarks whose name contains this text")
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--baseline", default=None, help="earlier results JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed slowdown before flagging a regression (0.2 = 20%%)")
+    parser.add_argument("--metric", default="p50_ms", choices=["p50_ms", "p95_ms", "p99_ms", "mean_ms"])
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(",") if size.strip()]
+    results = run_suite(sizes, args.iterations, args.seed, args.data_dir, args.only)
+    with open(args.output, "w") as output_file:
+        json.dump(results, output_file, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+        regressions = compare_results(baseline, results, args.threshold, args.metric)
+        for size, name, before, after, change in regressions:
+            print(f"REGRESSION [{size} flights] {name}: {args.metric} {before} -> {after} (+{change:.0%})")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions beyond {args.threshold:.0%} against {args.baseline}")
@@ -0,0 +1,331 @@
+##File handles the non-interactive command line: one-off commands instead of the menu, and a batch mode for scripts
+#"python main.py" with no arguments still opens the menu. With arguments, the command is run and the program exits, e.g.
+#   python main.py flights --status Delayed --format jsonl
+#   python main.py status apply events.jsonl
+#   python main.py delays --avg
+#(the "flyme" script in this folder is a shortcut for "python main.py")
+#Batch mode ("python main.py batch < commands.txt") reads one command per line from stdin and runs them all in this one process,
+#so the pooled connections, prepared statements and caches stay warm between commands rather than starting cold each time.
+#Commands exit with 0 on success, 1 if something failed (e.g. a status update was rejected) and 2 for a mistake in the command
+
+import argparse
+import json
+import shlex
+import sqlite3
+import sys
+import time
+from datetime import datetime
+
+from db_interaction_flight_queries import (
+    VALID_STATUSES,
+    iter_flights_by_status,
+    iter_flights_by_date,
+    iter_flights_arriving_on,
+    iter_flights_by_destination_id,
+    iter_flights_by_arrival_id,
+    iter_flights_by_destination_country,
+    iter_flights_by_arrival_country,
+    apply_status_events,
+) #Import streaming flight lookups and batch status updates
+from db_interaction_pilot_queries import get_flights_for_pilot
+from db_interaction_history import get_flights_as_of
+from db_interaction_log_out import get_total_delay_by_flight, iter_delay_events
+from db_interaction_log_archive import parse_log_time
+from db_interaction_delay_stats import get_delay_stats, get_delay_stats_by_destination
+from db_interaction_routes import MAX_CONNECTIONS, find_earliest_arrival
+from db_interaction_roster import MIN_REST_MINUTES, assign_roster
+from db_interaction_arrival_time import migrate_arrival_time
+from db_interaction_indexes import create_indexes
+from db_interaction_destination_cache import create_destination_version
+from import_data import READERS, detect_format
+from export_data import (
+    EXPORTS,
+    FLIGHT_COLUMNS,
+    PILOT_FLIGHT_COLUMNS,
+    DELAY_EVENT_COLUMNS,
+    export_rows,
+) #Import export sources and writers, which also produce the csv/jsonl output here
+
+OUTPUT_FORMATS = ("table", "csv", "jsonl")
+
+#----------------------------------------------------------------------------
+#Output: every command that returns rows writes them the same way, as a table (using the menu's format_table) or as CSV/JSONL
+
+def _output(args, columns, rows, format_table):
+    if args.format == "table":
+        if args.output:
+            raise ValueError("--output needs --format csv or jsonl")
+        format_table(rows, columns)
+        return
+    sys.stdout.flush()  #Anything already printed goes out before the rows
+    export_rows(columns, rows, args.output or "-", args.format)
+
+def _date(text):
+    try:
+        return datetime.strptime(text, "%Y-%m-%d").strftime("%Y-%m-%d")
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"'{text}' is not a date in the format YYYY-MM-DD")
+
+def _timestamp(text):
+    try:
+        return datetime.strptime(text, "%Y-%m-%d %H:%M:%S").strftime("%Y-%m-%d %H:%M:%S")
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"'{text}' is not a time in the format 'YYYY-MM-DD HH:MM:SS'")
+
+def _date_or_time(text):
+    try:
+        parse_log_time(text)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+    return text
+
+#----------------------------------------------------------------------------
+#Commands: each takes the parsed arguments and format_table, and returns an exit code
+
+def _flights_command(args, format_table):
+    if args.as_of:
+        if args.date or args.arriving_on or args.from_country or args.to_country:
+            raise ValueError("--as-of can only be combined with --status, --from or --to")
+        rows = get_flights_as_of(args.as_of, status=None if args.status in (None, "all") else args.status,
+                                 destination_id=args.from_id, arrival_id=args.to_id)
+    elif args.date:
+        rows = iter_flights_by_date(args.date)
+    elif args.arriving_on:
+        rows = iter_flights_arriving_on(args.arriving_on)
+    elif args.from_id is not None:
+        rows = iter_flights_by_destination_id(args.from_id)
+    elif args.to_id is not None:
+        rows = iter_flights_by_arrival_id(args.to_id)
+    elif args.from_country:
+        rows = iter_flights_by_destination_country(args.from_country)
+    elif args.to_country:
+        rows = iter_flights_by_arrival_country(args.to_country)
+    else:
+        rows = iter_flights_by_status(args.status or "all")
+    _output(args, FLIGHT_COLUMNS, rows, format_table)
+    return 0
+
+def _export_command(name):
+    #Command that outputs one of the export sources, e.g. all pilots
+    def command(args, format_table):
+        columns, rows = EXPORTS[name][0]()
+        _output(args, columns, rows, format_table)
+        return 0
+    return command
+
+def _pilot_flights_command(args, format_table):
+    rows = get_flights_for_pilot(args.pilot_id, status_filter="Arrived" if args.active else None)
+    _output(args, PILOT_FLIGHT_COLUMNS, rows, format_table)
+    return 0
+
+def _delays_command(args, format_table):
+    if (args.start or args.end) and (args.avg or args.by_destination):
+        raise ValueError("--start and --end only apply to the list of delays and --totals")
+    if args.avg:
+        stats = get_delay_stats()
+        if stats is None:
+            raise ValueError("No delayed flights found to calculate average.")
+        columns = ["count", "total_minutes", "average_minutes", "variance"]
+        _output(args, columns, [tuple(round(stats[column], 1) for column in columns)], format_table)
+    elif args.by_destination:
+        columns = ["destination_ID", "country", "name", "delays", "average_minutes", "variance"]
+        _output(args, columns, get_delay_stats_by_destination(), format_table)
+    elif args.totals:
+        _output(args, ["flight_ID", "delays", "total_delay_minutes"], get_total_delay_by_flight(args.start, args.end), format_table)
+    else:
+        _output(args, DELAY_EVENT_COLUMNS, iter_delay_events(args.start, args.end), format_table)
+    return 0
+
+def _status_events(path):
+    #Reads (flight_ID, status, departure) events from a CSV or JSONL file, one at a time
+    #A line that cannot be read, or has a bad flight_ID, is passed on to fail by itself, so the rest of the file is still applied
+    for line_number, row in READERS[detect_format(path)](path):
+        if isinstance(row, ValueError):
+            yield ValueError(f"{path} line {line_number}: {row}")
+            continue
+        departure = row.get("departure_date_time", row.get("departure")) or None
+        flight_id = row.get("flight_id")
+        yield (flight_id.strip() if isinstance(flight_id, str) else flight_id, str(row.get("status", "")).strip(), departure)
+
+def _apply_events(args, events, format_table):
+    results = apply_status_events(events)
+    failed = [result for result in results if not result[1]]
+    if args.format == "table":
+        for flight_id, _, message in failed:
+            print(message if flight_id is None else f"Flight ID {flight_id}: {message}", file=sys.stderr)
+    else:
+        _output(args, ["flight_ID", "success", "message"], results, format_table)
+    print(f"{len(results) - len(failed)} of {len(results)} status updates applied.", file=sys.stderr)
+    return 1 if failed else 0
+
+def _status_set_command(args, format_table):
+    return _apply_events(args, [(args.flight_id, args.status, args.departure)], format_table)
+
+def _status_apply_command(args, format_table):
+    return _apply_events(args, _status_events(args.path), format_table)
+
+def _route_command(args, format_table):
+    journey = find_earliest_arrival(args.from_id, args.to_id, args.depart_after, args.max_connections)
+    if journey is None:
+        raise ValueError(f"No journey found with up to {args.max_connections} connections.")
+    _output(args, ["flight_ID", "from_ID", "to_ID", "departure_date_time", "arrival_date_time"], journey["legs"], format_table)
+    print(f"Arrives {journey['arrival']} with {max(len(journey['legs']) - 1, 0)} connection(s), total cost {journey['cost']:.2f}",
+          file=sys.stderr)
+    return 0
+
+def _roster_command(args, format_table):
+    result = assign_roster(args.start_date, args.end_date, args.rest, args.dry_run)
+    if args.format == "table":
+        print(f"{result['assigned']} of {result['flights']} flights assigned a pilot ({result['changed']} changed)"
+              + (", dry run - nothing saved." if args.dry_run else "."))
+        if result["uncovered"]:
+            print(f"Flights that could not be covered: {', '.join(str(flight_id) for flight_id in result['uncovered'])}")
+        if result["conflicts"]:
+            print(f"Flights kept as they were to avoid double-booking a pilot or moving them out of place: {', '.join(str(flight_id) for flight_id in result['conflicts'])}")
+    else:
+        print(json.dumps(result))
+    return 0
+
+def _batch_command(args, format_table):
+    return run_batch(sys.stdin, format_table, stop_on_error=args.stop_on_error, timing=args.timing)
+
+#----------------------------------------------------------------------------
+
+def build_parser():
+    '''
+    Argument parser for every command
+    '''
+    parser = argparse.ArgumentParser(prog="flyme", description="FlyMe Flight Management System. Run with no arguments for the menu")
+    commands = parser.add_subparsers(dest="command", required=True, metavar="command")
+
+    def add(name, handler, help_text, rows=True):
+        command = commands.add_parser(name, help=help_text, description=help_text)
+        command.set_defaults(handler=handler)
+        if rows:
+            command.add_argument("--format", choices=OUTPUT_FORMATS, default="table", help="output format (default: table)")
+            command.add_argument("-o", "--output", help="write csv/jsonl output to this file (.gz to compress) instead of stdout")
+        return command
+
+    flights = add("flights", _flights_command, "list flights, all of them or matching one filter")
+    flight_filter = flights.add_mutually_exclusive_group()
+    flight_filter.add_argument("--status", choices=VALID_STATUSES + ("all",), help="flights with this status")
+    flight_filter.add_argument("--date", type=_date, help="flights departing on this date (YYYY-MM-DD)")
+    flight_filter.add_argument("--arriving-on", type=_date, help="flights arriving on this date (YYYY-MM-DD)")
+    flight_filter.add_argument("--from", dest="from_id", type=int, help="flights leaving this destination ID")
+    flight_filter.add_argument("--to", dest="to_id", type=int, help="flights arriving at this destination ID")
+    flight_filter.add_argument("--from-country", help="flights leaving this country")
+    flight_filter.add_argument("--to-country", help="flights arriving in this country")
+    flights.add_argument("--as-of", type=_timestamp, help="status and departure times as they were at this time (UTC), from the status log")
+
+    add("pilots", _export_command("pilots"), "list all pilots")
+    pilot_flights = add("pilot-flights", _pilot_flights_command, "list the flights assigned to a pilot")
+    pilot_flights.add_argument("pilot_id", type=int)
+    pilot_flights.add_argument("--active", action="store_true", help="leave out flights that have arrived")
+    add("destinations", _export_command("destinations"), "list all destinations")
+    add("conflicts", _export_command("schedule-conflicts"), "list overlapping flights flown by the same pilot")
+
+    delays = add("delays", _delays_command, "list every delay, or a delay summary")
+    summary = delays.add_mutually_exclusive_group()
+    summary.add_argument("--avg", action="store_true", help="average delay across all flights")
+    summary.add_argument("--by-destination", action="store_true", help="number, average and variance of delays per departure location")
+    summary.add_argument("--totals", action="store_true", help="number of delays and total delay per flight")
+    delays.add_argument("--start", type=_date_or_time, help="only delays logged from this date or time (archived months are read only if needed)")
+    delays.add_argument("--end", type=_date_or_time, help="only delays logged up to this date (the whole day) or time")
+
+    status = commands.add_parser("status", help="change flight statuses", description="change flight statuses")
+    status_commands = status.add_subparsers(dest="status_command", required=True, metavar="action")
+    for name, handler, help_text in (
+        ("set", _status_set_command, "change the status of one flight"),
+        ("apply", _status_apply_command, "apply a file of status changes: CSV or JSONL with flight_ID, status and optional departure_date_time"),
+    ):
+        action = status_commands.add_parser(name, help=help_text, description=help_text)
+        action.set_defaults(handler=handler)
+        action.add_argument("--format", choices=OUTPUT_FORMATS, default="table", help="table only reports failures; csv/jsonl list every result")
+        action.add_argument("-o", "--output", help="write csv/jsonl results to this file instead of stdout")
+        if name == "set":
+            action.add_argument("flight_id", type=int)
+            action.add_argument("status", choices=VALID_STATUSES)
+            action.add_argument("--departure", type=_timestamp, help="new departure time, e.g. for a delay ('YYYY-MM-DD HH:MM:SS')")
+        else:
+            action.add_argument("path", help="file of status changes (.csv or .jsonl, optionally .gz)")
+
+    route = add("route", _route_command, "find the earliest arriving journey between two destinations")
+    route.add_argument("from_id", type=int)
+    route.add_argument("to_id", type=int)
+    route.add_argument("depart_after", type=_timestamp, help="'YYYY-MM-DD HH:MM:SS'")
+    route.add_argument("--max-connections", type=int, default=MAX_CONNECTIONS)
+
+    roster = add("roster", _roster_command, "assign pilots to the flights departing in a date range", rows=False)
+    roster.add_argument("start_date", type=_date, help="first departure date (YYYY-MM-DD)")
+    roster.add_argument("end_date", type=_date, help="departures up to, not including, this date (YYYY-MM-DD)")
+    roster.add_argument("--rest", type=int, default=MIN_REST_MINUTES, help="minimum minutes between arriving and departing again")
+    roster.add_argument("--dry-run", action="store_true", help="work out the roster without saving it")
+    roster.add_argument("--format", choices=("table", "jsonl"), default="table")
+
+    batch = add("batch", _batch_command, "run commands read from stdin, one per line (# starts a comment)", rows=False)
+    batch.add_argument("--stop-on-error", action="store_true", help="stop at the first command that fails")
+    batch.add_argument("--timing", action="store_true", help="report how long each command took on stderr")
+    return parser
+
+def run_command(argv, format_table):
+    '''
+    Run one command (a list of arguments, as on the command line) and return its exit code
+    '''
+    parser = build_parser()
+    try:
+        args = parser.parse_args(argv)
+    except SystemExit as e:
+        return e.code  #argparse has already printed the usage or help
+    try:
+        return args.handler(args, format_table)
+    except ValueError as e:  #A command that could not be carried out, e.g. no route found
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    except OSError as e:  #A file that could not be read or written, e.g. a missing input file
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    except sqlite3.Error as e:  #The database could not carry out the command, e.g. it is locked or damaged
+        print(f"Database error: {e}", file=sys.stderr)
+        return 1
+
+def run_batch(lines, format_table, stop_on_error=False, timing=False):
+    '''
+    Run each command in "lines" (an iterable of strings, e.g. sys.stdin) in turn, in this process
+    Returns 0 if every command succeeded, otherwise 1
+    '''
+    failures = 0
+    for line_number, line in enumerate(lines, start=1):
+        try:
+            argv = shlex.split(line, comments=True)
+        except ValueError as e:
+            print(f"line {line_number}: {e}", file=sys.stderr)
+            failures += 1
+            continue
+        if not argv:
+            continue
+        if argv[0] == "batch":
+            print(f"line {line_number}: batch cannot be run from a batch", file=sys.stderr)
+            failures += 1
+            continue
+
+        began = time.perf_counter()
+        code = run_command(argv, format_table)
+        sys.stdout.flush()
+        if timing:
+            print(f"line {line_number}: {argv[0]} took {(time.perf_counter() - began) * 1000:.1f}ms (exit {code})", file=sys.stderr)
+        if code:
+            failures += 1
+            if not timing:
+                print(f"line {line_number}: {argv[0]} failed (exit {code})", file=sys.stderr)
+            if stop_on_error:
+                break
+    return 1 if failures else 0
+
+def run_cli(argv, format_table):
+    '''
+    Entry point used by main.py when it is given arguments. Brings an older database up to date first, as the menu does
+    '''
+    migrate_arrival_time()
+    create_indexes()
+    create_destination_version()
+    return run_command(argv, format_table)
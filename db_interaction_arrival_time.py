@@ -0,0 +1,101 @@
+##File handles the stored arrival time of each flight (Flights.arrival_date_time = departure_date_time + flight_time minutes)
+#Storing it (rather than working it out with DATETIME(...) in every query) means it can be indexed, so schedule, "arriving on"
+#and overlap queries can use index range scans. Two triggers keep it up to date whenever a flight is added, delayed or re-timed,
+#so the query functions never need to set it themselves.
+#Databases created before the column existed are migrated by migrate_arrival_time(): the column and triggers are added,
+#then existing flights are filled in a chunk at a time, with a commit after each chunk, so the database is never locked for long
+#and an interrupted migration simply carries on where it stopped when run again
+
+import sys
+from db_interaction_connection import pooled_connection
+#Import function to borrow a connection to database from the connection pool
+
+BACKFILL_CHUNK = 5000  #Flights filled in per transaction during the migration
+
+#Triggers which keep arrival_date_time in step with departure_date_time and flight_time
+#The insert trigger only fires when no arrival time was given, so bulk loaders can supply it themselves
+TRIGGERS = {
+    "trg_flights_arrival_insert": """
+        CREATE TRIGGER IF NOT EXISTS trg_flights_arrival_insert
+        AFTER INSERT ON Flights
+        WHEN NEW.arrival_date_time IS NULL
+        BEGIN
+            UPDATE Flights SET arrival_date_time = DATETIME(NEW.departure_date_time, '+' || NEW.flight_time || ' minutes')
+            WHERE flight_ID = NEW.flight_ID;
+        END
+    """,
+    "trg_flights_arrival_update": """
+        CREATE TRIGGER IF NOT EXISTS trg_flights_arrival_update
+        AFTER UPDATE OF departure_date_time, flight_time ON Flights
+        WHEN NEW.departure_date_time IS NOT OLD.departure_date_time OR NEW.flight_time IS NOT OLD.flight_time
+        BEGIN
+            UPDATE Flights SET arrival_date_time = DATETIME(NEW.departure_date_time, '+' || NEW.flight_time || ' minutes')
+            WHERE flight_ID = NEW.flight_ID;
+        END
+    """,
+}
+
+def create_arrival_triggers(conn):
+    '''
+    Create the triggers which keep arrival_date_time up to date (safe to run repeatedly). Does not commit
+    '''
+    for sql in TRIGGERS.values():
+        conn.execute(sql)
+
+def has_arrival_column(conn):
+    return any(info[1].lower() == "arrival_date_time" for info in conn.execute("PRAGMA table_info(Flights)"))
+
+def backfill_arrival_times(conn, chunk_size=BACKFILL_CHUNK, progress=None):
+    '''
+    Fill in arrival_date_time for flights that do not have it yet, chunk_size flights (by flight_ID range) per transaction
+    "progress", if given, is called with (last flight_ID done, highest flight_ID) after each chunk. Returns the number of flights filled in
+    '''
+    highest = conn.execute("SELECT MAX(flight_ID) FROM Flights").fetchone()[0] or 0
+    last_id = 0
+    filled = 0
+    while last_id < highest:
+        cur = conn.execute("""
+            UPDATE Flights SET arrival_date_time = DATETIME(departure_date_time, '+' || flight_time || ' minutes')
+            WHERE flight_ID > ? AND flight_ID <= ? AND arrival_date_time IS NULL
+        """, (last_id, last_id + chunk_size))
+        conn.commit()
+        filled += cur.rowcount
+        last_id += chunk_size
+        if progress:
+            progress(min(last_id, highest), highest)
+    return filled
+
+def migrate_arrival_time(conn=None, chunk_size=BACKFILL_CHUNK, progress=None):
+    '''
+    Add arrival_date_time (and its triggers) to Flights if missing, then fill it in for existing flights. Safe to run repeatedly
+    Uses the given connection, or borrows one from the pool. Returns the number of flights filled in
+    The index on the column is created by create_indexes() (see db_interaction_indexes.py)
+    '''
+    if conn is None:
+        with pooled_connection() as conn:
+            return migrate_arrival_time(conn, chunk_size, progress)
+
+    added = not has_arrival_column(conn)
+    if added:
+        conn.execute("ALTER TABLE Flights ADD COLUMN arrival_date_time DATETIME")
+    #Triggers go in before the backfill, so flights changed while it runs are kept correct too
+    create_arrival_triggers(conn)
+    conn.commit()
+
+    if not added and conn.execute("SELECT 1 FROM Flights WHERE arrival_date_time IS NULL LIMIT 1").fetchone() is None:
+        return 0  #Already migrated
+    return backfill_arrival_times(conn, chunk_size, progress)
+
+#Entry point: migrate an existing database and create the arrival time indexes if this script is executed directly
+if __name__ == "__main__":
+    from db_interaction_indexes import create_indexes
+
+    def show_progress(done, highest):
+        print(f"\rFilled in arrival times up to flight ID {done:,} of {highest:,}", end="", flush=True)
+
+    chunk_size = int(sys.argv[1]) if len(sys.argv) > 1 else BACKFILL_CHUNK
+    filled = migrate_arrival_time(chunk_size=chunk_size, progress=show_progress)
+    if filled:
+        print()
+    create_indexes()
+    print(f"Arrival time column ready ({filled:,} flights filled in).")
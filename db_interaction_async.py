@@ -0,0 +1,317 @@
+##File handles the asyncio API: the flight, pilot, destination and delay queries as coroutines, for serving many dashboards at once
+#SQLite calls block, so each call runs on a worker thread and the event loop carries on with other requests in the meantime.
+#Work goes through two lanes, each a small thread pool:
+#   readers - READER_THREADS threads for lookups and reports. With WAL (the "oltp" profile) reads run side by side
+#   writer  - status changes and pilot assignments, handed to the write queue (db_interaction_write_queue.py), whose single writer
+#             thread commits whatever is queued together in one transaction. SQLite only allows one writer at a time, so writes from
+#             this process queue there instead of competing for the database lock. Bulk feeds (apply_status_events) are read
+#             on a single thread of their own, and each chunk of events goes through the write queue as one write
+#Each lane admits at most MAX_PENDING calls per event loop (queued or running); further callers wait their turn, so a burst of
+#requests cannot pile up unbounded work.
+#Streams (stream_rows) each get a thread of their own for their whole life, as a generator may keep a pooled connection open between
+#rows and SQLite connections can only be used by the thread that made them. At most MAX_STREAMS run at once per event loop
+#Every call takes a timeout (seconds, None for no limit) and can be cancelled like any other coroutine. A call that is still
+#queued is dropped. A read that is already running has its SQL statement interrupted (sqlite3 interrupt), freeing the thread.
+#A write that has already started is left to finish, so the database is never left half-changed: the caller stops waiting,
+#but the change may still be saved
+#
+#Only functions that return data (and never print or prompt) are exposed here, e.g.:
+#   rows = await get_flights_by_status("Delayed", timeout=2.0)
+#   async for chunk in stream_rows(iter_flights_by_status, "all"): ...
+#   flight_id, success, message = await set_flight_status(12, "Delayed", "2025-06-01 10:30:00")
+
+import asyncio
+import functools
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from itertools import islice
+
+from db_interaction_connection import interrupt_thread_queries
+#Import function to abort the SQL a worker thread is running when its call is cancelled
+import db_interaction_flight_queries as flight_queries
+import db_interaction_pilot_queries as pilot_queries
+import db_interaction_destination_queries as destination_queries
+import db_interaction_destination_cache as destination_cache
+import db_interaction_pilot_schedule as pilot_schedule
+import db_interaction_log_out as log_out
+import db_interaction_delay_stats as delay_stats
+import db_interaction_routes as routes
+import db_interaction_history as history
+
+READER_THREADS = 4  #Threads in the readers lane (keep below FLYME_POOL_SIZE, as each borrows a pooled connection)
+MAX_PENDING = 256  #Calls admitted to a lane per event loop before callers have to wait
+DEFAULT_TIMEOUT = 30.0  #Seconds, used when a call does not give its own timeout
+STREAM_CHUNK = flight_queries.PAGE_SIZE  #Rows per chunk from stream_rows
+MAX_STREAMS = 8  #Streams running at once per event loop (each has its own thread, and may hold a pooled connection throughout)
+
+class _Job:
+    '''
+    One call running on a lane, so it can be interrupted while it runs
+    '''
+    __slots__ = ("function", "args", "kwargs", "thread_id", "lock")
+
+    def __init__(self, function, args, kwargs):
+        self.function = function
+        self.args = args
+        self.kwargs = kwargs
+        self.thread_id = None  #Thread running the call, None when not running
+        self.lock = threading.Lock()
+
+    def run(self):
+        with self.lock:
+            self.thread_id = threading.get_ident()
+        try:
+            return self.function(*self.args, **self.kwargs)
+        finally:
+            with self.lock:
+                self.thread_id = None
+
+    def interrupt(self):
+        #Interrupts the call's SQL if it is running right now (holding the lock, so it cannot be a later call on the same thread)
+        with self.lock:
+            if self.thread_id is None:
+                return False
+            return interrupt_thread_queries(self.thread_id) > 0
+
+class _Lane:
+    '''
+    A thread pool plus a per event loop limit on calls admitted
+    '''
+    def __init__(self, name, threads, interruptible, max_pending=MAX_PENDING):
+        self.name = name
+        self.threads = threads
+        self.interruptible = interruptible  #Whether running calls may be interrupted when cancelled
+        self.max_pending = max_pending
+        self._executor = None
+        self._lock = threading.Lock()
+        self._limits = weakref.WeakKeyDictionary()  #Event loop -> asyncio.Semaphore
+        self.stats = {"submitted": 0, "completed": 0, "failed": 0, "cancelled": 0, "timed_out": 0, "interrupted": 0}
+
+    def executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix=f"flyme-{self.name}")
+            return self._executor
+
+    def _limit(self):
+        loop = asyncio.get_running_loop()
+        limit = self._limits.get(loop)
+        if limit is None:
+            limit = self._limits[loop] = asyncio.Semaphore(self.max_pending)
+        return limit
+
+    async def run(self, function, args=(), kwargs=None, timeout=DEFAULT_TIMEOUT):
+        async with self._limit():
+            return await self.run_on(self.executor(), function, args, kwargs, timeout)
+
+    async def run_on(self, executor, function, args=(), kwargs=None, timeout=DEFAULT_TIMEOUT):
+        #Runs the call on the given executor instead of the lane's threads (the caller has already been admitted)
+        job = _Job(function, args, kwargs or {})
+        future = asyncio.get_running_loop().run_in_executor(executor, job.run)
+        return await self._wait(future, timeout, job)
+
+    @asynccontextmanager
+    async def pinned(self):
+        #Admits the caller, then gives it an executor with a single thread of its own until the block ends
+        async with self._limit():
+            executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"flyme-{self.name}")
+            try:
+                yield executor
+            finally:
+                executor.shutdown(wait=False)
+
+    async def run_queued(self, submit, args=(), timeout=DEFAULT_TIMEOUT):
+        #For work handed to the write queue: submit(*args) returns a concurrent.futures.Future, and the lane only limits and counts it
+        async with self._limit():
+            return await self._wait(asyncio.wrap_future(submit(*args)), timeout, None)
+
+    async def _wait(self, future, timeout, job):
+        self.stats["submitted"] += 1
+        try:
+            result = await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            self.stats["timed_out"] += 1
+            self._stop(job)
+            raise
+        except asyncio.CancelledError:
+            self.stats["cancelled"] += 1
+            self._stop(job)
+            raise
+        except Exception:
+            self.stats["failed"] += 1
+            raise
+        self.stats["completed"] += 1
+        return result
+
+    def _stop(self, job):
+        #wait_for has already cancelled the call if it was still queued. If it is running, a read is interrupted
+        if job is not None and self.interruptible and job.interrupt():
+            self.stats["interrupted"] += 1
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait, cancel_futures=True)
+
+_readers = _Lane("reader", READER_THREADS, interruptible=True)
+_writer = _Lane("writer", 1, interruptible=False)
+_streams = _Lane("stream", MAX_STREAMS, interruptible=True, max_pending=MAX_STREAMS)
+
+async def run_read(function, *args, timeout=DEFAULT_TIMEOUT, **kwargs):
+    '''
+    Run any function that only reads the database on the readers lane, and return its result
+    '''
+    return await _readers.run(function, args, kwargs, timeout)
+
+async def run_write(function, *args, timeout=DEFAULT_TIMEOUT, **kwargs):
+    '''
+    Run any function that changes the database on the writer lane, and return its result
+    '''
+    return await _writer.run(function, args, kwargs, timeout)
+
+def _reader(function):
+    #Async version of a read-only query function, with a "timeout" keyword argument
+    @functools.wraps(function)
+    async def call(*args, timeout=DEFAULT_TIMEOUT, **kwargs):
+        return await _readers.run(function, args, kwargs, timeout)
+    return call
+
+def _writer_call(function):
+    #Async version of a function that changes the database, with a "timeout" keyword argument
+    @functools.wraps(function)
+    async def call(*args, timeout=DEFAULT_TIMEOUT, **kwargs):
+        return await _writer.run(function, args, kwargs, timeout)
+    return call
+
+#----------------------------------------------------------------------------
+#Reads (return lists of rows, or dicts for summaries)
+
+get_flights_by_status = _reader(flight_queries.get_flights_by_status)
+get_flights_by_date = _reader(flight_queries.get_flights_by_date)
+get_flights_arriving_on = _reader(flight_queries.get_flights_arriving_on)
+get_flights_by_destination_id = _reader(flight_queries.get_flights_by_destination_id)
+get_flights_by_arrival_id = _reader(flight_queries.get_flights_by_arrival_id)
+get_flights_by_destination_country = _reader(flight_queries.get_flights_by_destination_country)
+get_flights_by_arrival_country = _reader(flight_queries.get_flights_by_arrival_country)
+get_flights_as_of = _reader(history.get_flights_as_of)
+
+get_all_pilots = _reader(pilot_queries.get_all_pilots)
+get_pilot_count = _reader(pilot_queries.get_pilot_count)
+get_flights_for_pilot = _reader(pilot_queries.get_flights_for_pilot)
+get_schedule_conflicts = _reader(pilot_schedule.get_schedule_conflicts)
+
+get_all_destinations = _reader(destination_cache.get_all_destinations)
+get_destinations_by_cost = _reader(destination_queries.get_destinations_by_cost)
+get_unassigned_destinations = _reader(destination_queries.get_unassigned_destinations)
+get_flights_for_destination = _reader(destination_queries.get_flights_for_destination)
+find_earliest_arrival = _reader(routes.find_earliest_arrival)
+
+get_delay_events = _reader(log_out.get_delay_events)
+get_total_delay_by_flight = _reader(log_out.get_total_delay_by_flight)
+get_delay_stats = _reader(delay_stats.get_delay_stats)
+get_delay_stats_by_destination = _reader(delay_stats.get_delay_stats_by_destination)
+
+async def stream_rows(iterator_function, *args, chunk_size=STREAM_CHUNK, timeout=DEFAULT_TIMEOUT):
+    '''
+    Async generator over a streaming lookup (e.g. flight_queries.iter_flights_by_status, log_out.iter_delay_events), yielding lists
+    of up to chunk_size rows, so large results are never held in memory whole.
+    The whole stream runs on one thread of its own, so generators which keep a pooled connection open between rows work too.
+    timeout applies to each chunk
+    '''
+    async with _streams.pinned() as executor:
+        rows = await _streams.run_on(executor, lambda: iter(iterator_function(*args)), timeout=timeout)
+        try:
+            while True:
+                chunk = await _streams.run_on(executor, lambda: list(islice(rows, chunk_size)), timeout=timeout)
+                if not chunk:
+                    return
+                yield chunk
+        finally:
+            close = getattr(rows, "close", None)
+            if close is not None:
+                #Generator clean up (returning its connection) runs on the stream's own thread, after any chunk still being read
+                await asyncio.wrap_future(executor.submit(close))
+
+#----------------------------------------------------------------------------
+#Writes (through the write queue; bulk feeds are split into chunks on the writer lane's own thread first)
+
+apply_status_events = _writer_call(flight_queries.apply_status_events)
+
+async def assign_pilot(flight_id, new_pilot_id, timeout=DEFAULT_TIMEOUT):
+    '''
+    Assign a pilot to a flight, unless the pilot is already flying in an overlapping window. Returns (success, message)
+    '''
+    return await _writer.run_queued(pilot_queries.submit_pilot_assignment, (flight_id, new_pilot_id), timeout)
+
+async def set_flight_status(flight_id, new_status, new_departure=None, timeout=DEFAULT_TIMEOUT):
+    '''
+    Change one flight's status (and departure time, e.g. when delayed). Returns (flight_ID, success, message)
+    '''
+    try:
+        await _writer.run_queued(flight_queries.submit_status_change, (flight_id, new_status, new_departure), timeout)
+    except ValueError as e:
+        return flight_id, False, str(e)
+    return flight_id, True, f"Status updated to '{new_status}'"
+
+async def cancel_flight(flight_id, timeout=DEFAULT_TIMEOUT):
+    '''
+    Cancel a flight. Returns (flight_ID, success, message)
+    '''
+    return await set_flight_status(flight_id, "Cancelled", timeout=timeout)
+
+#----------------------------------------------------------------------------
+
+def async_stats():
+    '''
+    Returns call counts for each lane (streams count each chunk): submitted, completed, failed, cancelled, timed_out and interrupted
+    '''
+    return {"readers": dict(_readers.stats), "writer": dict(_writer.stats), "streams": dict(_streams.stats)}
+
+def shutdown_async(wait=True):
+    '''
+    Stop the lanes' threads (calls still queued are dropped). They start again if another call is made
+    '''
+    _readers.shutdown(wait)
+    _writer.shutdown(wait)
+
+async def _check_streams(sources, reads=200):
+    #Streams each source (small chunks, giving way between them) while other calls keep the readers busy. Returns {name: rows}
+    async def stream(source):
+        rows = []
+        async for chunk in stream_rows(source, chunk_size=50):
+            rows.extend(chunk)
+            await asyncio.sleep(0)
+        return rows
+
+    async def read():
+        for _ in range(reads):
+            await get_pilot_count()
+
+    names = list(sources)
+    results = await asyncio.gather(*(stream(sources[name]) for name in names), read(), read(), read())
+    return dict(zip(names, results))
+
+#Entry point: check that streams work alongside other reads if this script is executed directly
+if __name__ == "__main__":
+    import sys
+    from export_data import EXPORTS
+
+    #Generators which keep one pooled connection open while they are read, and one which borrows a connection per page
+    sources = {
+        "delay-events": log_out.iter_delay_events,
+        "status-log": lambda: EXPORTS["status-log"][0]()[1],
+        "flights": lambda: flight_queries.iter_flights_by_status("all"),
+    }
+    streamed = asyncio.run(_check_streams(sources))
+    failed = False
+    for name, source in sources.items():
+        expected = [tuple(row) for row in source()]
+        matches = [tuple(row) for row in streamed[name]] == expected
+        failed = failed or not matches
+        print(f"{name}: {len(streamed[name]):,} rows streamed, {'same as' if matches else 'DIFFERENT from'} reading directly")
+    print(async_stats())
+    shutdown_async()
+    sys.exit(1 if failed else 0)
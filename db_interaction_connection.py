@@ -1,5 +1,236 @@
+##File handles all connections to the database
+#Connections are kept in a small bounded pool rather than opened and closed on every query, so the SQLite file, schema and
+#prepared statement cache stay "warm" between calls. Idle connections are kept in one list for the whole pool, so a connection
+#returned by a thread that has since exited (an executor worker, an HTTP lane) is re-used by other threads rather than left open.
+#A connection is only ever used by one thread at a time (the one that borrowed it), so pooled connections are opened with
+#check_same_thread off. A semaphore limits how many can be borrowed at once, and at most POOL_SIZE are kept idle
+#Every new connection also has a named "tuning profile" of PRAGMA settings applied (see TUNING_PROFILES below)
+
+import os
 import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+import db_interaction_instrumentation
+#Imported as a module (not "from ... import") as db_interaction_instrumentation also imports this file
+
+#Location of database. Can be simply editted here (or set by FLYME_DB_PATH) if database location changes
+DB_PATH = os.environ.get("FLYME_DB_PATH", "flight_management.db")
+
+POOL_SIZE = int(os.environ.get("FLYME_POOL_SIZE", "8"))  #Maximum number of connections borrowed at the same time
+STATEMENT_CACHE_SIZE = 256  #Prepared statements kept per connection (sqlite3 default is 128)
+BORROW_TIMEOUT = 30.0  #Seconds to wait for a free connection before giving up
+
+_pool_lock = threading.Lock()
+_pool_slots = threading.BoundedSemaphore(POOL_SIZE)
+_idle = []  #Idle connections as (generation, connection) pairs, most recently returned last. Guarded by _pool_lock
+_pool_stats = {
+    "borrows": 0,
+    "hits": 0,
+    "misses": 0,
+    "in_use": 0,
+    "open": 0,
+    "closed": 0,
+    "wait_total_s": 0.0,
+    "wait_max_s": 0.0,
+}
+_pool_generation = 0  #Bumped by reset_pool so connections made before a reset are closed rather than re-used
+_borrowed = {}  #Thread ID -> connections that thread has borrowed right now (so their queries can be interrupted)
+
+#Storage tuning profiles, applied as PRAGMAs to every connection when it is opened
+#"oltp" suits the interactive desk: WAL lets readers carry on during a status update, NORMAL sync is still safe with WAL,
+#and busy_timeout makes concurrent writers wait for the lock instead of failing with "database is locked"
+#"bulk-load" suits population/ingest: no rollback journal and no fsyncs, so a failed load cannot be rolled back and the file
+#should be rebuilt instead. Only use it on a database nobody else is using
+#"default" leaves SQLite's own settings untouched
+TUNING_PROFILES = {
+    "default": {},
+    "oltp": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "cache_size": -65536,  #Negative values are KiB, so 64MB of page cache
+        "mmap_size": 268435456,  #256MB memory mapped reads
+        "temp_store": "MEMORY",
+        "busy_timeout": 5000,  #Milliseconds
+    },
+    "bulk-load": {
+        "journal_mode": "OFF",
+        "synchronous": "OFF",
+        "cache_size": -262144,  #256MB of page cache
+        "temp_store": "MEMORY",
+        "busy_timeout": 30000,
+    },
+}
+
+#Profile used when none is asked for. Can be set by FLYME_DB_PROFILE
+DEFAULT_PROFILE = os.environ.get("FLYME_DB_PROFILE", "oltp")
+
+def _resolve_profile(profile):
+    name = profile or DEFAULT_PROFILE
+    if name not in TUNING_PROFILES:
+        raise ValueError(f"Unknown tuning profile '{name}'. Choose from: {', '.join(TUNING_PROFILES)}")
+    return name
+
+def apply_tuning_profile(conn, profile=None):
+    '''
+    Apply the PRAGMA settings of a tuning profile to an open connection, returning the profile name used
+    '''
+    name = _resolve_profile(profile)
+    for pragma, value in TUNING_PROFILES[name].items():
+        conn.execute(f"PRAGMA {pragma} = {value}").fetchall()  #fetchall as journal_mode returns a row
+    return name
+
+#Function to open a brand new connection to the database, with a tuning profile applied. Function called across code, and used by the pool below
+#The connection is instrumented (statement timings, slow query log) only when instrumentation is switched on, see db_interaction_instrumentation.py
+#check_same_thread=False lets the connection be used by another thread than the one that opened it (one thread at a time)
+def get_connection(profile=None, check_same_thread=True):
+    conn = sqlite3.connect(DB_PATH, cached_statements=STATEMENT_CACHE_SIZE, check_same_thread=check_same_thread,
+                           factory=db_interaction_instrumentation.connection_factory())
+    try:
+        apply_tuning_profile(conn, profile)
+    except Exception:
+        conn.close()
+        raise
+    return conn
+
+def set_tuning_profile(profile):
+    '''
+    Change the profile used for new connections. Pooled connections are discarded so they pick up the new settings
+    '''
+    global DEFAULT_PROFILE
+    DEFAULT_PROFILE = _resolve_profile(profile)
+    reset_pool()
+
+def describe_tuning(conn=None):
+    '''
+    Diagnostic: report the active profile and the PRAGMA values the database is actually running with
+    '''
+    pragmas = ["journal_mode", "synchronous", "cache_size", "mmap_size", "temp_store", "busy_timeout", "page_size"]
+    own_conn = conn is None
+    if own_conn:
+        conn = get_connection()
+    try:
+        settings = {pragma: conn.execute(f"PRAGMA {pragma}").fetchone()[0] for pragma in pragmas}
+    finally:
+        if own_conn:
+            conn.close()
+    return {"profile": DEFAULT_PROFILE, "database": DB_PATH, "settings": settings}
+
+def _close_connection(conn):
+    try:
+        conn.close()
+    finally:
+        with _pool_lock:
+            _pool_stats["open"] -= 1
+            _pool_stats["closed"] += 1
+
+@contextmanager
+def pooled_connection():
+    '''
+    Borrow a connection from the pool for the length of a "with" block, and return it afterwards
+    Uncommitted work is rolled back when the block ends, so the next borrower always starts clean
+    '''
+    slots = _pool_slots  #Kept so the slot goes back to the same semaphore even if reset_pool resizes the pool
+    start = time.perf_counter()
+    if not slots.acquire(timeout=BORROW_TIMEOUT):
+        raise sqlite3.OperationalError(f"connection pool exhausted: no connection free after {BORROW_TIMEOUT}s")
+    waited = time.perf_counter() - start
+
+    try:
+        conn = None
+        with _pool_lock:
+            generation = _pool_generation
+            if _idle:
+                conn = _idle.pop()[1]  #reset_pool empties the list, so every idle connection is from this generation
+            _pool_stats["borrows"] += 1
+            _pool_stats["in_use"] += 1
+            _pool_stats["wait_total_s"] += waited
+            _pool_stats["wait_max_s"] = max(_pool_stats["wait_max_s"], waited)
+            if conn is not None:
+                _pool_stats["hits"] += 1
+            else:
+                _pool_stats["misses"] += 1
+
+        if conn is None:
+            conn = get_connection(check_same_thread=False)
+            with _pool_lock:
+                _pool_stats["open"] += 1
+    except BaseException:
+        slots.release()
+        raise
+
+    thread_id = threading.get_ident()
+    with _pool_lock:
+        _borrowed.setdefault(thread_id, []).append(conn)
+    try:
+        yield conn
+    finally:
+        with _pool_lock:
+            _borrowed[thread_id].remove(conn)
+            if not _borrowed[thread_id]:
+                del _borrowed[thread_id]
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+            with _pool_lock:
+                keep = generation == _pool_generation and len(_idle) < POOL_SIZE
+                if keep:
+                    _idle.append((generation, conn))
+            if not keep:
+                _close_connection(conn)
+        except sqlite3.Error:
+            _close_connection(conn)  #Connection is broken, do not hand it out again
+        finally:
+            with _pool_lock:
+                _pool_stats["in_use"] -= 1
+            slots.release()
+
+def interrupt_thread_queries(thread_id):
+    '''
+    Abort the statements running on every connection the given thread has borrowed (sqlite3 interrupt, safe from any thread)
+    The interrupted statement raises sqlite3.OperationalError("interrupted") in that thread. Returns the number of connections interrupted
+    '''
+    with _pool_lock:
+        connections = list(_borrowed.get(thread_id, ()))
+    for conn in connections:
+        conn.interrupt()
+    return len(connections)
+
+def pool_stats():
+    '''
+    Return a snapshot of pool statistics (borrows, hits, misses, connections open/in use, borrow wait times)
+    '''
+    with _pool_lock:
+        stats = dict(_pool_stats)
+    stats["size"] = POOL_SIZE
+    stats["hit_rate"] = stats["hits"] / stats["borrows"] if stats["borrows"] else 0.0
+    stats["wait_avg_s"] = stats["wait_total_s"] / stats["borrows"] if stats["borrows"] else 0.0
+    return stats
+
+def reset_pool(db_path=None, size=None):
+    '''
+    Discard pooled connections and optionally point the pool at a different database file or size
+    Every idle connection is closed now, those borrowed at the time are closed when they are returned
+    '''
+    global DB_PATH, POOL_SIZE, _pool_slots, _pool_generation
+    with _pool_lock:
+        _pool_generation += 1
+        if db_path is not None:
+            DB_PATH = db_path
+        if size is not None and size != POOL_SIZE:
+            POOL_SIZE = size
+            _pool_slots = threading.BoundedSemaphore(size)
+        idle = list(_idle)
+        _idle.clear()
+
+    for _, conn in idle:
+        _close_connection(conn)
 
-#Function to connect to database. Function called across code, and can be simply editted here if database location changes
-def get_connection():
-    return sqlite3.connect("flight_management.db")
\ No newline at end of file
+#Entry point: print the tuning diagnostic if this script is executed directly
+if __name__ == "__main__":
+    report = describe_tuning()
+    print(f"Database: {report['database']}")
+    print(f"Tuning profile: {report['profile']}")
+    for pragma, value in report["settings"].items():
+        print(f"  {pragma}: {value}")
@@ -0,0 +1,232 @@
+##File handles the FlightDelayStats summary table, so delay averages do not need a scan of the whole FlightStatusLog
+#The table holds a count, sum and sum of squares of delay minutes, for all flights (destination_ID 0) and per departure destination.
+#It is kept up to date as "Delayed" entries are logged (see db_interaction_log.py), making average, variance and
+#per destination delay simple lookups. rebuild_delay_stats recomputes it from the raw log and reports any drift
+
+import sys
+from db_interaction_connection import pooled_connection
+#Import function to borrow a connection to database from the connection pool
+from db_interaction_log_archive import log_partitions
+#Import function to read the status log across FlightStatusLog and the archive files
+
+ALL_DESTINATIONS = 0  #destination_ID used for the row covering all flights (real IDs start at 1)
+DRIFT_TOLERANCE = 1e-6  #Allowed relative difference between stored and recomputed sums (floating point rounding)
+
+#SQL for every delay interval: each "Delayed" log entry compared with the entry logged just before it for the same flight.
+#One ordered pass per flight (LAG window function), ordered by log_ID, which is assigned in the order entries are written
+#"{log}" is replaced with the log to read: FlightStatusLog, or the log across the archive files (see db_interaction_log_archive.py)
+DELAY_INTERVALS_SQL = """
+    WITH ordered_log AS (
+        SELECT
+            log_ID,
+            flight_ID,
+            status,
+            departure_date_time,
+            log_date_time,
+            LAG(departure_date_time) OVER (PARTITION BY flight_ID ORDER BY log_ID) AS previous_departure
+        FROM {log}
+    )
+    SELECT
+        log_ID,
+        flight_ID,
+        log_date_time,
+        previous_departure,
+        departure_date_time AS delayed_departure,
+        (JULIANDAY(departure_date_time) - JULIANDAY(previous_departure)) * 1440 AS delay_minutes
+    FROM ordered_log
+    WHERE status = 'Delayed' AND previous_departure IS NOT NULL
+"""
+
+CREATE_TABLE_SQL = """
+    CREATE TABLE IF NOT EXISTS FlightDelayStats (
+        destination_ID INTEGER PRIMARY KEY,
+        delay_count INTEGER NOT NULL DEFAULT 0,
+        delay_minutes_sum REAL NOT NULL DEFAULT 0,
+        delay_minutes_sum_squares REAL NOT NULL DEFAULT 0
+        );
+"""
+
+#Recomputed summary from the raw log: overall row plus one row per departure destination
+RECOMPUTE_SQL = f"""
+    WITH intervals AS ({DELAY_INTERVALS_SQL})
+    SELECT {ALL_DESTINATIONS}, COUNT(*), COALESCE(SUM(delay_minutes), 0), COALESCE(SUM(delay_minutes * delay_minutes), 0)
+    FROM intervals
+    UNION ALL
+    SELECT f.destination_ID, COUNT(*), SUM(i.delay_minutes), SUM(i.delay_minutes * i.delay_minutes)
+    FROM intervals i
+    JOIN Flights f ON i.flight_ID = f.flight_ID
+    GROUP BY f.destination_ID
+"""
+
+UPSERT_SQL = """
+    INSERT INTO FlightDelayStats (destination_ID, delay_count, delay_minutes_sum, delay_minutes_sum_squares)
+    VALUES (?, ?, ?, ?)
+    ON CONFLICT(destination_ID) DO UPDATE SET
+        delay_count = delay_count + excluded.delay_count,
+        delay_minutes_sum = delay_minutes_sum + excluded.delay_minutes_sum,
+        delay_minutes_sum_squares = delay_minutes_sum_squares + excluded.delay_minutes_sum_squares
+"""
+
+def ensure_delay_stats_table(cur):
+    '''
+    Make sure FlightDelayStats exists. If it has to be created (e.g. an older database), it is filled from the raw log straight away
+    '''
+    cur.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'FlightDelayStats'")
+    if cur.fetchone() is None:
+        cur.execute(CREATE_TABLE_SQL)
+        #Only databases made before the summary existed get here, and those have nothing archived yet
+        cur.executemany(UPSERT_SQL, cur.execute(RECOMPUTE_SQL.format(log="FlightStatusLog")).fetchall())
+
+def record_delays(cur, entries):
+    '''
+    Add the delays from log entries that are ABOUT to be written to FlightStatusLog (call before inserting them)
+    "entries" is a list of (flight_id, status, departure_datetime) tuples, in the order they will be logged
+    Runs on the caller's cursor, so the summary is committed (or rolled back) with the log entries themselves
+    '''
+    if not any(entry[1] == "Delayed" for entry in entries):
+        return
+    ensure_delay_stats_table(cur)
+
+    last_departure = {}  #Departure time most recently logged for each flight, including earlier entries in this batch
+    totals = {}  #destination_ID -> [count, sum, sum of squares]
+    for flight_id, status, departure_datetime in entries:
+        if status == "Delayed":
+            if flight_id in last_departure:
+                previous = last_departure[flight_id]
+            else:
+                cur.execute("SELECT departure_date_time FROM FlightStatusLog WHERE flight_ID = ? ORDER BY log_ID DESC LIMIT 1", (flight_id,))
+                row = cur.fetchone()
+                previous = row[0] if row else None
+
+            if previous is not None:
+                cur.execute("""
+                    SELECT (JULIANDAY(?) - JULIANDAY(?)) * 1440, destination_ID
+                    FROM Flights WHERE flight_ID = ?
+                """, (departure_datetime, previous, flight_id))
+                row = cur.fetchone()
+                if row and row[0] is not None:
+                    delay, destination_id = row
+                    for key in (ALL_DESTINATIONS, destination_id):
+                        total = totals.setdefault(key, [0, 0.0, 0.0])
+                        total[0] += 1
+                        total[1] += delay
+                        total[2] += delay * delay
+        last_departure[flight_id] = departure_datetime
+
+    cur.executemany(UPSERT_SQL, [(key, *total) for key, total in totals.items()])
+
+def _summarise(row):
+    #Turns a (count, sum, sum of squares) row into average and (population) variance
+    count, total, total_squares = row
+    if not count:
+        return None
+    average = total / count
+    return {
+        "count": count,
+        "total_minutes": total,
+        "average_minutes": average,
+        "variance": max(total_squares / count - average * average, 0.0),
+    }
+
+def get_delay_stats(destination_id=None):
+    '''
+    Returns {"count", "total_minutes", "average_minutes", "variance"} for all flights, or for flights departing from one destination
+    Returns None if there are no delays recorded
+    '''
+    key = ALL_DESTINATIONS if destination_id is None else int(destination_id)
+    with pooled_connection() as conn:
+        cur = conn.cursor()
+        ensure_delay_stats_table(cur)
+        cur.execute("""
+            SELECT delay_count, delay_minutes_sum, delay_minutes_sum_squares
+            FROM FlightDelayStats WHERE destination_ID = ?
+        """, (key,))
+        row = cur.fetchone()
+        conn.commit()  #Keeps the table if ensure_delay_stats_table had to create it
+    return _summarise(row) if row else None
+
+def get_delay_stats_by_destination():
+    '''
+    Returns rows of (destination_ID, country, name, number of delays, average delay minutes, variance) for every departure destination with delays
+    '''
+    with pooled_connection() as conn:
+        cur = conn.cursor()
+        ensure_delay_stats_table(cur)
+        cur.execute("""
+            SELECT s.destination_ID, d.country, d.name, s.delay_count, s.delay_minutes_sum, s.delay_minutes_sum_squares
+            FROM FlightDelayStats s
+            LEFT JOIN Destinations d ON s.destination_ID = d.destination_ID
+            WHERE s.destination_ID != ? AND s.delay_count > 0
+            ORDER BY s.destination_ID
+        """, (ALL_DESTINATIONS,))
+        rows = cur.fetchall()
+        conn.commit()
+
+    results = []
+    for destination_id, country, name, *totals in rows:
+        summary = _summarise(totals)
+        results.append((destination_id, country, name, summary["count"], round(summary["average_minutes"], 1), round(summary["variance"], 1)))
+    return results
+
+def rebuild_delay_stats(check_only=False):
+    '''
+    Recompute the summary from the raw FlightStatusLog (and its archive files) and compare it with what is stored
+    Returns a list of drift messages (empty if the stored summary was correct). Unless check_only, the stored summary is then replaced
+    A maintenance job, so it takes the write lock itself rather than going through the write queue (see db_interaction_write_queue.py)
+    '''
+    with pooled_connection() as conn, log_partitions(conn, begin="BEGIN IMMEDIATE") as log:
+        cur = conn.cursor()
+        cur.execute(CREATE_TABLE_SQL)
+        expected = {row[0]: row[1:] for row in cur.execute(RECOMPUTE_SQL.format(log=log)).fetchall()}
+        stored = {row[0]: row[1:] for row in cur.execute("""
+            SELECT destination_ID, delay_count, delay_minutes_sum, delay_minutes_sum_squares FROM FlightDelayStats
+        """).fetchall()}
+
+        drift = []
+        for key in sorted(set(expected) | set(stored)):
+            want = expected.get(key, (0, 0.0, 0.0))
+            have = stored.get(key, (0, 0.0, 0.0))
+            label = "all flights" if key == ALL_DESTINATIONS else f"destination {key}"
+            if want[0] != have[0]:
+                drift.append(f"{label}: count stored {have[0]}, log has {want[0]}")
+            for field, w, h in (("sum", want[1], have[1]), ("sum of squares", want[2], have[2])):
+                if abs(w - h) > DRIFT_TOLERANCE * max(1.0, abs(w)):
+                    drift.append(f"{label}: {field} stored {h}, log gives {w}")
+
+        if not check_only:
+            cur.execute("DELETE FROM FlightDelayStats")
+            cur.executemany("""
+                INSERT INTO FlightDelayStats (destination_ID, delay_count, delay_minutes_sum, delay_minutes_sum_squares)
+                VALUES (?, ?, ?, ?)
+            """, [(key, *values) for key, values in expected.items()])
+        conn.commit()
+
+    return drift
+
+def view_delay_stats_by_destination(format_table):
+    """
+    Displays number of delays, average delay and variance for flights departing from each destination.
+    """
+    try:
+        rows = get_delay_stats_by_destination()
+
+        headers = ["Destination ID", "Country", "Name", "Delays", "Average Delay (min)", "Variance"]
+        if format_table:
+            format_table(rows, headers)
+
+    except Exception as e:
+        print(f"Failed to retrieve delay statistics: {e}")
+
+#Entry point: rebuild the summary from the raw log if this script is executed directly ("--check" only reports drift)
+if __name__ == "__main__":
+    check_only = "--check" in sys.argv[1:]
+    drift = rebuild_delay_stats(check_only=check_only)
+    for message in drift:
+        print(f"Drift - {message}")
+
+    if not drift:
+        print("FlightDelayStats matches FlightStatusLog.")
+    elif check_only:
+        sys.exit(1)
+    else:
+        print("FlightDelayStats rebuilt from FlightStatusLog.")
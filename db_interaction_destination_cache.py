@@ -0,0 +1,147 @@
+##File holds an in-memory copy of the Destinations table, so flight and pilot queries do not need to join it
+#Destinations is small and rarely changes, so it is read once and indexed by destination_ID and by country.
+#The destination functions in this program reload it straight after they commit. Edits made by other processes (another menu,
+#the command line or the HTTP service) are spotted with a version number in DestinationsVersion, which triggers add one to on
+#every insert, update or delete on Destinations. It is only read when PRAGMA data_version on a separate "watcher" connection shows
+#that the database has changed at all, and the copy is only reloaded when the Destinations version has moved, so the many writes
+#to other tables (status updates, new flights) do not cause reloads
+
+import sqlite3
+import threading
+import db_interaction_connection
+from db_interaction_connection import pooled_connection
+#Import function to borrow a connection to database from the connection pool
+
+#Version number of Destinations, kept up to date by triggers. Created by setup_db.py, and added to older databases at start up
+CREATE_TABLES_SQL = [
+    "CREATE TABLE IF NOT EXISTS DestinationsVersion (version INTEGER NOT NULL)",
+    "INSERT INTO DestinationsVersion (version) SELECT 0 WHERE NOT EXISTS (SELECT 1 FROM DestinationsVersion)",
+] + [f"""
+    CREATE TRIGGER IF NOT EXISTS trg_destinations_version_{event.lower()}
+    AFTER {event} ON Destinations
+    BEGIN
+        UPDATE DestinationsVersion SET version = version + 1;
+    END
+""" for event in ("INSERT", "UPDATE", "DELETE")]
+
+_lock = threading.Lock()
+_loaded_version = None  #Destinations version (see _destinations_version) the cached copy was read at
+_seen_data_version = None  #(database path, data_version) when the Destinations version was last read
+_seen_version = None  #Destinations version read then
+_watcher = None  #Connection only used to read PRAGMA data_version
+_watcher_path = None
+_by_id = {}  #destination_ID -> (destination_ID, country, name, cost, timezone)
+_by_country = {}  #country -> tuple of destination_IDs
+_stats = {"loads": 0}
+
+def _data_version():
+    #Current (database path, data_version). Called with _lock held
+    global _watcher, _watcher_path
+    path = db_interaction_connection.DB_PATH
+    if _watcher is None or _watcher_path != path:
+        if _watcher is not None:
+            _watcher.close()
+        _watcher = sqlite3.connect(path, check_same_thread=False)
+        _watcher_path = path
+    return path, _watcher.execute("PRAGMA data_version").fetchone()[0]
+
+def _destinations_version():
+    #(database path, Destinations version), read again only when the database has changed. Databases without DestinationsVersion
+    #(made before it existed, and not yet started by main.py, command_line.py or http_service.py) give (path, None, data_version),
+    #so any change to them reloads the copy. Called with _lock held
+    global _seen_data_version, _seen_version
+    path, data_version = _data_version()
+    if (path, data_version) != _seen_data_version:
+        try:
+            row = _watcher.execute("SELECT version FROM DestinationsVersion").fetchone()
+            _seen_version = (path, row[0] if row else 0)
+        except sqlite3.OperationalError:
+            _seen_version = (path, None, data_version)
+        _seen_data_version = (path, data_version)
+    return _seen_version
+
+def create_destination_version(conn=None):
+    '''
+    Add DestinationsVersion and its triggers to the database if missing (safe to run repeatedly)
+    Uses the given connection, or borrows one from the pool
+    '''
+    if conn is None:
+        with pooled_connection() as conn:
+            create_destination_version(conn)
+        return
+
+    for sql in CREATE_TABLES_SQL:
+        conn.execute(sql)
+    conn.commit()
+
+def _load(version=None):
+    #Reads the whole Destinations table. Called with _lock held
+    global _loaded_version, _by_id, _by_country
+    version = version or _destinations_version()  #Taken before reading, so a change made during the read is picked up next time
+    with pooled_connection() as conn:
+        rows = conn.execute("SELECT destination_ID, country, name, cost, timezone FROM Destinations").fetchall()
+
+    by_country = {}
+    for row in rows:
+        by_country.setdefault(row[1], []).append(row[0])
+    _by_id = {row[0]: row for row in rows}
+    _by_country = {country: tuple(ids) for country, ids in by_country.items()}
+    _loaded_version = version
+    _stats["loads"] += 1
+
+def _ensure_loaded():
+    #Loads on first use, and again if Destinations has changed or the file has been switched (see reset_pool). Called with _lock held
+    version = _destinations_version()
+    if version != _loaded_version:
+        _load(version)
+
+def refresh_destination_cache():
+    '''
+    Reload the cached copy of Destinations. Called by the destination functions straight after they commit
+    '''
+    with _lock:
+        _load()
+
+def get_destination(destination_id):
+    '''
+    Returns the (destination_ID, country, name, cost, timezone) row for a destination, or None if there is no such destination
+    Accepts the ID as an int or a string of digits (as typed in by the user)
+    '''
+    try:
+        destination_id = int(destination_id)
+    except (TypeError, ValueError):
+        return None
+
+    with _lock:
+        _ensure_loaded()
+        return _by_id.get(destination_id)
+
+def get_destination_country(destination_id):
+    '''
+    Returns the country of a destination, or None if there is no such destination
+    '''
+    row = get_destination(destination_id)
+    return row[1] if row else None
+
+def get_destination_ids_by_country(country):
+    '''
+    Returns a tuple of the destination_IDs in a country (empty if there are none)
+    '''
+    with _lock:
+        _ensure_loaded()
+        return _by_country.get(country, ())
+
+def get_all_destinations():
+    '''
+    Returns a list of (destination_ID, country, name, cost, timezone) rows for every destination
+    '''
+    with _lock:
+        _ensure_loaded()
+        return list(_by_id.values())
+
+def destination_cache_stats():
+    '''
+    Returns the number of times Destinations has been read and the number of destinations held
+    '''
+    with _lock:
+        return dict(_stats, destinations=len(_by_id))
@@ -1,19 +1,58 @@
 ##File contains logic associated with inputting/retrievign data from Destinations table using SQL commands
 
-from db_interaction_connection import get_connection
-#Import function to start connection to database
-
+from db_interaction_connection import pooled_connection
+#Import function to borrow a connection to database from the connection pool
+from db_interaction_destination_cache import get_destination, refresh_destination_cache
+#Import functions for the in-memory copy of Destinations, which must be refreshed after every change
+from db_interaction_write_queue import submit_write
+#Import function to queue a change for the single writer thread, which commits many changes together
+
+#Flights leaving from or arriving at a destination. Parameters: (destination_ID, destination_ID)
+DESTINATION_FLIGHTS_SQL = """
+    SELECT flight_ID FROM Flights
+    WHERE destination_ID = ? OR arrival_destination_ID = ?
+"""
+
+#Changes to Destinations are made by the writer thread (see db_interaction_write_queue.py). Each runs inside its transaction
+
+def _write_destination_delete(cur, _, destination_id):
+    #Returns (deleted, message). The check and the delete are in the same transaction, so no flight can start using it in between
+    cur.execute(DESTINATION_FLIGHTS_SQL, (destination_id, destination_id))
+    result = cur.fetchone()
+    if result:
+        return False, f"Cannot delete: destination is assigned to Flight ID {result[0]}"
+
+    cur.execute("DELETE FROM Destinations WHERE destination_ID = ?", (destination_id,))
+    return True, "Destination deleted.\n"
+
+def _write_destination_update(cur, _, destination_id, country, name, cost, timezone):
+    cur.execute("""
+        UPDATE Destinations
+        SET country = ?, name = ?, cost = ?, timezone = ?
+        WHERE destination_ID = ?
+    """, (country, name, cost, timezone, destination_id))
+
+def _write_new_destination(cur, _, country, name, cost, timezone):
+    #Returns the new destination_ID
+    cur.execute("""
+        INSERT INTO Destinations (country, name, cost, timezone)
+        VALUES (?, ?, ?, ?)
+    """, (country, name, cost, timezone))
+    return cur.lastrowid
+
+def _destinations_written(_):
+    #After the writer commits, before the caller gets its result: reload the cached copy of Destinations
+    refresh_destination_cache()
 
 def view_all_destinations(format_table):
     '''
     Simple Function to view all entries in Destination table, and format output to passes "format_table" function from Main
     '''
     try:
-        conn = get_connection()
-        cur = conn.cursor()
-        cur.execute("SELECT * FROM Destinations")
-        rows = cur.fetchall()
-        conn.close()
+        with pooled_connection() as conn:
+            cur = conn.cursor()
+            cur.execute("SELECT * FROM Destinations")
+            rows = cur.fetchall()
 
         headers = ["Destination ID", "Country", "Name", "Cost", "Timezone (+/- UTC)"]
         if format_table:
@@ -30,28 +69,12 @@ def delete_destination_by_id(destination_id):
     '''
     
     try:
-        ##Check Destination_ID to be deleted not used in Flight table
-        conn = get_connection()
-        cur = conn.cursor()
-        cur.execute("""
-            SELECT flight_ID FROM Flights
-            WHERE destination_ID = ? OR arrival_destination_ID = ?
-        """, (destination_id, destination_id))
-        result = cur.fetchone()
-
-        if result:
-            print(f"Cannot delete: destination is assigned to Flight ID {result[0]}")
-            return
-
-        #If not referenced, then delete entry
-        cur.execute("DELETE FROM Destinations WHERE destination_ID = ?", (destination_id,))
-        conn.commit()
-        print("Destination deleted.\n")
+        ##Check Destination_ID to be deleted not used in Flight table, and if not referenced, delete entry
+        _, message = submit_write(_write_destination_delete, None, destination_id, after_commit=_destinations_written).result()
+        print(message)
 
     except Exception as e:
         print(f"Error deleting destination: {e}")
-    finally:
-        conn.close()
 
 def update_destination(destination_id):
     '''
@@ -65,39 +88,35 @@ def update_destination(destination_id):
         cost = float(input("Enter new cost: "))
         timezone = int(input("Enter new timezone (-12 to 14 to UTC): "))
 
-        conn = get_connection()
-        cur = conn.cursor()
-        cur.execute("""
-            UPDATE Destinations
-            SET country = ?, name = ?, cost = ?, timezone = ?
-            WHERE destination_ID = ?
-        """, (country, name, cost, timezone, destination_id))
-        conn.commit()
-        conn.close()
+        submit_write(_write_destination_update, None, destination_id, country, name, cost, timezone,
+                     after_commit=_destinations_written).result()
 
         print("Destination updated successfully.")
 
     except Exception as e:
         print(f"Failed to update destination: {e}")
 
+def get_flights_for_destination(destination_id):
+    '''
+    Returns (flight ID, destination ID, destination name) for every flight leaving from or arriving at a destination
+    '''
+    destination = get_destination(destination_id)
+    if destination is None:
+        return []
+
+    #Destination name comes from the cached Destinations table, so only Flights is queried
+    with pooled_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(DESTINATION_FLIGHTS_SQL, (destination_id, destination_id))
+        return [(flight_id, destination[0], destination[2]) for (flight_id,) in cur.fetchall()]
+
 def find_flights_by_destination(destination_id, format_table):
     '''
     Function to find flights flyign from or to a location
     Checks if detsination_ID present in destination or arrival_destination id column under Flight table
     '''
     try:
-        conn = get_connection()
-        cur = conn.cursor()
-        cur.execute("""
-            SELECT f.flight_ID, d.destination_ID, d.name
-            FROM Flights f
-            JOIN Destinations d
-            ON f.destination_ID = d.destination_ID OR f.arrival_destination_ID = d.destination_ID
-            WHERE d.destination_ID = ?
-        """, (destination_id,))
-
-        rows = cur.fetchall()
-        conn.close()
+        rows = get_flights_for_destination(destination_id)
 
         headers = ["Flight ID", "Destination ID", "Destination Name"]
         if format_table:
@@ -118,14 +137,7 @@ def add_new_destination():
         cost = float(input("Enter cost (must be >= 0): "))
         timezone = int(input("Enter timezone (-12 to 14): "))
 
-        conn = get_connection()
-        cur = conn.cursor()
-        cur.execute("""
-            INSERT INTO Destinations (country, name, cost, timezone)
-            VALUES (?, ?, ?, ?)
-        """, (country, name, cost, timezone))
-        conn.commit()
-        conn.close()
+        submit_write(_write_new_destination, None, country, name, cost, timezone, after_commit=_destinations_written).result()
 
         print("Destination added successfully.")
 
@@ -133,16 +145,36 @@ def add_new_destination():
         print(f"Failed to add new destination: {e}")
 
 
+def get_destinations_by_cost():
+    '''
+    Returns all destinations ordered by cost (descending)
+    '''
+    with pooled_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT * FROM Destinations ORDER BY cost DESC")
+        return cur.fetchall()
+
+def get_unassigned_destinations():
+    '''
+    Returns destinations not assigned to any flights
+    '''
+    with pooled_connection() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT d.*
+            FROM Destinations d
+            LEFT JOIN Flights f
+            ON d.destination_ID = f.destination_ID OR d.destination_ID = f.arrival_destination_ID
+            WHERE f.flight_ID IS NULL
+        """)
+        return cur.fetchall()
+
 def view_destinations_by_cost(format_table):
     """
     Displays all destinations ordered by cost (descending).
     """
     try:
-        conn = get_connection()
-        cur = conn.cursor()
-        cur.execute("SELECT * FROM Destinations ORDER BY cost DESC")
-        rows = cur.fetchall()
-        conn.close()
+        rows = get_destinations_by_cost()
 
         headers = ["Destination ID", "Country", "Name", "Cost", "Timezone"]
         if format_table:
@@ -156,21 +188,11 @@ def view_unassigned_destinations(format_table):
     Displays destinations not assigned to any flights.
     """
     try:
-        conn = get_connection()
-        cur = conn.cursor()
-        cur.execute("""
-            SELECT d.*
-            FROM Destinations d
-            LEFT JOIN Flights f
-            ON d.destination_ID = f.destination_ID OR d.destination_ID = f.arrival_destination_ID
-            WHERE f.flight_ID IS NULL
-        """)
-        rows = cur.fetchall()
-        conn.close()
+        rows = get_unassigned_destinations()
 
         headers = ["Destination ID", "Country", "Name", "Cost", "Timezone"]
         if format_table:
             format_table(rows, headers)
 
     except Exception as e:
-        print(f"Failed to retrieve unassigned destinations: {e}")
\ No newline at end of file
+        print(f"Failed to retrieve unassigned destinations: {e}")
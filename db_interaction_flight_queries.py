@@ -1,94 +1,357 @@
 import sqlite3
-from datetime import datetime
-from db_interaction_connection import get_connection
-#Import function to start connection to database
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import wait
+from datetime import datetime, timedelta
+from functools import wraps
+import db_interaction_connection
+from db_interaction_connection import pooled_connection
+#Import function to borrow a connection to database from the connection pool
+
+from db_interaction_destination_cache import get_destination_ids_by_country
+#Import function to look up destination_IDs by country without joining Destinations
+
+from db_interaction_routes import update_route_graph
+#Import function to keep the in-memory route graph in step with Flights
+
+from db_interaction_pilot_schedule import find_pilot_conflicts, describe_conflicts
+#Import functions to stop a pilot being booked on overlapping flights
+
+from db_interaction_write_queue import submit_write
+#Import function to queue a change for the single writer thread, which commits many changes together
 
 from db_interaction_log import (
-    log_flight_status
-) #Import function to log status change in FlightStatusLog
+    log_flight_status,
+    log_flight_statuses,
+) #Import functions to log status changes in FlightStatusLog
+
+from db_interaction_history import checkpoint_after_write
+#Import function to add any flight state checkpoints that are due once status changes are committed
+
+#Statuses allowed by the CHECK constraint on Flights.status (see setup_db.py)
+VALID_STATUSES = ("NotDeparted", "Delayed", "OnRoute", "Arrived", "Cancelled")
+
+##----------------------------------------------------------------------------
+#Read-through cache for the flight lookups, as the same lookups are repeated far more often than flights change
+#Results are kept per (query, parameters) in a least-recently-used cache with a size limit and a time limit (TTL).
+#The whole cache is dropped as soon as the database changes. Changes are spotted with PRAGMA data_version on a separate
+#"watcher" connection: its value changes whenever any other connection commits, including other processes using the same file.
+#The write functions in this program also clear the cache straight after committing
+
+CACHE_MAX_ENTRIES = 256  #Number of results kept
+CACHE_TTL_SECONDS = 60  #Results older than this are fetched again
+CACHE_MAX_ROWS = 10000  #Larger results are not cached, so e.g. all flights are never held in memory
+
+_cache = OrderedDict()  #(query, parameters) -> (time stored, rows)
+_cache_lock = threading.Lock()
+_cache_version = None  #(database path, data_version) the cached results belong to
+_cache_stats = {"hits": 0, "misses": 0, "invalidations": 0}
+_watcher = None  #Connection only used to read PRAGMA data_version
+_watcher_path = None
+
+def _data_version():
+    #Current (database path, data_version). Called with _cache_lock held
+    global _watcher, _watcher_path
+    path = db_interaction_connection.DB_PATH
+    if _watcher is None or _watcher_path != path:
+        if _watcher is not None:
+            _watcher.close()
+        _watcher = sqlite3.connect(path, check_same_thread=False)
+        _watcher_path = path
+    return path, _watcher.execute("PRAGMA data_version").fetchone()[0]
+
+def _cache_lookup(key):
+    #Returns (cached rows or None, version the lookup was made at)
+    global _cache_version
+    with _cache_lock:
+        version = _data_version()
+        if version != _cache_version:
+            if _cache:
+                _cache_stats["invalidations"] += 1
+            _cache.clear()
+            _cache_version = version
+
+        entry = _cache.get(key)
+        if entry is not None:
+            if time.monotonic() - entry[0] <= CACHE_TTL_SECONDS:
+                _cache.move_to_end(key)
+                _cache_stats["hits"] += 1
+                return list(entry[1]), version
+            del _cache[key]
+        _cache_stats["misses"] += 1
+        return None, version
+
+def _cache_store(key, rows, version):
+    #Only stores if nothing has changed since the lookup, so results read before a write are never kept after it
+    with _cache_lock:
+        if version != _cache_version or len(rows) > CACHE_MAX_ROWS:
+            return
+        _cache[key] = (time.monotonic(), tuple(rows))
+        _cache.move_to_end(key)
+        while len(_cache) > CACHE_MAX_ENTRIES:
+            _cache.popitem(last=False)
+
+def _read_through_cache(function):
+    #Decorator: serve the lookup from the cache when possible, otherwise run it and keep the result
+    @wraps(function)
+    def cached(*args):
+        key = (function.__name__, args)
+        rows, version = _cache_lookup(key)
+        if rows is None:
+            rows = function(*args)
+            _cache_store(key, rows, version)
+        return rows
+    return cached
+
+def invalidate_flight_cache():
+    '''
+    Drop all cached flight lookups. Called by the functions that change Flights, straight after they commit
+    '''
+    with _cache_lock:
+        if _cache:
+            _cache_stats["invalidations"] += 1
+        _cache.clear()
+
+def get_data_version():
+    '''
+    Returns a number which changes whenever the database is changed by any connection or process (PRAGMA data_version on the watcher)
+    Only meaningful within this process, compared with earlier values for the same database
+    '''
+    with _cache_lock:
+        return _data_version()[1]
+
+def flight_cache_stats():
+    '''
+    Returns cache hits, misses, invalidations and current number of entries
+    '''
+    with _cache_lock:
+        return dict(_cache_stats, entries=len(_cache))
 
 ##----------------------------------------------------------------------------
 #Following functions used to retrieve data from Flight table, based upon specified criteria
+#Results are served from the read-through cache above when possible
+
+#Statements run by the lookups below (also checked by the query plan self-check in db_interaction_indexes.py)
+ALL_FLIGHTS_SQL = "SELECT * FROM Flights"
+FLIGHTS_BY_STATUS_SQL = "SELECT * FROM Flights WHERE status = ?"
+FLIGHTS_BY_ARRIVAL_ID_SQL = "SELECT * FROM Flights WHERE arrival_destination_ID = ?"
+FLIGHTS_BY_DESTINATION_ID_SQL = "SELECT * FROM Flights WHERE destination_ID = ?"
+#"{placeholders}" is replaced with one "?" per destination_ID (see _placeholders)
+FLIGHTS_BY_DESTINATION_IDS_SQL = "SELECT * FROM Flights WHERE destination_ID IN ({placeholders})"
+FLIGHTS_BY_ARRIVAL_IDS_SQL = "SELECT * FROM Flights WHERE arrival_destination_ID IN ({placeholders})"
+FLIGHTS_DEPARTING_BETWEEN_SQL = """
+    SELECT *
+    FROM Flights
+    WHERE departure_date_time >= ? AND departure_date_time < ?
+"""
+FLIGHTS_ARRIVING_BETWEEN_SQL = """
+    SELECT *
+    FROM Flights
+    WHERE arrival_date_time >= ? AND arrival_date_time < ?
+"""
+
+def _placeholders(values):
+    #"?, ?, ?" with one placeholder per value, for IN (...) lists
+    return ", ".join("?" for _ in values)
 
 #Gets Flights from database by their status. Also handles retrieving all flights
+@_read_through_cache
 def get_flights_by_status(status):
-    conn = get_connection()
-    cur = conn.cursor()
+    with pooled_connection() as conn:
+        cur = conn.cursor()
 
-    if status.lower() == "all":
-        sql = "SELECT * FROM Flights"
-        cur.execute(sql)
-    else:
-        sql = "SELECT * FROM Flights WHERE status = ?"
-        cur.execute(sql, (status,))
-
-    results = cur.fetchall()
-    conn.close()
+        if status.lower() == "all":
+            cur.execute(ALL_FLIGHTS_SQL)
+        else:
+            cur.execute(FLIGHTS_BY_STATUS_SQL, (status,))
+
+        results = cur.fetchall()
     return results
 
 #Retrieves Flights by ID of arrival destination
+@_read_through_cache
 def get_flights_by_arrival_id(arrival_id):
-    conn = get_connection()
-    cur = conn.cursor()
-    sql = "SELECT * FROM Flights WHERE arrival_destination_ID = ?"
-    cur.execute(sql, (arrival_id,))
-    results = cur.fetchall()
-    conn.close()
-    return results#
+    with pooled_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(FLIGHTS_BY_ARRIVAL_ID_SQL, (arrival_id,))
+        results = cur.fetchall()
+    return results
 
 #Retrieves Flights by ID of destination
+@_read_through_cache
 def get_flights_by_destination_id(dest_id):
-    conn = get_connection()
-    cur = conn.cursor()
-    sql = "SELECT * FROM Flights WHERE destination_ID = ?"
-    cur.execute(sql, (dest_id,))
-    results = cur.fetchall()
-    conn.close()
+    with pooled_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(FLIGHTS_BY_DESTINATION_ID_SQL, (dest_id,))
+        results = cur.fetchall()
     return results
 
 #Retrieves Flights by country name of leaving location
+#The country is turned into destination_IDs using the cached Destinations table, so no join is needed
+@_read_through_cache
 def get_flights_by_destination_country(country):
-    conn = get_connection()
-    cur = conn.cursor()
-    sql = """
-        SELECT Flights.*
-        FROM Flights
-        JOIN destinations ON Flights.destination_ID = destinations.destination_ID
-        WHERE destinations.country = ?
-    """
-    cur.execute(sql, (country,))
-    results = cur.fetchall()
-    conn.close()
+    destination_ids = get_destination_ids_by_country(country)
+    if not destination_ids:
+        return []
+
+    with pooled_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(FLIGHTS_BY_DESTINATION_IDS_SQL.format(placeholders=_placeholders(destination_ids)), destination_ids)
+        results = cur.fetchall()
     return results
 
-#Retrieves Flights by country name of destination
+#Retrieves Flights by country name of destination (destination_IDs from the cached Destinations table, as above)
+@_read_through_cache
 def get_flights_by_arrival_country(country):
-    conn = get_connection()
-    cur = conn.cursor()
-    sql = """
-        SELECT Flights.*
-        FROM Flights
-        JOIN destinations ON Flights.arrival_destination_ID = destinations.destination_ID
-        WHERE destinations.country = ?
-    """
-    cur.execute(sql, (country,))
-    results = cur.fetchall()
-    conn.close()
+    destination_ids = get_destination_ids_by_country(country)
+    if not destination_ids:
+        return []
+
+    with pooled_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(FLIGHTS_BY_ARRIVAL_IDS_SQL.format(placeholders=_placeholders(destination_ids)), destination_ids)
+        results = cur.fetchall()
     return results
 
 #Retrieves Flights by departure date
+#Uses a half-open range (from midnight, up to but not including next midnight) rather than DATE(departure_date_time) = ?,
+#so the index on departure_date_time can be used instead of a full table scan
+@_read_through_cache
 def get_flights_by_date(date_str):
-    conn = get_connection()
-    cur = conn.cursor()
-    sql = """
-        SELECT *
+    day = datetime.strptime(date_str, "%Y-%m-%d").date()
+    next_day = day + timedelta(days=1)
+
+    with pooled_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(FLIGHTS_DEPARTING_BETWEEN_SQL, (day.isoformat(), next_day.isoformat()))
+        results = cur.fetchall()
+    return results
+
+#Retrieves Flights arriving on a date, using the stored (and indexed) arrival time with the same half-open range
+@_read_through_cache
+def get_flights_arriving_on(date_str):
+    day = datetime.strptime(date_str, "%Y-%m-%d").date()
+    next_day = day + timedelta(days=1)
+
+    with pooled_connection() as conn:
+        cur = conn.cursor()
+        cur.execute(FLIGHTS_ARRIVING_BETWEEN_SQL, (day.isoformat(), next_day.isoformat()))
+        results = cur.fetchall()
+    return results
+
+##----------------------------------------------------------------------------
+#Streaming versions of the lookups above, for use when the result may be very large (e.g. all flights)
+#Rows are fetched in fixed size pages using keyset pagination on flight_ID ("flight_ID > last one seen ... LIMIT page size"),
+#so each page is a short indexed read, the first rows arrive straight away however big the table is, and only one page is held in memory.
+#Each function returns a generator of rows; a connection is only borrowed while a page is being read.
+#Small results are also served from (and added to) the read-through cache
+
+PAGE_SIZE = 500  #Rows fetched per page
+
+#Conditions used by the streaming lookups ("{placeholders}" as for FLIGHTS_BY_DESTINATION_IDS_SQL)
+STATUS_WHERE_SQL = "Flights.status = ?"
+ARRIVAL_ID_WHERE_SQL = "Flights.arrival_destination_ID = ?"
+DESTINATION_ID_WHERE_SQL = "Flights.destination_ID = ?"
+DESTINATION_IDS_WHERE_SQL = "Flights.destination_ID IN ({placeholders})"
+ARRIVAL_IDS_WHERE_SQL = "Flights.arrival_destination_ID IN ({placeholders})"
+DEPARTING_BETWEEN_WHERE_SQL = "Flights.departure_date_time >= ? AND Flights.departure_date_time < ?"
+ARRIVING_BETWEEN_WHERE_SQL = "Flights.arrival_date_time >= ? AND Flights.arrival_date_time < ?"
+#Unary "+" stops SQLite choosing a flight_ID range scan over the whole table instead of a date/time index
+RANGE_PAGE_KEY_SQL = "+Flights.flight_ID"
+
+def flight_page_sql(where_sql="", join_sql="", key_sql="Flights.flight_ID"):
+    '''
+    Returns the statement reading one page of Flights rows matching "where_sql", in flight_ID order
+    Parameters are (last flight_ID seen, *parameters of where_sql, page size)
+    '''
+    condition = f"AND {where_sql}" if where_sql else ""
+    return f"""
+        SELECT Flights.*
         FROM Flights
-        WHERE DATE(departure_date_time) = ?
+        {join_sql}
+        WHERE {key_sql} > ? {condition}
+        ORDER BY Flights.flight_ID
+        LIMIT ?
     """
-    cur.execute(sql, (date_str,))
-    results = cur.fetchall()
-    conn.close()
-    return results
+
+def _iter_flight_pages(where_sql="", params=(), page_size=PAGE_SIZE, join_sql="", key_sql="Flights.flight_ID"):
+    #Yields pages (lists of Flights rows) matching "where_sql", in flight_ID order
+    sql = flight_page_sql(where_sql, join_sql, key_sql)
+    last_id = 0
+    while True:
+        with pooled_connection() as conn:
+            page = conn.execute(sql, (last_id, *params, page_size)).fetchall()
+        if not page:
+            return
+        yield page
+        if len(page) < page_size:
+            return
+        last_id = page[-1][0]
+
+def _iter_flight_rows(*args, cache_key=None, **kwargs):
+    #Streams rows, from the read-through cache if the result is there. If not, and the result turns out to be small
+    #enough once fully read, it is added to the cache
+    rows, version = _cache_lookup(cache_key) if cache_key else (None, None)
+    if rows is not None:
+        yield from rows
+        return
+
+    collected = []
+    for page in _iter_flight_pages(*args, **kwargs):
+        yield from page
+        if collected is not None:
+            collected.extend(page)
+            if len(collected) > CACHE_MAX_ROWS:
+                collected = None  #Too big to cache, stop collecting
+    if cache_key and collected is not None:
+        _cache_store(cache_key, collected, version)
+
+#Streams Flights by their status, or all flights if status is "all"
+def iter_flights_by_status(status, page_size=PAGE_SIZE):
+    if status.lower() == "all":
+        return _iter_flight_rows(page_size=page_size, cache_key=("iter_flights_by_status", "all"))
+    return _iter_flight_rows(STATUS_WHERE_SQL, (status,), page_size, cache_key=("iter_flights_by_status", status))
+
+#Streams Flights by ID of arrival destination
+def iter_flights_by_arrival_id(arrival_id, page_size=PAGE_SIZE):
+    return _iter_flight_rows(ARRIVAL_ID_WHERE_SQL, (arrival_id,), page_size, cache_key=("iter_flights_by_arrival_id", arrival_id))
+
+#Streams Flights by ID of destination
+def iter_flights_by_destination_id(dest_id, page_size=PAGE_SIZE):
+    return _iter_flight_rows(DESTINATION_ID_WHERE_SQL, (dest_id,), page_size, cache_key=("iter_flights_by_destination_id", dest_id))
+
+#Streams Flights by country name of leaving location
+def iter_flights_by_destination_country(country, page_size=PAGE_SIZE):
+    destination_ids = get_destination_ids_by_country(country)
+    if not destination_ids:
+        return iter(())
+    where_sql = DESTINATION_IDS_WHERE_SQL.format(placeholders=_placeholders(destination_ids))
+    return _iter_flight_rows(where_sql, destination_ids, page_size, cache_key=("iter_flights_by_destination_country", country))
+
+#Streams Flights by country name of destination
+def iter_flights_by_arrival_country(country, page_size=PAGE_SIZE):
+    destination_ids = get_destination_ids_by_country(country)
+    if not destination_ids:
+        return iter(())
+    where_sql = ARRIVAL_IDS_WHERE_SQL.format(placeholders=_placeholders(destination_ids))
+    return _iter_flight_rows(where_sql, destination_ids, page_size, cache_key=("iter_flights_by_arrival_country", country))
+
+#Streams Flights by departure date (same half-open range as get_flights_by_date)
+def iter_flights_by_date(date_str, page_size=PAGE_SIZE):
+    day = datetime.strptime(date_str, "%Y-%m-%d").date()
+    next_day = day + timedelta(days=1)
+    #Keyed on RANGE_PAGE_KEY_SQL so the departure_date_time index is used
+    return _iter_flight_rows(DEPARTING_BETWEEN_WHERE_SQL, (day.isoformat(), next_day.isoformat()), page_size, key_sql=RANGE_PAGE_KEY_SQL,
+                             cache_key=("iter_flights_by_date", day.isoformat()))
+
+#Streams Flights arriving on a date (same half-open range as get_flights_arriving_on)
+def iter_flights_arriving_on(date_str, page_size=PAGE_SIZE):
+    day = datetime.strptime(date_str, "%Y-%m-%d").date()
+    next_day = day + timedelta(days=1)
+    #Keyed on RANGE_PAGE_KEY_SQL for the same reason as iter_flights_by_date, so the arrival_date_time index is used
+    return _iter_flight_rows(ARRIVING_BETWEEN_WHERE_SQL, (day.isoformat(), next_day.isoformat()), page_size, key_sql=RANGE_PAGE_KEY_SQL,
+                             cache_key=("iter_flights_arriving_on", day.isoformat()))
 
 ##----------------------------------------------------------------------------
 
@@ -104,23 +367,16 @@ def add_new_flight():
         departure_str = input("Enter Departure Date and Time (YYYY-MM-DD HH:MM:SS): ")
         datetime.strptime(departure_str, "%Y-%m-%d %H:%M:%S")  #Validate date time format
         flight_time = int(input("Enter Flight Time in minutes: "))
-        status = "NotDeparted" #Automatically logged status as NotDeparted
 
-        conn = get_connection()
-        cur = conn.cursor()
-        #SQL insert statment
-        sql = """
-            INSERT INTO Flights (personal_ID, destination_ID, arrival_destination_ID, departure_date_time, flight_time, status)
-            VALUES (?, ?, ?, ?, ?, ?)
-        """
-        cur.execute(sql, (personal_id, destination_id, arrival_id, departure_str, flight_time, status))
-        conn.commit()
-
-        flight_id = cur.lastrowid  #Get the auto-generated Flight ID
-        conn.close()
-
-        log_flight_status(flight_id, status, departure_str) #Passes relevant information to FlightStatusLog to "log" status change (initial entry) of flight
+        #Flight and its log entry are saved together by the writer thread; result() waits until they are committed
+        flight_id, message = submit_new_flight(personal_id, destination_id, arrival_id, departure_str, flight_time).result()
+        if flight_id is None:
+            print(f"Flight not added: {message}")
+            return
+        update_route_graph([flight_id])
+
         print("Flight added and logged successfully.")
+        return flight_id
 
     except ValueError: #Error handling
         print("Invalid input. Please check your values and date format.")
@@ -129,9 +385,9 @@ def add_new_flight():
 
 ##-------------------------------------------------
 #Following functions used to update status of entry into "Flight" table. Use of two "helper functions" to prevent code re-use
-#Helper Functions: update_flight_status_helper and prompt_and_update_departure_time
+#Helper Functions: update_flight_status_helper and prompt_departure_time
 #If Flight "Cancelled", then on selection of option in Main, passes "Cancelled to "update_flight_status_helper" for appropriate logging
-#For other options("Arrived", "OnRoute", and "Delayed"), "upate_flight_function" prompts user for entry, and passes to "update_flight_status_helper". If "DElayed" option selected, then "prompt_and_update_departure_time" run to prompt and update departure time
+#For other options("Arrived", "OnRoute", and "Delayed"), "upate_flight_function" prompts user for entry, and passes to "update_flight_status_helper". If "DElayed" option selected, then "prompt_departure_time" run to prompt for the new departure time
 #All changes to status are are logged, including new deparure time when delayed
 
 #Called when "Deleting" a Flight (changing status to "Cancelled"). Passes "Cancelled" status to "update_flight_status_helper"
@@ -156,49 +412,237 @@ def update_flight_status(flight_id):
     
     new_status = input("Enter new status (excluding 'Cancelled' or 'OnRoute'): ")
 
-#If run (when new status is "Delayed") will promtp user to input new departure time
-def prompt_and_update_departure_time(cur, flight_id):
+#If run (when new status is "Delayed") will promtp user to input new departure time. Returns it, or None if not valid
+def prompt_departure_time():
 
     new_departure = input("Enter new departure time (YYYY-MM-DD HH:MM:SS): ")
     try:
         datetime.strptime(new_departure, "%Y-%m-%d %H:%M:%S")
-        cur.execute("UPDATE Flights SET departure_date_time = ? WHERE flight_ID = ?", (new_departure, flight_id))
-        print("Departure time updated.")
         return new_departure
     except ValueError:
         print("Invalid datetime format. Departure time not updated.")
         return None
 
-#Runs SQL lines to update Flights table with new status
+#Updates Flights table with new status, checking the flight exists first, and passes the change to the write queue. Returns the new log_ID
 def update_flight_status_helper(flight_id, new_status):
     try:
-        conn = get_connection()
-        cur = conn.cursor()
-
-        #Check if flight exists and get departure date
-        cur.execute("SELECT departure_date_time FROM Flights WHERE flight_ID = ?", (flight_id,))
-        result = cur.fetchone()
-
-        if result is None:
-            print("No flight found with that ID.")
-            return
+        with pooled_connection() as conn:
+            cur = conn.cursor()
 
-        departure_time = result[0]
+            #Check if flight exists before asking for anything else
+            cur.execute("SELECT 1 FROM Flights WHERE flight_ID = ?", (flight_id,))
+            if cur.fetchone() is None:
+                print("No flight found with that ID.")
+                return
 
-        #If delayed, prompt for and update the departure time
+        #If delayed, prompt for the new departure time (the prompt is answered before anything is queued, so the writer never waits on a user)
+        new_departure = None
         if new_status == "Delayed":
-            updated_time = prompt_and_update_departure_time(cur, flight_id)
-            if updated_time:
-                departure_time = updated_time
+            new_departure = prompt_departure_time()
 
-        #Update status
-        cur.execute("UPDATE Flights SET status = ? WHERE flight_ID = ?", (new_status, flight_id))
-        conn.commit()
-        conn.close()
+        #Status, departure time and log entry are saved together by the writer thread; result() waits until they are committed
+        log_id = submit_status_change(flight_id, new_status, new_departure).result()
+        if new_departure:
+            print("Departure time updated.")
 
-        #Log the update
-        log_flight_status(flight_id, new_status, departure_time)
         print(f"Flight ID {flight_id} status updated to '{new_status}'.")
+        return log_id
 
     except Exception as e:
         print(f"Failed to update flight status: {e}")
+
+##-------------------------------------------------
+#Single status changes go through the write queue (see db_interaction_write_queue.py), so changes made at the same time by
+#many threads are committed together in one transaction instead of competing for the database lock
+
+def _write_status_change(cur, flight_id, new_status, new_departure):
+    #Runs on the writer thread inside its transaction: updates the flight and logs the change. Returns the new log_ID
+    cur.execute("SELECT departure_date_time FROM Flights WHERE flight_ID = ?", (flight_id,))
+    row = cur.fetchone()
+    error = _validate_status_event((flight_id, new_status, new_departure), {flight_id: row[0]} if row else {})
+    if error:
+        raise ValueError(error)
+
+    departure_time = new_departure or row[0]
+    cur.execute("UPDATE Flights SET status = ?, departure_date_time = ? WHERE flight_ID = ?", (new_status, departure_time, flight_id))
+    return log_flight_status(flight_id, new_status, departure_time, cur=cur)
+
+def _flights_written(flight_ids):
+    #After the writer commits: clear cached lookups and move the flights in the route graph (cancelled flights leave it, delayed ones move)
+    invalidate_flight_cache()
+    update_route_graph(flight_ids)
+    checkpoint_after_write()
+
+def _write_new_flight(cur, _, personal_id, destination_id, arrival_id, departure_str, flight_time):
+    #Runs on the writer thread inside its transaction, which already holds the write lock, so no other flight can be booked
+    #between the check that the pilot is free and the insert. Returns (new flight_ID, None), or (None, reason) if the pilot is not free
+    conflicts = find_pilot_conflicts(cur, personal_id, departure_str, flight_time)
+    if conflicts:
+        return None, describe_conflicts(personal_id, conflicts)
+
+    status = "NotDeparted" #Automatically logged status as NotDeparted
+    sql = """
+        INSERT INTO Flights (personal_ID, destination_ID, arrival_destination_ID, departure_date_time, flight_time, status)
+        VALUES (?, ?, ?, ?, ?, ?)
+    """
+    cur.execute(sql, (personal_id, destination_id, arrival_id, departure_str, flight_time, status))
+    flight_id = cur.lastrowid  #Get the auto-generated Flight ID
+
+    log_flight_status(flight_id, status, departure_str, cur=cur) #Initial log entry, saved by the same commit as the Flight
+    return flight_id, None
+
+def _flight_added(_):
+    #After the writer commits: clear cached lookups (the new flight_ID is only known from the result, so the caller adds it to the route graph)
+    invalidate_flight_cache()
+    checkpoint_after_write()
+
+def submit_new_flight(personal_id, destination_id, arrival_id, departure_str, flight_time):
+    '''
+    Queue a new flight (status NotDeparted, logged) for the writer thread, without prompting. departure_str is a "YYYY-MM-DD HH:MM:SS" string
+    Returns a Future giving (flight_ID, None) once it is committed, or (None, reason) if the pilot is already flying in an overlapping window
+    '''
+    return submit_write(_write_new_flight, None, personal_id, destination_id, arrival_id, departure_str, flight_time, after_commit=_flight_added)
+
+def submit_status_change(flight_id, new_status, new_departure=None):
+    '''
+    Queue a status change (and new departure time, e.g. when delayed) without prompting. new_departure is a "YYYY-MM-DD HH:MM:SS" string,
+    or None to keep the current departure time
+    Returns a Future giving the new log_ID once the change is committed, or raising ValueError if the flight, status or time is not valid
+    '''
+    return submit_write(_write_status_change, flight_id, new_status, new_departure, after_commit=_flights_written)
+
+##-------------------------------------------------
+#Batch status updates, for feeds of many flight events at once (no user prompts)
+#Events are checked first, then applied in chunks, with executemany for both the Flights updates and the FlightStatusLog rows.
+#Each chunk is one item on the write queue, so bulk feeds share the single writer (and its commits) with the other writes instead
+#of competing with it for the database lock. A bad event is reported back and does not stop the rest of the batch
+
+def _event_flight_id(event):
+    #flight_ID of an event as an int (events from files and JSON may give it as a string such as "12"), or None if it is not a whole number
+    try:
+        flight_id = event[0]
+        if isinstance(flight_id, bool) or (isinstance(flight_id, float) and not flight_id.is_integer()):
+            return None
+        return int(flight_id)
+    except (TypeError, ValueError, IndexError, KeyError):
+        return None
+
+def _validate_status_event(event, departures):
+    #Returns an error message for an event that cannot be applied, or None if it is fine
+    if isinstance(event, ValueError):
+        return str(event)  #An event that could not be read (e.g. a malformed line of a file), with the reason
+    try:
+        _, new_status, new_departure = event
+    except (TypeError, ValueError):
+        return "Event must be a (flight_ID, new_status, new_departure) tuple"
+
+    flight_id = _event_flight_id(event)
+    if flight_id is None:
+        return "flight_ID must be a whole number"
+    if new_status not in VALID_STATUSES:
+        return f"'{new_status}' is not a valid status. Choose from {', '.join(VALID_STATUSES)}"
+    if flight_id not in departures:
+        return "No flight found with that ID"
+    if new_departure is not None:
+        try:
+            datetime.strptime(new_departure, "%Y-%m-%d %H:%M:%S")
+        except (TypeError, ValueError):
+            return "Invalid departure datetime format, expected YYYY-MM-DD HH:MM:SS"
+    return None
+
+def _apply_status_chunk(cur, chunk):
+    #Applies one chunk of events on the caller's cursor, without committing, returning a result tuple for each event
+    flight_ids = list({_event_flight_id(event) for event in chunk if isinstance(event, (tuple, list)) and len(event) == 3} - {None})
+    departures = {}
+    if flight_ids:
+        cur.execute(f"SELECT flight_ID, departure_date_time FROM Flights WHERE flight_ID IN ({_placeholders(flight_ids)})", flight_ids)
+        departures = dict(cur.fetchall())
+
+    results = []
+    updates = []
+    log_entries = []
+    for event in chunk:
+        error = _validate_status_event(event, departures)
+        if error:
+            results.append((event[0] if isinstance(event, (tuple, list)) and event else None, False, error))
+            continue
+
+        _, new_status, new_departure = event
+        flight_id = _event_flight_id(event)
+        if new_departure is not None:
+            departures[flight_id] = new_departure  #Later events for the same flight in this chunk see the new time
+        departure_time = departures[flight_id]
+
+        updates.append((new_status, departure_time, flight_id))
+        log_entries.append((flight_id, new_status, departure_time))
+        results.append((flight_id, True, f"Status updated to '{new_status}'"))
+
+    cur.executemany("UPDATE Flights SET status = ?, departure_date_time = ? WHERE flight_ID = ?", updates)
+    log_flight_statuses(cur, log_entries)
+    return results
+
+def _write_status_chunk(cur, _, chunk):
+    #Runs on the writer thread inside its transaction. If something in the chunk fails in the database, the chunk is undone and
+    #the events are tried again one at a time, so that only the events that actually fail are reported as failed
+    cur.execute("SAVEPOINT status_chunk")
+    try:
+        results = _apply_status_chunk(cur, chunk)
+    except Exception:
+        cur.execute("ROLLBACK TO status_chunk")
+        results = []
+        for event in chunk:
+            cur.execute("SAVEPOINT status_event")
+            try:
+                results.extend(_apply_status_chunk(cur, [event]))
+            except Exception as e:
+                cur.execute("ROLLBACK TO status_event")
+                results.append((event[0] if isinstance(event, (tuple, list)) and event else None, False, f"Failed to update flight status: {e}"))
+            cur.execute("RELEASE status_event")
+    cur.execute("RELEASE status_chunk")
+    return results
+
+def apply_status_events(events, chunk_size=500):
+    '''
+    Apply many status changes without prompting. "events" is an iterable of (flight_ID, new_status, new_departure) tuples,
+    where new_departure is a "YYYY-MM-DD HH:MM:SS" string, or None to keep the current departure time.
+    A ValueError in place of an event (e.g. a line of a file that could not be read) is reported as a failed event with its message
+    Each chunk of chunk_size events is queued for the writer thread as one write, and the next chunk is read while it is committed
+    Returns a list of (flight_ID, success, message) tuples, one per event and in the same order
+    '''
+    results = []
+    chunk = []
+    queued = []  #Futures of every chunk queued, in order
+    collected = 0  #Number of those whose results have been added to "results"
+
+    def collect(upto):
+        #Adds the results of the queued chunks before index "upto", waiting for them if needed
+        nonlocal collected
+        while collected < upto:
+            results.extend(queued[collected].result())
+            collected += 1
+
+    def flush():
+        queued.append(submit_write(_write_status_chunk, None, list(chunk)))
+        chunk.clear()
+        collect(len(queued) - 1)  #Results of the chunk before this one, so at most one chunk is being committed while reading
+
+    try:
+        for event in events:
+            chunk.append(event)
+            if len(chunk) >= chunk_size:
+                flush()
+        if chunk:
+            flush()
+        collect(len(queued))
+    finally:
+        #Also when reading the events (or a chunk) fails part way, as every chunk already queued is still saved
+        wait(queued)
+        written = list(results)
+        for future in queued[collected:]:
+            if future.exception() is None:
+                written.extend(future.result())
+        invalidate_flight_cache()
+        update_route_graph([flight_id for flight_id, success, _ in written if success])
+        checkpoint_after_write()
+
+    return results
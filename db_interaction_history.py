@@ -0,0 +1,389 @@
+##File handles "time travel": the state of flights (status and departure time) as it was at any moment, rebuilt from FlightStatusLog
+#Every status change is logged with its log_date_time (UTC, from CURRENT_TIMESTAMP), so a flight's state at time T is its newest
+#log entry at or before T. Finding that from the whole log costs more the longer the log gets, so the state of every flight is
+#also saved now and then as a checkpoint (FlightStateCheckpoints / FlightStateSnapshots). To answer "as of T", the newest
+#checkpoint at or before T is read, and only the log entries between that checkpoint and T are replayed on top of it.
+#Checkpoints are spaced by the number of log rows between them (at least CHECKPOINT_EVERY_ROWS, and never fewer than there are
+#flights, so snapshots take room of the same order as the log itself), which keeps the replay short for any T, old or recent.
+#Reading flights as of a time never writes: checkpoints are added on the write side instead. After status changes are committed,
+#checkpoint_after_write() looks (at most every CHECKPOINT_CHECK_SECONDS) for checkpoints that are due and adds them on a background
+#thread, and "python db_interaction_history.py checkpoint" adds them by hand
+#
+#Only status and departure time are logged, so the pilot, destinations and flight time shown are today's values. Flights with no
+#log entry at or before T (not yet added) are left out. Checkpoints are only taken up to CHECKPOINT_LAG_SECONDS ago, so no entry
+#still being written can land before one; entries written later with an older log_date_time (e.g. a backfilled log) are not
+#seen by existing checkpoints, so run "python db_interaction_history.py rebuild" after such a load
+#Log rows moved to the archive files (db_interaction_log_archive.py) are still replayed: the files holding rows in the stretch of
+#time being replayed are attached for the query, which for a recent time and checkpoint is usually none of them
+#
+#Example: python db_interaction_history.py as-of "2025-06-01 14:00:00" --status Delayed
+
+import argparse
+import atexit
+import threading
+import time
+from datetime import datetime
+
+from db_interaction_connection import pooled_connection
+#Import function to borrow a connection to database from the connection pool
+from db_interaction_log_archive import log_partitions
+#Import function to read the status log across FlightStatusLog and the archive files a time range needs
+
+CHECKPOINT_EVERY_ROWS = 50000  #Fewest log rows between checkpoints
+CHECKPOINT_LAG_SECONDS = 60  #Checkpoints only cover log entries at least this old
+AUTO_CHECKPOINT = True  #Whether status changes add any checkpoints that are due afterwards (on a background thread)
+CHECKPOINT_CHECK_SECONDS = 30  #Shortest time between looking for due checkpoints after writes
+
+_checkpoint_lock = threading.Lock()
+_checkpoint_thread = None  #Background thread adding checkpoints, None when not running
+_checkpoint_checked = float("-inf")  #When checkpoint_after_write last started a check (time.monotonic)
+
+CREATE_TABLES_SQL = [
+    """
+    CREATE TABLE IF NOT EXISTS FlightStateCheckpoints (
+        checkpoint_ID INTEGER PRIMARY KEY AUTOINCREMENT,
+        as_of DATETIME NOT NULL UNIQUE,
+        flights INTEGER NOT NULL DEFAULT 0,
+        log_rows INTEGER NOT NULL DEFAULT 0,
+        created DATETIME DEFAULT CURRENT_TIMESTAMP
+        );
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS FlightStateSnapshots (
+        checkpoint_ID INTEGER NOT NULL,
+        flight_ID INTEGER NOT NULL,
+        status TEXT,
+        departure_date_time DATETIME NOT NULL,
+        PRIMARY KEY (checkpoint_ID, flight_ID),
+        FOREIGN KEY (checkpoint_ID) REFERENCES FlightStateCheckpoints(checkpoint_ID) ON DELETE CASCADE
+        ) WITHOUT ROWID;
+    """,
+]
+
+#Newest log entry for each flight logged after one time and up to another. Entries logged in the same second are ordered by log_ID.
+#"{log}" is replaced with the log to read (see log_partitions), and "{flights}" with an extra condition when only some flights are wanted
+REPLAY_SQL = """
+    SELECT flight_ID, status, departure_date_time FROM (
+        SELECT
+            flight_ID,
+            status,
+            departure_date_time,
+            ROW_NUMBER() OVER (PARTITION BY flight_ID ORDER BY log_date_time DESC, log_ID DESC) AS newest
+        FROM {log}
+        WHERE log_date_time > ? AND log_date_time <= ?{flights}
+    )
+    WHERE newest = 1
+"""
+
+#State of each flight on a database without the checkpoint tables (made before they existed): the replayed entries alone
+REPLAY_STATE_SQL = """
+    WITH state AS ({replay})
+"""
+
+#State of each flight: replayed entries, plus the checkpoint's snapshot for flights with nothing newer to replay
+STATE_SQL = """
+    WITH replay AS MATERIALIZED ({replay}),
+    state AS (
+        SELECT flight_ID, status, departure_date_time FROM replay
+        UNION ALL
+        SELECT flight_ID, status, departure_date_time FROM FlightStateSnapshots
+        WHERE checkpoint_ID = ?{flights} AND flight_ID NOT IN (SELECT flight_ID FROM replay)
+    )
+"""
+
+def ensure_history_tables(cur):
+    '''
+    Make sure the checkpoint tables exist (older databases do not have them)
+    '''
+    for sql in CREATE_TABLES_SQL:
+        cur.execute(sql)
+
+def _check_timestamp(timestamp):
+    try:
+        return datetime.strptime(timestamp, "%Y-%m-%d %H:%M:%S").strftime("%Y-%m-%d %H:%M:%S")
+    except (TypeError, ValueError):
+        raise ValueError(f"'{timestamp}' is not a time in the format 'YYYY-MM-DD HH:MM:SS'")
+
+def _placeholders(values):
+    return ", ".join("?" for _ in values)
+
+def _history_tables_exist(cur):
+    cur.execute("SELECT COUNT(*) FROM sqlite_master WHERE type = 'table' AND name IN ('FlightStateCheckpoints', 'FlightStateSnapshots')")
+    return cur.fetchone()[0] == 2
+
+def _latest_checkpoint(cur, timestamp=None):
+    #Newest (checkpoint_ID, as_of, flights) at or before timestamp (or newest of all), or None
+    if timestamp is None:
+        cur.execute("SELECT checkpoint_ID, as_of, flights FROM FlightStateCheckpoints ORDER BY as_of DESC LIMIT 1")
+    else:
+        cur.execute("""
+            SELECT checkpoint_ID, as_of, flights FROM FlightStateCheckpoints
+            WHERE as_of <= ? ORDER BY as_of DESC LIMIT 1
+        """, (timestamp,))
+    return cur.fetchone()
+
+def _state_sql(flight_ids=None, log="FlightStatusLog", snapshots=True):
+    #Returns (WITH clause giving "state" for everything up to a time, function making its parameters)
+    #With snapshots False the checkpoint tables are not read at all (for databases without them)
+    flights = f" AND flight_ID IN ({_placeholders(flight_ids)})" if flight_ids else ""
+    replay = REPLAY_SQL.format(log=log, flights=flights)
+    sql = STATE_SQL.format(replay=replay, flights=flights) if snapshots else REPLAY_STATE_SQL.format(replay=replay)
+    ids = list(flight_ids or ())
+
+    def params(checkpoint, timestamp):
+        after = checkpoint[1] if checkpoint else ""  #"" sorts before every time, so with no checkpoint the whole log is replayed
+        if not snapshots:
+            return [after, timestamp, *ids]
+        return [after, timestamp, *ids, checkpoint[0] if checkpoint else None, *ids]
+    return sql, params
+
+def _build_checkpoint(cur, previous, as_of, log):
+    #Saves the state of every flight as of "as_of", from the previous checkpoint plus the log entries since. Returns the new checkpoint
+    cur.execute("INSERT INTO FlightStateCheckpoints (as_of) VALUES (?)", (as_of,))
+    checkpoint_id = cur.lastrowid
+    state_sql, params = _state_sql(log=log)
+    cur.execute(f"""
+        INSERT INTO FlightStateSnapshots (checkpoint_ID, flight_ID, status, departure_date_time)
+        {state_sql}
+        SELECT ?, flight_ID, status, departure_date_time FROM state
+    """, params(previous, as_of) + [checkpoint_id])
+    flights = cur.rowcount
+
+    cur.execute(f"SELECT COUNT(*) FROM {log} WHERE log_date_time > ? AND log_date_time <= ?", (previous[1] if previous else "", as_of))
+    log_rows = cur.fetchone()[0]
+    cur.execute("UPDATE FlightStateCheckpoints SET flights = ?, log_rows = ? WHERE checkpoint_ID = ?", (flights, log_rows, checkpoint_id))
+    return checkpoint_id, as_of, flights
+
+def _next_checkpoint_time(cur, previous, every_rows):
+    #Time of the log entry "spacing" rows after the previous checkpoint, if that many entries are old enough, otherwise None
+    #Only FlightStatusLog is counted: archived rows are older than the cutoff, so rarely newer than the last checkpoint
+    spacing = max(every_rows, previous[2] if previous else 0)
+    cur.execute(f"""
+        SELECT log_date_time FROM FlightStatusLog
+        WHERE log_date_time > ? AND log_date_time <= DATETIME('now', '-{int(CHECKPOINT_LAG_SECONDS)} seconds')
+        ORDER BY log_date_time LIMIT 1 OFFSET ?
+    """, (previous[1] if previous else "", spacing - 1))
+    row = cur.fetchone()
+    return row[0] if row else None
+
+def update_checkpoints(every_rows=None):
+    '''
+    Add the checkpoints that are due: one for every CHECKPOINT_EVERY_ROWS log rows (or every_rows) since the newest checkpoint
+    Returns a list of (checkpoint_ID, as_of, flights) for the checkpoints made (empty if none were due)
+    '''
+    every_rows = every_rows or CHECKPOINT_EVERY_ROWS
+    created = []
+    with pooled_connection() as conn:
+        cur = conn.cursor()
+        ensure_history_tables(cur)
+        conn.commit()
+        if _next_checkpoint_time(cur, _latest_checkpoint(cur), every_rows) is None:
+            return created  #Nothing due, and no write lock taken
+
+        while True:
+            #Take the write lock, so two processes cannot both add the same checkpoint. Checkpoints bypass the write queue on purpose
+            #(see db_interaction_write_queue.py)
+            previous = _latest_checkpoint(cur)
+            with log_partitions(conn, previous[1] if previous else None, begin="BEGIN IMMEDIATE") as log:
+                if _latest_checkpoint(cur) != previous:
+                    continue  #Checkpoints changed before the lock was taken, so the archive files opened may not be the ones needed
+                while True:
+                    as_of = _next_checkpoint_time(cur, previous, every_rows)
+                    if as_of is None:
+                        break
+                    previous = _build_checkpoint(cur, previous, as_of, log)
+                    created.append(previous)
+                conn.commit()
+            return created
+
+def _add_due_checkpoints():
+    #Body of the background thread started by checkpoint_after_write
+    global _checkpoint_thread
+    try:
+        update_checkpoints()
+    except Exception as e:
+        print(f"Failed to add flight state checkpoints: {e}")
+    finally:
+        with _checkpoint_lock:
+            _checkpoint_thread = None
+
+def checkpoint_after_write():
+    '''
+    Called after status changes are committed. At most every CHECKPOINT_CHECK_SECONDS, starts a background thread which adds any
+    checkpoints that are due, so neither the writer nor the caller waits for one. Does nothing while one is already running
+    '''
+    global _checkpoint_thread, _checkpoint_checked
+    if not AUTO_CHECKPOINT:
+        return
+    with _checkpoint_lock:
+        now = time.monotonic()
+        if _checkpoint_thread is not None or now - _checkpoint_checked < CHECKPOINT_CHECK_SECONDS:
+            return
+        _checkpoint_checked = now
+        _checkpoint_thread = threading.Thread(target=_add_due_checkpoints, name="flyme-checkpoints", daemon=True)
+        _checkpoint_thread.start()
+
+def _finish_checkpoints():
+    #At exit, let a checkpoint already being added finish rather than throw its work away
+    with _checkpoint_lock:
+        thread = _checkpoint_thread
+    if thread is not None:
+        thread.join()
+
+atexit.register(_finish_checkpoints)
+
+def get_flights_as_of(timestamp, status=None, flight_ids=None, destination_id=None, arrival_id=None, pilot_id=None):
+    '''
+    Returns Flights rows (flight_ID, personal_ID, destination_ID, arrival_destination_ID, departure_date_time, flight_time, status,
+    arrival_date_time) with the status and departure time each flight had at "timestamp" ("YYYY-MM-DD HH:MM:SS", UTC like log_date_time)
+    Optionally only flights with that status at the time, the given flight IDs, or a departure/arrival destination or pilot
+    Only reads: existing checkpoints are used, and none are added here (see checkpoint_after_write)
+    Raises ValueError for a badly formatted timestamp
+    '''
+    timestamp = _check_timestamp(timestamp)
+    if flight_ids is not None:
+        flight_ids = [int(flight_id) for flight_id in flight_ids]
+        if not flight_ids:
+            return []
+
+    conditions, values = [], []
+    for column, value in (("s.status", status), ("f.destination_ID", destination_id), ("f.arrival_destination_ID", arrival_id),
+                          ("f.personal_ID", pilot_id)):
+        if value is not None:
+            conditions.append(f"{column} = ?")
+            values.append(value)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+    with pooled_connection() as conn:
+        cur = conn.cursor()
+        snapshots = _history_tables_exist(cur)
+        while True:
+            checkpoint = _latest_checkpoint(cur, timestamp) if snapshots else None
+            with log_partitions(conn, checkpoint[1] if checkpoint else None, timestamp) as log:
+                if snapshots and _latest_checkpoint(cur, timestamp) != checkpoint:
+                    continue  #Checkpoints were rebuilt meanwhile, so the archive files opened may not be the ones needed
+                state_sql, params = _state_sql(flight_ids, log, snapshots)
+                cur.execute(f"""
+                    {state_sql}
+                    SELECT f.flight_ID, f.personal_ID, f.destination_ID, f.arrival_destination_ID, s.departure_date_time, f.flight_time, s.status,
+                           DATETIME(s.departure_date_time, '+' || f.flight_time || ' minutes')
+                    FROM state s
+                    JOIN Flights f ON f.flight_ID = s.flight_ID
+                    {where}
+                    ORDER BY f.flight_ID
+                """, params(checkpoint, timestamp) + values)
+                return cur.fetchall()
+
+def list_checkpoints():
+    '''
+    Returns rows of (checkpoint_ID, as_of, flights, log rows since the checkpoint before, created)
+    '''
+    with pooled_connection() as conn:
+        cur = conn.cursor()
+        ensure_history_tables(cur)
+        cur.execute("SELECT checkpoint_ID, as_of, flights, log_rows, created FROM FlightStateCheckpoints ORDER BY as_of")
+        rows = cur.fetchall()
+        conn.commit()
+    return rows
+
+def check_checkpoints():
+    '''
+    Compare every checkpoint with the state replayed from the whole log (archived rows included) up to its time
+    Returns a list of drift messages (empty if every checkpoint is correct)
+    '''
+    drift = []
+    with pooled_connection() as conn:
+        cur = conn.cursor()
+        ensure_history_tables(cur)
+        conn.commit()
+        with log_partitions(conn) as log:
+            state_sql, params = _state_sql(log=log)
+            for checkpoint_id, as_of in cur.execute("SELECT checkpoint_ID, as_of FROM FlightStateCheckpoints ORDER BY as_of").fetchall():
+                cur.execute(f"""
+                    {state_sql}
+                    SELECT COUNT(*) FROM (
+                        SELECT flight_ID, status, departure_date_time FROM state
+                        EXCEPT
+                        SELECT flight_ID, status, departure_date_time FROM FlightStateSnapshots WHERE checkpoint_ID = ?
+                    )
+                """, params(None, as_of) + [checkpoint_id])
+                missing = cur.fetchone()[0]
+                cur.execute(f"""
+                    {state_sql}
+                    SELECT COUNT(*) FROM (
+                        SELECT flight_ID, status, departure_date_time FROM FlightStateSnapshots WHERE checkpoint_ID = ?
+                        EXCEPT
+                        SELECT flight_ID, status, departure_date_time FROM state
+                    )
+                """, params(None, as_of) + [checkpoint_id])
+                extra = cur.fetchone()[0]
+                if missing or extra:
+                    drift.append(f"checkpoint {checkpoint_id} ({as_of}): {missing} flight states differ from the log, {extra} not in the log")
+    return drift
+
+def rebuild_checkpoints(every_rows=None):
+    '''
+    Delete every checkpoint and make them again from the log. Returns the checkpoints made
+    '''
+    with pooled_connection() as conn:
+        cur = conn.cursor()
+        ensure_history_tables(cur)
+        cur.execute("DELETE FROM FlightStateSnapshots")
+        cur.execute("DELETE FROM FlightStateCheckpoints")
+        conn.commit()
+    return update_checkpoints(every_rows)
+
+def view_flights_as_of(timestamp, format_table):
+    """
+    Displays every flight with the status and departure time it had at the given time.
+    """
+    try:
+        rows = get_flights_as_of(timestamp)
+
+        headers = ["Flight ID", "Personal ID", "Destination ID", "Arrival Destination ID", "Departure Time", "Flight Time", "Status", "Arrival Time"]
+        if format_table:
+            format_table(rows, headers)
+
+    except ValueError as e:
+        print(e)
+    except Exception as e:
+        print(f"Failed to rebuild flights as of {timestamp}: {e}")
+
+#Entry point: show flights as of a time, or manage checkpoints, if this script is executed directly
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Flight states at any time, rebuilt from FlightStatusLog")
+    commands = parser.add_subparsers(dest="command", required=True)
+    as_of = commands.add_parser("as-of", help="show every flight as it was at a time (UTC)")
+    as_of.add_argument("timestamp", help="'YYYY-MM-DD HH:MM:SS'")
+    as_of.add_argument("--status", help="only flights with this status at the time")
+    checkpoint = commands.add_parser("checkpoint", help="add any checkpoints that are due")
+    checkpoint.add_argument("--every", type=int, default=CHECKPOINT_EVERY_ROWS, help="fewest log rows between checkpoints")
+    commands.add_parser("list", help="list checkpoints")
+    commands.add_parser("check", help="compare every checkpoint with a replay of the whole log")
+    rebuild = commands.add_parser("rebuild", help="delete and remake every checkpoint")
+    rebuild.add_argument("--every", type=int, default=CHECKPOINT_EVERY_ROWS, help="fewest log rows between checkpoints")
+    args = parser.parse_args()
+
+    if args.command == "as-of":
+        try:
+            rows = get_flights_as_of(args.timestamp, status=args.status)
+        except ValueError as e:
+            parser.error(str(e))
+        for row in rows:
+            print(" | ".join(str(cell) for cell in row))
+        print(f"{len(rows)} flights as of {args.timestamp}")
+    elif args.command in ("checkpoint", "rebuild"):
+        made = rebuild_checkpoints(args.every) if args.command == "rebuild" else update_checkpoints(args.every)
+        for checkpoint_id, checkpoint_as_of, flights in made:
+            print(f"Checkpoint {checkpoint_id}: {flights} flights as of {checkpoint_as_of}")
+        print(f"{len(made)} checkpoints made.")
+    elif args.command == "list":
+        for checkpoint_id, checkpoint_as_of, flights, log_rows, created in list_checkpoints():
+            print(f"Checkpoint {checkpoint_id}: as of {checkpoint_as_of}, {flights} flights, {log_rows} log rows since the one before (made {created})")
+    else:
+        drift = check_checkpoints()
+        for message in drift:
+            print(f"Drift - {message}")
+        if drift:
+            raise SystemExit(1)
+        print("Every checkpoint matches FlightStatusLog.")
@@ -0,0 +1,149 @@
+##File handles the secondary indexes used by the flight, pilot and destination queries
+#Without these, every lookup on Flights other than by flight_ID reads the whole table
+#Also contains a self-check which runs EXPLAIN QUERY PLAN on the "hot" queries and reports any that still fall back to a full SCAN
+
+import sys
+from db_interaction_connection import pooled_connection
+#Import function to borrow a connection to database from the connection pool
+from db_interaction_arrival_time import migrate_arrival_time
+#Import function to add the stored arrival time column to older databases
+from db_interaction_flight_queries import (
+    FLIGHTS_BY_STATUS_SQL,
+    FLIGHTS_BY_ARRIVAL_ID_SQL,
+    FLIGHTS_BY_DESTINATION_ID_SQL,
+    FLIGHTS_BY_DESTINATION_IDS_SQL,
+    FLIGHTS_BY_ARRIVAL_IDS_SQL,
+    FLIGHTS_DEPARTING_BETWEEN_SQL,
+    FLIGHTS_ARRIVING_BETWEEN_SQL,
+    STATUS_WHERE_SQL,
+    DEPARTING_BETWEEN_WHERE_SQL,
+    ARRIVING_BETWEEN_WHERE_SQL,
+    RANGE_PAGE_KEY_SQL,
+    flight_page_sql,
+) #Import the statements run by the flight lookups, for the query plan self-check
+from db_interaction_pilot_queries import PILOT_ASSIGNED_SQL, PILOT_FLIGHTS_SQL
+#Import the statements run by the pilot lookups
+from db_interaction_pilot_schedule import PILOT_CONFLICTS_SQL
+#Import the statement run by the double-booking check
+from db_interaction_destination_queries import DESTINATION_FLIGHTS_SQL
+#Import the statement run by the destination lookups
+from db_interaction_history import REPLAY_SQL
+#Import the statement used to replay the status log for past flight states
+
+#Index name -> (table, columns). flight_ID is the rowid so every Flights index already "covers" it,
+#meaning the foreign key pre-checks (which only select flight_ID) never need to read the table itself
+INDEXES = {
+    "idx_flights_status": ("Flights", ["status"]),
+    "idx_flights_destination": ("Flights", ["destination_ID"]),
+    "idx_flights_arrival_destination": ("Flights", ["arrival_destination_ID"]),
+    "idx_flights_pilot_departure": ("Flights", ["personal_ID", "departure_date_time"]),
+    "idx_flights_departure": ("Flights", ["departure_date_time"]),
+    "idx_flights_arrival": ("Flights", ["arrival_date_time"]),
+    #Lets the double-booking check read the longest flight_time (MAX) without a scan
+    "idx_flights_flight_time": ("Flights", ["flight_time"]),
+    "idx_destinations_country": ("Destinations", ["country"]),
+    #Index entries are kept in (flight_ID, log_ID) order, which lets the delay reports walk each flight's log in order without a sort
+    "idx_status_log_flight": ("FlightStatusLog", ["flight_ID"]),
+    #Lets the flight history replay only the log entries between a checkpoint and the time asked for
+    "idx_status_log_time": ("FlightStatusLog", ["log_date_time"]),
+}
+
+#Query name -> (SQL, example parameters). The statements are imported from the modules that run them, so the check follows any change
+HOT_QUERIES = {
+    "get_flights_by_status": (FLIGHTS_BY_STATUS_SQL, ("Delayed",)),
+    "get_flights_by_destination_id": (FLIGHTS_BY_DESTINATION_ID_SQL, (1,)),
+    "get_flights_by_arrival_id": (FLIGHTS_BY_ARRIVAL_ID_SQL, (1,)),
+    "get_flights_by_date": (FLIGHTS_DEPARTING_BETWEEN_SQL, ("2025-05-13", "2025-05-14")),
+    "get_flights_arriving_on": (FLIGHTS_ARRIVING_BETWEEN_SQL, ("2025-05-13", "2025-05-14")),
+    "iter_flights_by_status (all, one page)": (flight_page_sql(), (0, 500)),
+    "iter_flights_by_status (one page)": (flight_page_sql(STATUS_WHERE_SQL), (0, "Delayed", 500)),
+    "iter_flights_by_date (one page)": (
+        flight_page_sql(DEPARTING_BETWEEN_WHERE_SQL, key_sql=RANGE_PAGE_KEY_SQL),
+        (0, "2025-05-13", "2025-05-14", 500),
+    ),
+    "iter_flights_arriving_on (one page)": (
+        flight_page_sql(ARRIVING_BETWEEN_WHERE_SQL, key_sql=RANGE_PAGE_KEY_SQL),
+        (0, "2025-05-13", "2025-05-14", 500),
+    ),
+    "get_flights_by_destination_country": (FLIGHTS_BY_DESTINATION_IDS_SQL.format(placeholders="?, ?"), (1, 2)),
+    "get_flights_by_arrival_country": (FLIGHTS_BY_ARRIVAL_IDS_SQL.format(placeholders="?, ?"), (1, 2)),
+    "get_flights_for_pilot": (PILOT_FLIGHTS_SQL, (1,)),
+    "find_pilot_conflicts": (
+        PILOT_CONFLICTS_SQL,
+        (1, "2025-05-13 10:00:00", 600, "2025-05-13 10:00:00", 120, "2025-05-13 10:00:00", -1),
+    ),
+    "get_flights_as_of (replay)": (
+        REPLAY_SQL.format(log="FlightStatusLog", flights=""),
+        ("2025-05-13 00:00:00", "2025-05-13 14:00:00"),
+    ),
+    "delete_pilot_by_id (pre-check)": (PILOT_ASSIGNED_SQL, (1,)),
+    "delete_destination_by_id (pre-check)": (DESTINATION_FLIGHTS_SQL, (1, 1)),
+}
+
+def create_indexes(conn=None):
+    '''
+    Create any missing indexes (safe to run repeatedly). Uses the given connection, or borrows one from the pool
+    '''
+    if conn is None:
+        with pooled_connection() as conn:
+            create_indexes(conn)
+        return
+
+    for name, (table, columns) in INDEXES.items():
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({', '.join(columns)})")
+    conn.commit()
+
+def verify_indexes(conn=None):
+    '''
+    Return a list of problems with the index set: indexes that are missing, or that exist on the wrong table/columns
+    An empty list means all indexes are present and correct
+    '''
+    if conn is None:
+        with pooled_connection() as conn:
+            return verify_indexes(conn)
+
+    problems = []
+    for name, (table, columns) in INDEXES.items():
+        row = conn.execute("SELECT tbl_name FROM sqlite_master WHERE type = 'index' AND name = ?", (name,)).fetchone()
+        if row is None:
+            problems.append(f"{name}: missing")
+            continue
+
+        actual_columns = [info[2] for info in conn.execute(f"PRAGMA index_info({name})")]
+        if row[0].lower() != table.lower() or [c.lower() for c in actual_columns] != [c.lower() for c in columns]:
+            problems.append(f"{name}: expected {table}({', '.join(columns)}), found {row[0]}({', '.join(actual_columns)})")
+    return problems
+
+def check_query_plans(conn=None):
+    '''
+    Run EXPLAIN QUERY PLAN on each hot query and return {query name: plan lines} for every query that does a full SCAN
+    An empty dict means every hot query is served by an index
+    '''
+    if conn is None:
+        with pooled_connection() as conn:
+            return check_query_plans(conn)
+
+    failures = {}
+    for name, (sql, params) in HOT_QUERIES.items():
+        plan = [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql, params)]
+        #"SCAN (subquery-N)" reads a subquery's own result (e.g. the replay's window function), not a table
+        if any(detail.startswith("SCAN") and not detail.startswith("SCAN (") for detail in plan):
+            failures[name] = plan
+    return failures
+
+#Entry point: create indexes on an existing database and run the self-check if this script is executed directly
+if __name__ == "__main__":
+    migrate_arrival_time()  #Older databases need the arrival_date_time column before its index can be made
+    create_indexes()
+
+    problems = verify_indexes()
+    for problem in problems:
+        print(f"Index problem - {problem}")
+
+    failures = check_query_plans()
+    for name, plan in failures.items():
+        print(f"Full table scan in {name}: {'; '.join(plan)}")
+
+    if problems or failures:
+        sys.exit(1)
+    print(f"All {len(INDEXES)} indexes present and all {len(HOT_QUERIES)} hot queries use an index.")
@@ -0,0 +1,365 @@
+##File handles optional query instrumentation: timing, row counts, lock errors and a slow query log for every SQL statement
+#When switched on (FLYME_INSTRUMENT=1, or enable_instrumentation()), get_connection() makes connections using the
+#InstrumentedConnection/InstrumentedCursor classes below, which record per statement latency histograms and counters.
+#Statements slower than the threshold are written to the slow query log along with their EXPLAIN QUERY PLAN, and all counters
+#can be written to a metrics file in Prometheus text format. When switched off, plain sqlite3 connections are used, so it costs nothing
+#Waits for a lock held by another connection are counted too. SQLite's busy_timeout waits inside SQLite, where it cannot be seen,
+#so instrumented connections keep their busy_timeout but set SQLite's to 0: a statement that finds the database busy fails
+#straight away, and is then run once more with SQLite's own wait switched back on (so SQLite still decides when waiting is safe).
+#That second run is counted as a busy retry, and its time as lock wait. executemany cannot be run again (some of its rows may
+#already be applied), so it runs with SQLite's own wait switched on from the start, as it would uninstrumented, and its waits
+#are not counted separately. Switching the wait on and off around every statement would keep SQLite's busy_timeout for all of
+#them, but adds about 5 microseconds to each statement
+#Statements are grouped for the metrics with whitespace collapsed, IN (...) lists shortened and numbers replaced by "?", so
+#statements built with a varying number of values still share one label
+
+import atexit
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+
+import db_interaction_connection
+#Imported as a module (not "from ... import") as db_interaction_connection also imports this file
+
+ENABLED = os.environ.get("FLYME_INSTRUMENT", "") not in ("", "0")
+SLOW_QUERY_MS = float(os.environ.get("FLYME_SLOW_QUERY_MS", "100"))
+SLOW_QUERY_LOG = os.environ.get("FLYME_SLOW_QUERY_LOG", "slow_queries.log")
+METRICS_FILE = os.environ.get("FLYME_METRICS_FILE", "flyme_metrics.prom")
+
+#Upper bounds (seconds) of the latency histogram buckets
+BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+MAX_LABEL_LENGTH = 200  #Statements are shortened to this length when used as a metric label
+
+_metrics_lock = threading.Lock()
+_statements = {}  #Normalised SQL -> counters for that statement
+_slow_logger = logging.getLogger("flyme.slow_queries")
+_slow_logger.propagate = False
+
+_IN_LIST = re.compile(r"\bIN \((?:\?|-?\d+(?:\.\d+)?)(?:, ?(?:\?|-?\d+(?:\.\d+)?))*\)", re.IGNORECASE)
+_NUMBER = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?(?![\w.])")
+_BUSY_TIMEOUT_PRAGMA = re.compile(r"PRAGMA\s+busy_timeout\s*=\s*(\d+)$", re.IGNORECASE)
+_SQLITE_BUSY = 5
+_SQLITE_BUSY_SNAPSHOT = 517  #Another connection wrote since this transaction's snapshot, so waiting cannot help
+
+def _normalise(sql):
+    #Collapses whitespace so the same statement written on several lines is counted once, and IN lists and numbers
+    #(e.g. flight IDs or batch numbers put into the SQL) so the number of different statements stays small
+    statement = re.sub(r"\s+", " ", sql).strip()
+    statement = _IN_LIST.sub("IN (...)", statement)
+    return _NUMBER.sub("?", statement)
+
+def _counters(statement):
+    counters = _statements.get(statement)
+    if counters is None:
+        counters = {
+            "calls": 0,
+            "seconds": 0.0,
+            "buckets": [0] * len(BUCKETS),
+            "rows": 0,
+            "fetch_seconds": 0.0,
+            "errors": {},
+            "slow": 0,
+            "busy_retries": 0,
+            "lock_wait_seconds": 0.0,
+        }
+        _statements[statement] = counters
+    return counters
+
+def _error_kind(error):
+    #Groups errors so lock contention stands out from other failures
+    message = str(error).lower()
+    if "locked" in message:
+        return "locked"
+    if "busy" in message:
+        return "busy"
+    return type(error).__name__
+
+def _record(statement, seconds, error=None):
+    with _metrics_lock:
+        counters = _counters(statement)
+        counters["calls"] += 1
+        counters["seconds"] += seconds
+        for index, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                counters["buckets"][index] += 1
+                break
+        if error is not None:
+            kind = _error_kind(error)
+            counters["errors"][kind] = counters["errors"].get(kind, 0) + 1
+
+def _record_busy(statement, seconds):
+    with _metrics_lock:
+        counters = _counters(statement)
+        counters["busy_retries"] += 1
+        counters["lock_wait_seconds"] += seconds
+
+def _is_busy(error):
+    code = getattr(error, "sqlite_errorcode", None)
+    return code is not None and code & 0xFF == _SQLITE_BUSY and code != _SQLITE_BUSY_SNAPSHOT
+
+def _set_busy_timeout(conn, milliseconds):
+    #Runs on the plain sqlite3 cursor, so it is not counted itself
+    sqlite3.Connection.execute(conn, f"PRAGMA busy_timeout = {int(milliseconds)}").fetchall()
+
+def _with_sqlite_wait(conn, run):
+    #Returns run(), with SQLite's own busy wait switched on while it runs
+    if not conn.busy_timeout_ms:
+        return run()
+    _set_busy_timeout(conn, conn.busy_timeout_ms)
+    try:
+        return run()
+    finally:
+        _set_busy_timeout(conn, 0)
+
+def _retry_if_busy(conn, statement, run):
+    #Returns run(). If that finds the database locked by another connection and made no changes, it is run once more with
+    #SQLite's own busy wait switched on for it, which is counted as a busy retry and its time as lock wait
+    #(a busy statement is rolled back, so a single statement or COMMIT has always made no changes)
+    changes = conn.total_changes
+    try:
+        return run()
+    except sqlite3.OperationalError as e:
+        if not (_is_busy(e) and conn.busy_timeout_ms and conn.total_changes == changes):
+            raise
+    waited = time.perf_counter()
+    try:
+        return _with_sqlite_wait(conn, run)
+    finally:
+        _record_busy(statement, time.perf_counter() - waited)
+
+def _record_rows(statement, rows, seconds):
+    with _metrics_lock:
+        counters = _counters(statement)
+        counters["rows"] += rows
+        counters["fetch_seconds"] += seconds
+
+def _log_slow_query(conn, sql, statement, params, seconds):
+    with _metrics_lock:
+        _counters(statement)["slow"] += 1
+
+    plan = []
+    if params is not None:
+        try:
+            plan = [row[3] for row in sqlite3.Connection.execute(conn, "EXPLAIN QUERY PLAN " + sql, params)]
+        except sqlite3.Error as e:
+            plan = [f"(plan not available: {e})"]
+    _slow_logger.warning("%.1f ms | %s | params=%r | plan: %s", seconds * 1000, statement, params, "; ".join(plan) or "-")
+
+class InstrumentedCursor(sqlite3.Cursor):
+    '''
+    Cursor which times execute/executemany and counts the rows fetched
+    '''
+    _statement = None
+
+    def _timed(self, method, sql, params, many=False):
+        statement = _normalise(sql)
+        self._statement = statement
+        conn = self.connection
+        setting = _BUSY_TIMEOUT_PRAGMA.match(sql.strip()) if "busy_timeout" in sql else None
+        if setting:
+            #The connection keeps the wait for its retries, and SQLite's own is switched off
+            conn.busy_timeout_ms = int(setting.group(1))
+            sql = "PRAGMA busy_timeout = 0"
+        began = time.perf_counter()
+        try:
+            if many:
+                #Some rows may be applied before one finds the database busy, so it waits inside SQLite instead of being run again
+                result = _with_sqlite_wait(conn, lambda: method(self, sql, params))
+            else:
+                result = _retry_if_busy(conn, statement, lambda: method(self, sql, params))
+        except sqlite3.Error as e:
+            _record(statement, time.perf_counter() - began, e)
+            raise
+        seconds = time.perf_counter() - began
+        _record(statement, seconds)
+        if seconds * 1000 >= SLOW_QUERY_MS:
+            _log_slow_query(self.connection, sql, statement, None if many else params, seconds)
+        return result
+
+    def execute(self, sql, params=()):
+        return self._timed(sqlite3.Cursor.execute, sql, params)
+
+    def executemany(self, sql, seq_of_params):
+        return self._timed(sqlite3.Cursor.executemany, sql, seq_of_params, many=True)
+
+    def _fetched(self, rows, began):
+        if self._statement is not None:
+            _record_rows(self._statement, rows, time.perf_counter() - began)
+
+    def fetchone(self):
+        began = time.perf_counter()
+        row = super().fetchone()
+        self._fetched(0 if row is None else 1, began)
+        return row
+
+    def fetchmany(self, size=None):
+        began = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self._fetched(len(rows), began)
+        return rows
+
+    def fetchall(self):
+        began = time.perf_counter()
+        rows = super().fetchall()
+        self._fetched(len(rows), began)
+        return rows
+
+    def __next__(self):
+        began = time.perf_counter()
+        row = super().__next__()
+        self._fetched(1, began)
+        return row
+
+class InstrumentedConnection(sqlite3.Connection):
+    '''
+    Connection whose cursors (including those made by the execute shortcuts) are InstrumentedCursors
+    busy_timeout_ms is how long a busy statement's retry, or an executemany, may wait for the lock (SQLite's own busy_timeout is
+    kept at 0 otherwise)
+    '''
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.busy_timeout_ms = sqlite3.Connection.execute(self, "PRAGMA busy_timeout").fetchone()[0]  #From sqlite3.connect's timeout
+        _set_busy_timeout(self, 0)
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def commit(self):
+        #A commit can also have to wait, e.g. for readers to finish without WAL
+        return _retry_if_busy(self, "COMMIT", super().commit)
+
+    def execute(self, sql, params=()):
+        return self.cursor().execute(sql, params)
+
+    def executemany(self, sql, seq_of_params):
+        return self.cursor().executemany(sql, seq_of_params)
+
+def connection_factory():
+    '''
+    Connection class get_connection() should use: instrumented when switched on, plain sqlite3 otherwise
+    '''
+    return InstrumentedConnection if ENABLED else sqlite3.Connection
+
+def _configure_slow_log(path):
+    for handler in list(_slow_logger.handlers):
+        _slow_logger.removeHandler(handler)
+        handler.close()
+    handler = logging.FileHandler(path)
+    handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+    _slow_logger.addHandler(handler)
+    _slow_logger.setLevel(logging.WARNING)
+
+def enable_instrumentation(slow_query_ms=None, slow_query_log=None, metrics_file=None):
+    '''
+    Switch instrumentation on for connections made from now on (pooled connections are replaced)
+    '''
+    global ENABLED, SLOW_QUERY_MS, SLOW_QUERY_LOG, METRICS_FILE
+    if slow_query_ms is not None:
+        SLOW_QUERY_MS = slow_query_ms
+    if slow_query_log is not None:
+        SLOW_QUERY_LOG = slow_query_log
+    if metrics_file is not None:
+        METRICS_FILE = metrics_file
+    _configure_slow_log(SLOW_QUERY_LOG)
+    ENABLED = True
+    db_interaction_connection.reset_pool()
+
+def disable_instrumentation():
+    '''
+    Switch instrumentation off for connections made from now on (pooled connections are replaced). Counters are kept
+    '''
+    global ENABLED
+    ENABLED = False
+    db_interaction_connection.reset_pool()
+
+def reset_metrics():
+    with _metrics_lock:
+        _statements.clear()
+
+def get_metrics():
+    '''
+    Returns a copy of the counters for every statement seen:
+    {statement: {calls, seconds, buckets, rows, fetch_seconds, errors, slow, busy_retries, lock_wait_seconds}}
+    '''
+    with _metrics_lock:
+        return {statement: dict(counters, buckets=list(counters["buckets"]), errors=dict(counters["errors"]))
+                for statement, counters in _statements.items()}
+
+def _label(value):
+    value = str(value)[:MAX_LABEL_LENGTH]
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+def format_metrics():
+    '''
+    Returns all counters (and connection pool statistics) in Prometheus text format
+    '''
+    metrics = get_metrics()
+    lines = [
+        "# HELP flyme_query_duration_seconds Time spent in execute/executemany per SQL statement.",
+        "# TYPE flyme_query_duration_seconds histogram",
+    ]
+    for statement, counters in metrics.items():
+        label = _label(statement)
+        cumulative = 0
+        for bound, count in zip(BUCKETS, counters["buckets"]):
+            cumulative += count
+            lines.append(f'flyme_query_duration_seconds_bucket{{statement="{label}",le="{bound}"}} {cumulative}')
+        lines.append(f'flyme_query_duration_seconds_bucket{{statement="{label}",le="+Inf"}} {counters["calls"]}')
+        lines.append(f'flyme_query_duration_seconds_sum{{statement="{label}"}} {counters["seconds"]:.9f}')
+        lines.append(f'flyme_query_duration_seconds_count{{statement="{label}"}} {counters["calls"]}')
+
+    counter_metrics = [
+        ("flyme_query_rows_total", "Rows fetched per SQL statement.", "rows"),
+        ("flyme_query_fetch_seconds_total", "Time spent fetching rows per SQL statement.", "fetch_seconds"),
+        ("flyme_slow_queries_total", "Statements slower than the slow query threshold.", "slow"),
+        ("flyme_query_busy_retries_total", "Statements that found the database locked by another connection and waited for it.", "busy_retries"),
+        ("flyme_query_lock_wait_seconds_total", "Time spent waiting for a lock held by another connection.", "lock_wait_seconds"),
+    ]
+    for name, help_text, key in counter_metrics:
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+        for statement, counters in metrics.items():
+            lines.append(f'{name}{{statement="{_label(statement)}"}} {counters[key]}')
+
+    lines += ["# HELP flyme_query_errors_total Failed statements, by kind (locked/busy are lock contention).",
+              "# TYPE flyme_query_errors_total counter"]
+    for statement, counters in metrics.items():
+        for kind, count in counters["errors"].items():
+            lines.append(f'flyme_query_errors_total{{statement="{_label(statement)}",kind="{_label(kind)}"}} {count}')
+
+    pool = db_interaction_connection.pool_stats()
+    lines += ["# HELP flyme_pool_borrows_total Connections borrowed from the pool.", "# TYPE flyme_pool_borrows_total counter",
+              f"flyme_pool_borrows_total {pool['borrows']}",
+              "# HELP flyme_pool_hits_total Borrows served by an already open connection.", "# TYPE flyme_pool_hits_total counter",
+              f"flyme_pool_hits_total {pool['hits']}",
+              "# HELP flyme_pool_wait_seconds_total Time spent waiting for a free pool slot.", "# TYPE flyme_pool_wait_seconds_total counter",
+              f"flyme_pool_wait_seconds_total {pool['wait_total_s']:.9f}",
+              "# HELP flyme_pool_in_use Connections currently borrowed.", "# TYPE flyme_pool_in_use gauge",
+              f"flyme_pool_in_use {pool['in_use']}",
+              "# HELP flyme_pool_size Maximum connections borrowed at once.", "# TYPE flyme_pool_size gauge",
+              f"flyme_pool_size {pool['size']}"]
+    return "\n".join(lines) + "\n"
+
+def write_metrics(path=None):
+    '''
+    Write all counters to the metrics file (Prometheus text format). Written to a temporary file first, so readers never see half a file
+    '''
+    path = path or METRICS_FILE
+    temporary_path = path + ".tmp"
+    with open(temporary_path, "w") as metrics_file:
+        metrics_file.write(format_metrics())
+    os.replace(temporary_path, path)
+    return path
+
+def _write_metrics_at_exit():
+    if ENABLED and _statements:
+        try:
+            write_metrics()
+        except OSError as e:
+            print(f"Failed to write query metrics: {e}")
+
+if ENABLED:
+    _configure_slow_log(SLOW_QUERY_LOG)
+atexit.register(_write_metrics_at_exit)
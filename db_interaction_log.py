@@ -1,21 +1,47 @@
 ##File handles logic associated with transferring data to FlightStatusLog from Flight table, when a "Status" is updated
 
-from db_interaction_connection import get_connection
-#Import function to start connection to database
 from datetime import datetime
+from db_interaction_delay_stats import record_delays
+#Import function to keep the FlightDelayStats summary up to date as "Delayed" entries are logged
+from db_interaction_write_queue import submit_write
+#Import function to queue a change for the single writer thread, which commits many changes together
+from db_interaction_history import checkpoint_after_write
+#Import function to add any flight state checkpoints that are due once log entries are committed
+
+#SQL insert statement for a new log entry
+LOG_INSERT_SQL = """
+    INSERT INTO FlightStatusLog (flight_ID, status, departure_date_time, log_date_time)
+    VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+"""
+
+#Runs on the writer thread inside its transaction
+def _write_log_entry(cur, flight_id, status, departure_datetime):
+    return log_flight_status(flight_id, status, departure_datetime, cur=cur)
+
+#After the writer commits
+def _log_written(flight_ids):
+    checkpoint_after_write()
+
+#Inserts a log entry into FlightStatusLog, when a flights status is updated or flight made. Returns the new log_ID
+#Without "cur", the entry is queued for the single writer thread (see db_interaction_write_queue.py), and this waits until it is committed
+#If "cur" is passed, the entry is written on that cursor as part of the caller's transaction and is NOT committed here,
+#so the Flights change and its log entry are saved together by the caller's single commit (or rolled back together).
+#Errors are then left to the caller, so a failed log entry also stops the Flights change
+def log_flight_status(flight_id, status, departure_datetime, cur=None):
+    if cur is not None:
+        record_delays(cur, [(flight_id, status, departure_datetime)])
+        cur.execute(LOG_INSERT_SQL, (flight_id, status, departure_datetime))
+        return cur.lastrowid
 
-#Inserts a log entry into FlightStatusLog, when a flights status is updated or flight made
-def log_flight_status(flight_id, status, departure_datetime):
     try:
-        conn = get_connection()
-        cur = conn.cursor()
-        sql = """
-            INSERT INTO FlightStatusLog (flight_ID, status, departure_date_time, log_date_time)
-            VALUES (?, ?, ?, CURRENT_TIMESTAMP)
-        """
-        cur.execute(sql, (flight_id, status, departure_datetime))
-        conn.commit()
+        return submit_write(_write_log_entry, flight_id, status, departure_datetime, after_commit=_log_written).result()
     except Exception as e:
         print(f"Failed to log flight status: {e}")
-    finally:
-        conn.close()
+        return None
+
+#Inserts many log entries at once on the caller's cursor, as part of the caller's transaction (not committed here)
+#"entries" is an iterable of (flight_id, status, departure_datetime) tuples
+def log_flight_statuses(cur, entries):
+    entries = list(entries)
+    record_delays(cur, entries)
+    cur.executemany(LOG_INSERT_SQL, entries)
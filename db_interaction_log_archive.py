@@ -0,0 +1,420 @@
+##File handles archiving FlightStatusLog: the log rows of flights completed long ago are moved to per month SQLite files ("cold storage")
+#FlightStatusLog only ever grows, and the delay reports and time travel replays read it. Once a flight has Arrived or been Cancelled
+#and its last log entry is older than the cutoff (ARCHIVE_AFTER_DAYS ago by default), all of its log rows are moved together to the
+#archive file for the month of that last entry, e.g. flight_management_log_2025_03.db next to the database (or in FLYME_ARCHIVE_DIR).
+#A flight's log is never split between files, so anything worked out per flight (delays) comes out the same from any one file.
+#
+#Rows are moved in batches of about ARCHIVE_BATCH_ROWS, each in its own short transaction with a pause after it, so other writers
+#are never kept waiting long. Each batch is first written to the archive file and committed there, then deleted from FlightStatusLog
+#in the same transaction that records it in the manifest: LogArchiveBatches (one row per batch) and LogArchivePartitions (per month
+#file name, row count, range of log times and newest batch). Archived rows only count once their batch is in the manifest, so a reader
+#sees every log row exactly once at any moment, and rows left behind by a batch that failed part way never count (they are cleared next time).
+#
+#log_partitions() makes the log readable on a connection across FlightStatusLog and just the archive files holding rows in a time
+#range, attaching them only when the range needs them, so queries written against "{log}" work unchanged on the whole history.
+#Archived flights are not expected to change again. A status change to one starts a fresh log for it in FlightStatusLog, which
+#the FlightDelayStats summary does not link to the archived entries ("python db_interaction_delay_stats.py --check" shows this)
+#
+#Example: python db_interaction_log_archive.py archive --before 2025-01-01
+
+import argparse
+import os
+import sqlite3
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from itertools import groupby
+
+import db_interaction_connection
+#Imported as a module (not "from ... import") so the current database path is used, as reset_pool can change it
+from db_interaction_connection import pooled_connection
+#Import function to borrow a connection to database from the connection pool
+
+ARCHIVE_AFTER_DAYS = 90  #Flights whose last log entry is older than this are archived when no cutoff is given
+ARCHIVE_BATCH_ROWS = 5000  #Log rows moved per transaction (whole flights, so a batch can go slightly over)
+ARCHIVE_BATCH_PAUSE_MS = 20  #Pause after each batch, so writers waiting for the lock get it
+ARCHIVE_DIR = os.environ.get("FLYME_ARCHIVE_DIR")  #Folder for archive files, None for the database's own folder
+OPEN_RETRIES = 5  #Times log_partitions tries again when a batch is archived while it is opening the files
+
+LOG_COLUMNS = "log_ID, flight_ID, status, departure_date_time, log_date_time"
+COMPLETED_STATUSES = ("Arrived", "Cancelled")
+
+#Manifest, in the main database
+CREATE_TABLES_SQL = [
+    """
+    CREATE TABLE IF NOT EXISTS LogArchivePartitions (
+        month TEXT PRIMARY KEY,
+        file_name TEXT NOT NULL,
+        flights INTEGER NOT NULL DEFAULT 0,
+        log_rows INTEGER NOT NULL DEFAULT 0,
+        first_log_date_time DATETIME,
+        last_log_date_time DATETIME,
+        last_batch_ID INTEGER NOT NULL DEFAULT 0,
+        updated DATETIME DEFAULT CURRENT_TIMESTAMP
+        );
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS LogArchiveBatches (
+        batch_ID INTEGER PRIMARY KEY,
+        month TEXT NOT NULL,
+        flights INTEGER NOT NULL,
+        log_rows INTEGER NOT NULL,
+        archived DATETIME DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (month) REFERENCES LogArchivePartitions(month)
+        );
+    """,
+]
+
+#Log table in each archive file: FlightStatusLog's columns, plus the batch that moved the row
+ARCHIVE_FILE_SQL = [
+    """
+    CREATE TABLE IF NOT EXISTS FlightStatusLog (
+        log_ID INTEGER PRIMARY KEY,
+        flight_ID INTEGER NOT NULL,
+        status TEXT,
+        departure_date_time DATETIME NOT NULL,
+        log_date_time DATETIME,
+        batch_ID INTEGER NOT NULL
+        );
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_archive_log_flight ON FlightStatusLog(flight_ID)",
+    "CREATE INDEX IF NOT EXISTS idx_archive_log_time ON FlightStatusLog(log_date_time)",
+    "CREATE INDEX IF NOT EXISTS idx_archive_log_batch ON FlightStatusLog(batch_ID)",
+]
+
+def ensure_archive_tables(cur):
+    '''
+    Make sure the manifest tables exist (older databases do not have them)
+    '''
+    for sql in CREATE_TABLES_SQL:
+        cur.execute(sql)
+
+def parse_log_time(value, end_of_day=False):
+    '''
+    Turns "YYYY-MM-DD HH:MM:SS", or "YYYY-MM-DD" (the start of that day, or its last second with end_of_day), into a log_date_time string
+    Raises ValueError for anything else
+    '''
+    try:
+        return datetime.strptime(value, "%Y-%m-%d %H:%M:%S").strftime("%Y-%m-%d %H:%M:%S")
+    except (TypeError, ValueError):
+        pass
+    try:
+        day = datetime.strptime(value, "%Y-%m-%d")
+    except (TypeError, ValueError):
+        raise ValueError(f"'{value}' is not a date (YYYY-MM-DD) or time (YYYY-MM-DD HH:MM:SS)")
+    return day.strftime("%Y-%m-%d 23:59:59" if end_of_day else "%Y-%m-%d 00:00:00")
+
+def _placeholders(values):
+    return ", ".join("?" for _ in values)
+
+def _file_name(month):
+    stem = os.path.splitext(os.path.basename(db_interaction_connection.DB_PATH))[0]
+    return f"{stem}_log_{month.replace('-', '_')}.db"
+
+def _archive_path(file_name):
+    folder = ARCHIVE_DIR or os.path.dirname(os.path.abspath(db_interaction_connection.DB_PATH))
+    return os.path.join(folder, file_name)
+
+def _schema(month):
+    #Name the month's file is attached under
+    return f"archive_{month.replace('-', '_')}"
+
+def _archive_version(cur):
+    #Newest batch_ID in the manifest (0 if nothing has been archived). Changes whenever rows move
+    cur.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'LogArchiveBatches'")
+    if cur.fetchone() is None:
+        return 0
+    return cur.execute("SELECT COALESCE(MAX(batch_ID), 0) FROM LogArchiveBatches").fetchone()[0]
+
+def _partitions(cur, start, end):
+    #(month, file_name, last_batch_ID) of every archive file with rows logged between start and end (None for no limit)
+    cur.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'LogArchivePartitions'")
+    if cur.fetchone() is None:
+        return []
+    cur.execute("""
+        SELECT month, file_name, last_batch_ID FROM LogArchivePartitions
+        WHERE log_rows > 0 AND (? IS NULL OR last_log_date_time >= ?) AND (? IS NULL OR first_log_date_time <= ?)
+        ORDER BY month
+    """, (start, start, end, end))
+    return cur.fetchall()
+
+def _partition_sql(month, last_batch):
+    #The archived rows of one month that count: those from batches up to the month's newest one in the manifest. The unary "+"
+    #keeps SQLite from using the batch index for this, so conditions on log_date_time or flight_ID use their own indexes
+    return f"SELECT {LOG_COLUMNS} FROM {_schema(month)}.FlightStatusLog WHERE +batch_ID <= {int(last_batch)}"
+
+def _open_partitions(conn, partitions):
+    #Attaches the archive files and returns SQL for the whole log. SQLite can only attach so many files at once, so if there are
+    #more the oldest are copied into a temporary table instead, one file at a time (keeping one place free to attach them)
+    if not partitions:
+        return "FlightStatusLog"
+    for month, file_name, _ in partitions:
+        if not os.path.exists(_archive_path(file_name)):
+            raise FileNotFoundError(f"Archive file for {month} not found: {_archive_path(file_name)}")
+
+    limit = conn.getlimit(sqlite3.SQLITE_LIMIT_ATTACHED)
+    staged = partitions[:-(limit - 1)] if len(partitions) > limit else []
+    branches = [f"SELECT {LOG_COLUMNS} FROM main.FlightStatusLog"]
+    if staged:
+        conn.execute(f"CREATE TEMP TABLE ArchivedStatusLog ({LOG_COLUMNS})")
+        for month, file_name, last_batch in staged:
+            conn.execute(f"ATTACH DATABASE ? AS {_schema(month)}", (_archive_path(file_name),))
+            conn.execute(f"INSERT INTO temp.ArchivedStatusLog {_partition_sql(month, last_batch)}")
+            conn.commit()
+            conn.execute(f"DETACH DATABASE {_schema(month)}")
+        branches.append(f"SELECT {LOG_COLUMNS} FROM temp.ArchivedStatusLog")
+    for month, file_name, last_batch in partitions[len(staged):]:
+        conn.execute(f"ATTACH DATABASE ? AS {_schema(month)}", (_archive_path(file_name),))
+        branches.append(_partition_sql(month, last_batch))
+    return "(" + " UNION ALL ".join(branches) + ")"
+
+def _close_partitions(conn):
+    #Detaches every archive file and drops the temporary copy. One still held by an unfinished statement is left for next time
+    for _, name, _ in conn.execute("PRAGMA database_list").fetchall():
+        if name.startswith("archive_"):
+            try:
+                conn.execute(f"DETACH DATABASE {name}")
+            except sqlite3.OperationalError:
+                pass
+    try:
+        conn.execute("DROP TABLE IF EXISTS temp.ArchivedStatusLog")
+    except sqlite3.OperationalError:
+        pass
+
+@contextmanager
+def log_partitions(conn, start=None, end=None, begin="BEGIN"):
+    '''
+    Make the status log rows logged between start and end (log_date_time strings, None for no limit) readable on conn, attaching
+    only the archive files that hold some. Yields SQL to use in place of FlightStatusLog: "FlightStatusLog" itself when no archive
+    file is needed, otherwise a subquery with the same columns. Filters on log_date_time or flight_ID still use each file's indexes
+    The block runs in one transaction, started with "begin" ("BEGIN IMMEDIATE" to write), so the hot table and the archive are read
+    as of the same moment. Commit inside the block to keep changes; anything left is rolled back when it ends
+    '''
+    cur = conn.cursor()
+    try:
+        for _ in range(OPEN_RETRIES):
+            _close_partitions(conn)
+            version = _archive_version(cur)
+            log = _open_partitions(conn, _partitions(cur, start, end))
+            cur.execute(begin)
+            if _archive_version(cur) == version:
+                break
+            conn.rollback()  #A batch was archived meanwhile, so the files needed may have changed
+        else:
+            raise sqlite3.OperationalError(f"log archive changed {OPEN_RETRIES} times while it was being opened")
+    except BaseException:
+        if conn.in_transaction:
+            conn.rollback()
+        _close_partitions(conn)
+        raise
+
+    try:
+        yield log
+    finally:
+        if conn.in_transaction:
+            conn.rollback()
+        _close_partitions(conn)
+
+def _cutoff(cur, before):
+    if before is not None:
+        return parse_log_time(before)
+    return cur.execute("SELECT DATETIME('now', ?)", (f"-{int(ARCHIVE_AFTER_DAYS)} days",)).fetchone()[0]
+
+def _batches(candidates, batch_rows):
+    #Groups (month, flight_ID, log rows) candidates into (month, flight IDs) batches of about batch_rows log rows, one month each
+    for month, flights in groupby(candidates, key=lambda candidate: candidate[0]):
+        batch, rows = [], 0
+        for _, flight_id, log_rows in flights:
+            if batch and rows + log_rows > batch_rows:
+                yield month, batch
+                batch, rows = [], 0
+            batch.append(flight_id)
+            rows += log_rows
+        if batch:
+            yield month, batch
+
+def _archive_batch(conn, month, flight_ids, before):
+    #Moves one batch of flights' log rows to the month's archive file. Returns (flights, log rows) moved
+    #Archiving bypasses the write queue on purpose (see db_interaction_write_queue.py), one short transaction per batch
+    cur = conn.cursor()
+    cur.execute("BEGIN IMMEDIATE")
+    #Checked again now the write lock is held: only flights still completed, with nothing newer logged since they were picked
+    cur.execute(f"""
+        WITH last_logged AS (
+            SELECT flight_ID, MAX(log_date_time) AS last_log FROM FlightStatusLog
+            WHERE flight_ID IN ({_placeholders(flight_ids)})
+            GROUP BY flight_ID
+        )
+        SELECT l.log_ID, l.flight_ID, l.status, l.departure_date_time, l.log_date_time
+        FROM last_logged t
+        JOIN Flights f ON f.flight_ID = t.flight_ID
+        JOIN FlightStatusLog l ON l.flight_ID = t.flight_ID
+        WHERE f.status IN ({_placeholders(COMPLETED_STATUSES)}) AND t.last_log < ? AND STRFTIME('%Y-%m', t.last_log) = ?
+        ORDER BY l.log_ID
+    """, (*flight_ids, *COMPLETED_STATUSES, before, month))
+    rows = cur.fetchall()
+    if not rows:
+        conn.rollback()
+        return 0, 0
+
+    batch_id = cur.execute("SELECT COALESCE(MAX(batch_ID), 0) + 1 FROM LogArchiveBatches").fetchone()[0]
+    newest_batch = cur.execute("SELECT COALESCE(MAX(last_batch_ID), 0) FROM LogArchivePartitions WHERE month = ?", (month,)).fetchone()[0]
+    file_name = _file_name(month)
+
+    #The archive file is written and committed first, with a full sync. Rows from batches after the month's newest recorded one were
+    #left by a batch that failed before reaching the manifest, so they never counted and are cleared here
+    archive = sqlite3.connect(_archive_path(file_name))
+    try:
+        archive.execute("PRAGMA journal_mode = WAL").fetchall()
+        archive.execute("PRAGMA synchronous = FULL")
+        for sql in ARCHIVE_FILE_SQL:
+            archive.execute(sql)
+        archive.execute("DELETE FROM FlightStatusLog WHERE batch_ID > ?", (newest_batch,))
+        archive.executemany(f"INSERT INTO FlightStatusLog ({LOG_COLUMNS}, batch_ID) VALUES (?, ?, ?, ?, ?, ?)",
+                            [(*row, batch_id) for row in rows])
+        archive.commit()
+    finally:
+        archive.close()
+
+    #Then the rows leave FlightStatusLog in the same transaction that adds the batch to the manifest, which is what makes them count
+    flights = len({row[1] for row in rows})
+    log_times = [row[4] for row in rows if row[4] is not None]
+    cur.executemany("DELETE FROM FlightStatusLog WHERE log_ID = ?", [(row[0],) for row in rows])
+    cur.execute("INSERT INTO LogArchiveBatches (batch_ID, month, flights, log_rows) VALUES (?, ?, ?, ?)", (batch_id, month, flights, len(rows)))
+    cur.execute("""
+        INSERT INTO LogArchivePartitions (month, file_name, flights, log_rows, first_log_date_time, last_log_date_time, last_batch_ID)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(month) DO UPDATE SET
+            flights = flights + excluded.flights,
+            log_rows = log_rows + excluded.log_rows,
+            first_log_date_time = MIN(first_log_date_time, excluded.first_log_date_time),
+            last_log_date_time = MAX(last_log_date_time, excluded.last_log_date_time),
+            last_batch_ID = excluded.last_batch_ID,
+            updated = CURRENT_TIMESTAMP
+    """, (month, file_name, flights, len(rows), min(log_times), max(log_times), batch_id))
+    conn.commit()
+    return flights, len(rows)
+
+def archive_log(before=None, batch_rows=None, max_batches=None):
+    '''
+    Move the log rows of every flight that has Arrived or been Cancelled, with its last log entry before "before" (a date or time,
+    default ARCHIVE_AFTER_DAYS ago), to the archive file for the month of that entry, batch_rows (default ARCHIVE_BATCH_ROWS) at a time
+    Stops after max_batches batches if given (the rest are moved next time). Returns {"batches", "flights", "log_rows", "months"}
+    Raises ValueError for a badly formatted cutoff
+    '''
+    batch_rows = batch_rows or ARCHIVE_BATCH_ROWS
+    moved = {"batches": 0, "flights": 0, "log_rows": 0, "months": []}
+    with pooled_connection() as conn:
+        cur = conn.cursor()
+        ensure_archive_tables(cur)
+        conn.commit()
+        before = _cutoff(cur, before)
+
+        #Candidates are found once, without the write lock (each batch checks its flights again before moving them)
+        cur.execute(f"""
+            SELECT STRFTIME('%Y-%m', MAX(l.log_date_time)), l.flight_ID, COUNT(*)
+            FROM Flights f
+            JOIN FlightStatusLog l ON l.flight_ID = f.flight_ID
+            WHERE f.status IN ({_placeholders(COMPLETED_STATUSES)})
+            GROUP BY l.flight_ID
+            HAVING MAX(l.log_date_time) < ?
+            ORDER BY 1, 2
+        """, (*COMPLETED_STATUSES, before))
+        candidates = cur.fetchall()
+
+        for month, flight_ids in _batches(candidates, batch_rows):
+            if max_batches is not None and moved["batches"] >= max_batches:
+                break
+            flights, log_rows = _archive_batch(conn, month, flight_ids, before)
+            if log_rows:
+                moved["batches"] += 1
+                moved["flights"] += flights
+                moved["log_rows"] += log_rows
+                if month not in moved["months"]:
+                    moved["months"].append(month)
+            time.sleep(ARCHIVE_BATCH_PAUSE_MS / 1000)
+    return moved
+
+def list_partitions():
+    '''
+    Returns the manifest: rows of (month, file_name, flights, log rows, first log time, last log time, batches, updated)
+    '''
+    with pooled_connection() as conn:
+        cur = conn.cursor()
+        ensure_archive_tables(cur)
+        cur.execute("""
+            SELECT p.month, p.file_name, p.flights, p.log_rows, p.first_log_date_time, p.last_log_date_time,
+                   (SELECT COUNT(*) FROM LogArchiveBatches b WHERE b.month = p.month), p.updated
+            FROM LogArchivePartitions p
+            ORDER BY p.month
+        """)
+        rows = cur.fetchall()
+        conn.commit()  #Keeps the tables if ensure_archive_tables had to create them
+    return rows
+
+def check_archive():
+    '''
+    Compare the manifest with the archive files (row counts, log time ranges, and no flight both archived and in FlightStatusLog)
+    Returns a list of problems found (empty if the manifest matches the files)
+    '''
+    problems = []
+    with pooled_connection() as conn:
+        cur = conn.cursor()
+        if not _archive_version(cur):
+            return problems
+        partitions = cur.execute("""
+            SELECT month, file_name, log_rows, first_log_date_time, last_log_date_time, last_batch_ID FROM LogArchivePartitions ORDER BY month
+        """).fetchall()
+        for month, file_name, log_rows, first, last, last_batch in partitions:
+            if not os.path.exists(_archive_path(file_name)):
+                problems.append(f"{month}: {_archive_path(file_name)} is missing")
+                continue
+            cur.execute(f"ATTACH DATABASE ? AS {_schema(month)}", (_archive_path(file_name),))
+            try:
+                cur.execute(f"SELECT COUNT(*), MIN(log_date_time), MAX(log_date_time) FROM ({_partition_sql(month, last_batch)})")
+                count, first_found, last_found = cur.fetchone()
+                if count != log_rows:
+                    problems.append(f"{month}: manifest lists {log_rows} log rows, {file_name} has {count}")
+                if (first_found, last_found) != (first, last):
+                    problems.append(f"{month}: manifest gives log times {first} to {last}, {file_name} has {first_found} to {last_found}")
+                cur.execute(f"""
+                    SELECT COUNT(DISTINCT flight_ID) FROM ({_partition_sql(month, last_batch)})
+                    WHERE flight_ID IN (SELECT flight_ID FROM main.FlightStatusLog)
+                """)
+                both = cur.fetchone()[0]
+                if both:
+                    problems.append(f"{month}: {both} archived flights have been logged in FlightStatusLog again since")
+            finally:
+                cur.execute(f"DETACH DATABASE {_schema(month)}")
+    return problems
+
+#Entry point: archive old log rows, or show or check the manifest, if this script is executed directly
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Move old FlightStatusLog rows to per month archive files")
+    commands = parser.add_subparsers(dest="command", required=True)
+    archive = commands.add_parser("archive", help="archive the log of flights completed before a cutoff")
+    archive.add_argument("--before", help=f"cutoff date or time (default {ARCHIVE_AFTER_DAYS} days ago)")
+    archive.add_argument("--batch-rows", type=int, default=ARCHIVE_BATCH_ROWS, help="log rows moved per transaction")
+    archive.add_argument("--max-batches", type=int, help="stop after this many batches")
+    commands.add_parser("list", help="show the manifest of archive files")
+    commands.add_parser("check", help="compare the manifest with the archive files")
+    args = parser.parse_args()
+
+    if args.command == "archive":
+        started = time.perf_counter()
+        try:
+            moved = archive_log(args.before, args.batch_rows, args.max_batches)
+        except ValueError as e:
+            parser.error(str(e))
+        print(f"Archived {moved['log_rows']} log rows of {moved['flights']} flights in {moved['batches']} batches "
+              f"({time.perf_counter() - started:.1f}s), months: {', '.join(moved['months']) or 'none'}")
+    elif args.command == "list":
+        for month, file_name, flights, log_rows, first, last, batches, updated in list_partitions():
+            print(f"{month}: {file_name}, {log_rows} log rows of {flights} flights logged {first} to {last} ({batches} batches, updated {updated})")
+    else:
+        problems = check_archive()
+        for message in problems:
+            print(f"Drift - {message}")
+        if problems:
+            raise SystemExit(1)
+        print("The archive manifest matches the archive files.")
@@ -1,33 +1,118 @@
 ##File contains logic for functiosn related to extracting data from FlightStatusLog
 #Contains logic for viewing which Flights were "Delayed" and average time of delay in minutes
+#Delays are worked out in one ordered pass over each flight's log (LAG window function, see db_interaction_delay_stats.py), rather than
+#joining the log to itself: each "Delayed" entry is compared with the entry logged just before it for the same flight, so a flight
+#delayed twice gives exactly two delays, and the cost grows in line with the size of the log rather than with its square
+#The average delay is read from the FlightDelayStats summary, which is kept up to date as delays are logged
+#Reports can be limited to delays logged in a time range. Log rows moved to the archive files (db_interaction_log_archive.py) are
+#included, but a file is only opened when the range reaches into its month, so a report on recent delays reads FlightStatusLog alone
 
-from db_interaction_connection import get_connection
-#Import function to start connection to database
+from db_interaction_connection import pooled_connection
+#Import function to borrow a connection to database from the connection pool
+from db_interaction_delay_stats import (
+    DELAY_INTERVALS_SQL,
+    get_delay_stats,
+) #Import delay interval SQL and summary lookup
+from db_interaction_log_archive import log_partitions, parse_log_time
+#Import function to read the status log across FlightStatusLog and just the archive files a time range needs
+
+#SQL for every delay event: flight, departure time before the delay, delayed departure time, delay and running total of delay for that flight.
+#"{log}" is replaced with the log to read, and "{when}" with a condition on when the delay was logged (the running total still counts earlier delays)
+DELAY_EVENTS_SQL = f"""
+    SELECT flight_ID, previous_departure, delayed_departure, delay_minutes, cumulative_delay_minutes FROM (
+        SELECT
+            log_ID,
+            flight_ID,
+            log_date_time,
+            previous_departure,
+            delayed_departure,
+            ROUND(delay_minutes, 1) AS delay_minutes,
+            ROUND(SUM(delay_minutes) OVER (PARTITION BY flight_ID ORDER BY log_ID), 1) AS cumulative_delay_minutes
+        FROM ({DELAY_INTERVALS_SQL})
+    )
+    {{when}}
+    ORDER BY flight_ID, log_ID
+"""
+
+#Only the flights with a "Delayed" entry logged in the time range, found through the log_date_time index. A flight's whole log is
+#still read, as each delay is measured from the entry before it
+DELAYED_IN_RANGE_SQL = """
+    (SELECT * FROM {log} WHERE flight_ID IN (
+        SELECT flight_ID FROM {log} WHERE status = 'Delayed' AND log_date_time BETWEEN ? AND ?
+    ))
+"""
+
+def _time_range(start, end):
+    #(first, last) log_date_time of a time range, or None for all time. Raises ValueError for a bad date or time
+    if start is None and end is None:
+        return None
+    first = parse_log_time(start) if start is not None else "0000-00-00 00:00:00"
+    last = parse_log_time(end, end_of_day=True) if end is not None else "9999-12-31 23:59:59"
+    if first > last:
+        raise ValueError(f"The start of the time range ({start}) is after its end ({end})")
+    return first, last
+
+def _delay_query(conn, sql, start, end):
+    #Yields the rows of a query over the delay intervals logged from start to end (e.g. "2025-06-01", None for no limit), reading the
+    #archive files only when the range reaches into them. sql has "{log}" for the log and "{when}" for the condition on log_date_time
+    time_range = _time_range(start, end)
+    with log_partitions(conn, *(time_range or (None, None))) as log:
+        if time_range is None:
+            cur = conn.execute(sql.format(log=log, when=""))
+        else:
+            cur = conn.execute(sql.format(log=DELAYED_IN_RANGE_SQL.format(log=log), when="WHERE log_date_time BETWEEN ? AND ?"), time_range * 2)
+        try:
+            yield from cur
+        finally:
+            cur.close()
+
+def iter_delay_events(start=None, end=None):
+    '''
+    Yields one row per "Delayed" log entry, oldest flight first: (flight_ID, previous departure, delayed departure, delay minutes, cumulative delay minutes)
+    Optionally only delays logged from start to end (dates or times, a date on its own covering the whole day)
+    Raises ValueError for a bad date or time
+    '''
+    with pooled_connection() as conn:
+        yield from _delay_query(conn, DELAY_EVENTS_SQL, start, end)
+
+def get_delay_events(start=None, end=None):
+    '''
+    Returns one row per "Delayed" log entry: (flight_ID, previous departure, delayed departure, delay minutes, cumulative delay minutes)
+    Optionally only delays logged from start to end (dates or times)
+    '''
+    return list(iter_delay_events(start, end))
+
+def get_total_delay_by_flight(start=None, end=None):
+    '''
+    Returns one row per delayed flight: (flight_ID, number of delays, total delay minutes)
+    Optionally only counting delays logged from start to end (dates or times)
+    '''
+    with pooled_connection() as conn:
+        return list(_delay_query(conn, f"""
+            SELECT flight_ID, COUNT(*), ROUND(SUM(delay_minutes), 1)
+            FROM ({DELAY_INTERVALS_SQL})
+            {{when}}
+            GROUP BY flight_ID
+            ORDER BY flight_ID
+        """, start, end))
+
+def get_average_delay_duration(start=None, end=None):
+    '''
+    Returns the average delay in minutes across all delay events (or those logged from start to end), recomputed from the raw log,
+    or None if there are none
+    '''
+    with pooled_connection() as conn:
+        rows = list(_delay_query(conn, f"SELECT ROUND(AVG(delay_minutes), 1) FROM ({DELAY_INTERVALS_SQL}) {{when}}", start, end))
+    return rows[0][0] if rows else None
 
 def view_delayed_flights_with_duration(format_table):
     """
-    Displays flights that were delayed, including original and new departure times and delay duration.
+    Displays flights that were delayed, including departure times before and after each delay, delay duration and total delay so far.
     """
     try:
-        conn = get_connection()
-        cur = conn.cursor()
-
-         #SQL command. Converts time to JULIANDAY to allow arithmetic calculation (length of time for delay from difference in original and updated departure time)
-        cur.execute("""
-            SELECT 
-                nf.flight_ID,
-                nf.departure_date_time AS original_departure,
-                df.departure_date_time AS delayed_departure,
-                ROUND((JULIANDAY(df.departure_date_time) - JULIANDAY(nf.departure_date_time)) * 1440, 1) AS delay_minutes
-            FROM FlightStatusLog nf
-            JOIN FlightStatusLog df ON nf.flight_ID = df.flight_ID
-            WHERE nf.status = 'NotDeparted' AND df.status = 'Delayed'
-        """)
-
-        rows = cur.fetchall()
-        conn.close()
-
-        headers = ["Flight ID", "Original Departure", "Delayed Departure", "Delay (min)"]
+        rows = get_delay_events()
+
+        headers = ["Flight ID", "Previous Departure", "Delayed Departure", "Delay (min)", "Total Delay (min)"]
         if format_table:
             format_table(rows, headers)
 
@@ -36,28 +121,15 @@ def view_delayed_flights_with_duration(format_table):
 
 def view_average_delay_duration():
     """
-    Calculates and displays the average delay time across all delayed flights.
+    Displays the average delay time across all delayed flights, from the FlightDelayStats summary.
     """
     try:
-        conn = get_connection()
-        cur = conn.cursor()
-
-        #SQL command. Converts time to JULIANDAY to allow arithmetic calculation (length of time for delay from difference in original and updated departure time)
-        cur.execute("""
-            SELECT 
-                ROUND(AVG((JULIANDAY(df.departure_date_time) - JULIANDAY(nf.departure_date_time)) * 1440), 1) AS average_delay_minutes
-            FROM FlightStatusLog nf
-            JOIN FlightStatusLog df ON nf.flight_ID = df.flight_ID
-            WHERE nf.status = 'NotDeparted' AND df.status = 'Delayed'
-        """)
-
-        result = cur.fetchone()
-        conn.close()
-
-        if result and result[0] is not None:
-            print(f"Average delay across flights: {result[0]} minutes")
+        stats = get_delay_stats()
+
+        if stats is not None:
+            print(f"Average delay across flights: {round(stats['average_minutes'], 1)} minutes ({stats['count']} delays)")
         else:
             print("No delayed flights found to calculate average.")
 
     except Exception as e:
-        print(f"Failed to calculate average delay duration: {e}")
\ No newline at end of file
+        print(f"Failed to calculate average delay duration: {e}")
@@ -1,7 +1,53 @@
 ##File contains logic associated with inputting/retrievign data from Pilots table using SQL commands
 
-from db_interaction_connection import get_connection
-#Import function to start connection to database
+from db_interaction_connection import pooled_connection
+#Import function to borrow a connection to database from the connection pool
+from db_interaction_flight_queries import invalidate_flight_cache
+#Import function to clear cached flight lookups after a flight is changed
+from db_interaction_pilot_schedule import find_pilot_conflicts, describe_conflicts
+#Import functions to stop a pilot being booked on overlapping flights
+from db_interaction_write_queue import submit_write
+#Import function to queue a change for the single writer thread, which commits many changes together
+from db_interaction_destination_cache import get_destination_country
+#Import function to look up a destination's country without joining Destinations
+
+#Any flight the pilot is assigned to (checked before deleting a pilot)
+PILOT_ASSIGNED_SQL = "SELECT flight_ID FROM Flights WHERE personal_ID = ?"
+
+#Flights assigned to a pilot, with the stored arrival time
+PILOT_FLIGHTS_SQL = """
+    SELECT
+        p.personal_ID,
+        p.first_name,
+        f.flight_ID,
+        f.departure_date_time,
+        f.destination_ID,
+        f.arrival_destination_ID,
+        f.arrival_date_time
+    FROM Pilots p
+    JOIN Flights f ON p.personal_ID = f.personal_ID
+    WHERE p.personal_ID = ?
+"""
+
+def _write_pilot_delete(cur, _, pilot_id):
+    #Runs on the writer thread inside its transaction. Returns the message to show
+    #Check if pilot is assigned to any flights
+    cur.execute(PILOT_ASSIGNED_SQL, (pilot_id,))
+    flight = cur.fetchone()
+    if flight:
+        return f"Cannot delete pilot: assigned to Flight ID {flight[0]}"
+
+    #If pilot not assigned, delete
+    cur.execute("DELETE FROM Pilots WHERE personal_ID = ?", (pilot_id,))
+    return f"Pilot ID {pilot_id} deleted successfully."
+
+def _write_new_pilot(cur, _, first_name, surname, dob, email):
+    #Runs on the writer thread inside its transaction. Returns the new personal_ID
+    cur.execute("""
+        INSERT INTO Pilots (first_name, surname, DOB, email)
+        VALUES (?, ?, ?, ?)
+    """, (first_name, surname, dob, email))
+    return cur.lastrowid
 
 def delete_pilot_by_id(pilot_id):
     '''
@@ -9,49 +55,40 @@ def delete_pilot_by_id(pilot_id):
     Note SQL restrictions prevent delete if personal_ID assigned to flight, however restriction also enforced in Python below
     '''
     try:
-        conn = get_connection()
-        cur = conn.cursor()
-
-        #Check if pilot is assigned to any flights
-        cur.execute("SELECT flight_ID FROM Flights WHERE personal_ID = ?", (pilot_id,))
-        flight = cur.fetchone()
-
-        if flight:
-            print(f"Cannot delete pilot: assigned to Flight ID {flight[0]}")
-            return
-
-        #If pilot not assigned, delete
-        cur.execute("DELETE FROM Pilots WHERE personal_ID = ?", (pilot_id,))
-        conn.commit()
-        print(f"Pilot ID {pilot_id} deleted successfully.")
+        #Checked and deleted by the writer thread, so no flight can be given to the pilot in between
+        print(submit_write(_write_pilot_delete, None, pilot_id).result())
 
     except Exception as e:
         print(f"Error while deleting pilot: {e}")
-    finally:
-        conn.close()
 
-def view_all_pilots(format_table):
+def get_all_pilots():
     '''
-    View all entries in Pilot table along with all associated meta-data
+    Returns every entry in Pilot table as rows of (personal_ID, first_name, surname, DOB, email, ...), with emails completed with @flyme.com
     '''
-    try:
-        conn = get_connection()
+    with pooled_connection() as conn:
         cur = conn.cursor()
         cur.execute("SELECT * FROM Pilots")#SQL statements, view all entries in Pilot table
         rows = cur.fetchall()
-        conn.close()
 
-        if not rows: #Error handling if table empty
+    formatted_rows = []
+    for row in rows: #Adds @flyme.com to end of email, remove unnessecary characters from database storage
+        row = list(row)
+        row[4] = f"{row[4]}@flyme.com" if "@" not in row[4] else row[4]
+        formatted_rows.append(row)
+    return formatted_rows
+
+def view_all_pilots(format_table):
+    '''
+    View all entries in Pilot table along with all associated meta-data
+    '''
+    try:
+        formatted_rows = get_all_pilots()
+
+        if not formatted_rows: #Error handling if table empty
             print("No pilot records found.")
             return []
 
         headers = ["Pilot ID", "First Name", "Surname", "DOB", "Email"]
-        formatted_rows = []
-
-        for row in rows: #Adds @flyme.com to end of email, remove unnessecary characters from database storage
-            row = list(row)
-            row[4] = f"{row[4]}@flyme.com" if "@" not in row[4] else row[4]
-            formatted_rows.append(row)
 
         if format_table: #Pulls formatting table requirements from Main.py
             format_table(formatted_rows, headers)
@@ -73,50 +110,74 @@ def add_new_pilot():
         dob = input("Enter date of birth (YYYY-MM-DD): ")
         email = input("Enter email: ")
 
-        conn = get_connection()
-        cur = conn.cursor() #SQL Insert statement
-        cur.execute("""
-            INSERT INTO Pilots (first_name, surname, DOB, email)
-            VALUES (?, ?, ?, ?)
-        """, (first_name, surname, dob, email))
-        conn.commit()
-        conn.close()
+        submit_write(_write_new_pilot, None, first_name, surname, dob, email).result() #Waits until the writer thread has committed it
 
         print("New pilot added successfully.")
 
     except Exception as e:
         print(f"Failed to add new pilot: {e}")
 
+def _write_pilot_assignment(cur, flight_id, new_pilot_id):
+    #Runs on the writer thread inside its transaction, which already holds the write lock, so no other flight can be booked
+    #between the check that the pilot is free and the update. Returns (success, message)
+    cur.execute("SELECT departure_date_time, flight_time FROM Flights WHERE flight_ID = ?", (flight_id,))
+    flight = cur.fetchone()
+    if flight is None:
+        return False, "No flight found with that ID."
+
+    conflicts = find_pilot_conflicts(cur, new_pilot_id, flight[0], flight[1], exclude_flight_id=flight_id)
+    if conflicts:
+        return False, f"Pilot not reassigned: {describe_conflicts(new_pilot_id, conflicts)}"
+
+    cur.execute("UPDATE Flights SET personal_ID = ? WHERE flight_ID = ?", (new_pilot_id, flight_id))
+    return True, f"Flight ID {flight_id} now assigned to Pilot ID {new_pilot_id}."
+
+def _pilots_assigned(flight_ids):
+    #After the writer commits: clear cached flight lookups
+    invalidate_flight_cache()
+
+def submit_pilot_assignment(flight_id, new_pilot_id):
+    '''
+    Queue a pilot assignment for the writer thread (see db_interaction_write_queue.py)
+    Returns a Future giving (success, message) once it is committed, refused if the pilot is already flying in an overlapping window
+    '''
+    return submit_write(_write_pilot_assignment, flight_id, new_pilot_id, after_commit=_pilots_assigned)
+
+def assign_pilot(flight_id, new_pilot_id):
+    '''
+    Assign a pilot to a flight, unless the pilot is already flying in an overlapping window
+    Returns (success, message), without printing or prompting
+    '''
+    return submit_pilot_assignment(flight_id, new_pilot_id).result()
+
 def reassign_pilot(flight_id):
     '''
     Re-assign a pilot id on a specified flight
     '''
     try:
         new_pilot_id = input("Enter new Pilot ID to assign to this flight: ")
-
-        conn = get_connection()
-        cur = conn.cursor()
-        cur.execute("UPDATE Flights SET personal_ID = ? WHERE flight_ID = ?", (new_pilot_id, flight_id))
-        conn.commit()
-        conn.close()
-
-        print(f"Flight ID {flight_id} now assigned to Pilot ID {new_pilot_id}.")
+        _, message = assign_pilot(flight_id, new_pilot_id)
+        print(message)
 
     except Exception as e:
         print(f"Failed to reassign pilot: {e}")
 
-def count_total_pilots():
+def get_pilot_count():
     '''
-    Count number of entries in Pilot table
+    Returns the number of entries in Pilot table
     '''
-    try:
-        conn = get_connection()
+    with pooled_connection() as conn:
         cur = conn.cursor()
         cur.execute("SELECT COUNT(*) FROM Pilots")
         result = cur.fetchone()
-        conn.close()
+    return result[0] if result else 0
 
-        count = result[0] if result else 0
+def count_total_pilots():
+    '''
+    Count number of entries in Pilot table
+    '''
+    try:
+        count = get_pilot_count()
         print("-" * 100)
         print(f"\nTotal number of active pilots: {count}")
         return count
@@ -126,29 +187,17 @@ def count_total_pilots():
         return 0
 
 
-def _get_flights_for_pilot(pilot_id, status_filter=None):
-    try:
-        conn = get_connection()
+def get_flights_for_pilot(pilot_id, status_filter=None):
+    '''
+    Returns the flights assigned to a pilot as rows of (pilot ID, first name, flight ID, departure, departure ID, departure country,
+    arrival ID, arrival country, arrival). Flights with status "status_filter", if given, are left out
+    '''
+    with pooled_connection() as conn:
         cur = conn.cursor()
 
-        #SQL code to retrieves flights assigned to a pilot with destination info and optional status filtering, calculating arrival time.
-        base_sql = """
-            SELECT
-                p.personal_ID,
-                p.first_name,
-                f.flight_ID,
-                f.departure_date_time,
-                d1.destination_ID,
-                d1.country,
-                f.arrival_destination_ID,
-                d2.country,
-                DATETIME(f.departure_date_time, '+' || f.flight_time || ' minutes')
-            FROM Pilots p
-            JOIN Flights f ON p.personal_ID = f.personal_ID
-            JOIN Destinations d1 ON f.destination_ID = d1.destination_ID
-            JOIN Destinations d2 ON f.arrival_destination_ID = d2.destination_ID
-            WHERE p.personal_ID = ?
-        """
+        #SQL code to retrieves flights assigned to a pilot with optional status filtering, with the stored arrival time.
+        #Departure and arrival countries are added afterwards from the cached Destinations table, rather than joining it twice
+        base_sql = PILOT_FLIGHTS_SQL
         params = [pilot_id]
         if status_filter:
             base_sql += " AND f.status != ?"
@@ -156,9 +205,16 @@ def _get_flights_for_pilot(pilot_id, status_filter=None):
 
         cur.execute(base_sql, tuple(params))
         rows = cur.fetchall()
-        conn.close()
 
-        return rows
+    return [
+        (personal_id, first_name, flight_id, departure, destination_id, get_destination_country(destination_id),
+         arrival_id, get_destination_country(arrival_id), arrival)
+        for personal_id, first_name, flight_id, departure, destination_id, arrival_id, arrival in rows
+    ]
+
+def _get_flights_for_pilot(pilot_id, status_filter=None):
+    try:
+        return get_flights_for_pilot(pilot_id, status_filter)
 
     except Exception as e:
         print(f"Failed to retrieve flight data for pilot: {e}")
@@ -0,0 +1,87 @@
+##File handles pilot double-booking checks: a pilot cannot fly two flights whose windows overlap
+#A flight's window runs from departure_date_time to departure_date_time + flight_time minutes. Cancelled flights are ignored.
+#Overlaps are found with range queries on the (personal_ID, departure_date_time) index rather than by reading all of a pilot's flights:
+#an existing flight can only overlap a new window if it departs before the window ends and no more than the longest
+#flight_time before it starts, so only that slice of the pilot's index entries is read (O(log n) plus the few flights in range).
+#The window end is the stored arrival_date_time column (see db_interaction_arrival_time.py)
+
+from db_interaction_connection import pooled_connection
+#Import function to borrow a connection to database from the connection pool
+
+LONGEST_FLIGHT_SQL = "SELECT MAX(flight_time) FROM Flights"  #Served from the flight_time index, not a scan
+
+#Pilot's flights departing after (window start - longest flight_time) and before the window end, and arriving after the window start.
+#Parameters: (personal_ID, start, longest flight_time, start, flight_time, start, flight_ID to leave out)
+PILOT_CONFLICTS_SQL = """
+    SELECT f.flight_ID, f.departure_date_time, f.arrival_date_time
+    FROM Flights f
+    WHERE f.personal_ID = ?
+      AND f.departure_date_time > DATETIME(?, '-' || ? || ' minutes')
+      AND f.departure_date_time < DATETIME(?, '+' || ? || ' minutes')
+      AND f.arrival_date_time > DATETIME(?)
+      AND f.status != 'Cancelled'
+      AND f.flight_ID != ?
+    ORDER BY f.departure_date_time
+"""
+
+def find_pilot_conflicts(cur, personal_id, departure_datetime, flight_time, exclude_flight_id=None):
+    '''
+    Returns (flight_ID, departure, arrival) for each flight of the pilot overlapping the window from departure_datetime
+    lasting flight_time minutes. exclude_flight_id is left out (the flight itself, when it is being re-assigned)
+    Runs on the caller's cursor, so the check is part of the caller's transaction
+    '''
+    cur.execute(LONGEST_FLIGHT_SQL)
+    longest = cur.fetchone()[0]
+    if longest is None:
+        return []
+
+    cur.execute(PILOT_CONFLICTS_SQL, (personal_id, departure_datetime, longest, departure_datetime, flight_time, departure_datetime,
+          -1 if exclude_flight_id is None else exclude_flight_id))
+    return cur.fetchall()
+
+def describe_conflicts(personal_id, conflicts):
+    #Message listing the flights a pilot is already booked on
+    flights = ", ".join(f"Flight ID {flight_id} ({departure} to {arrival})" for flight_id, departure, arrival in conflicts)
+    return f"Pilot ID {personal_id} is already assigned to {flights}"
+
+def get_schedule_conflicts():
+    '''
+    Returns every pair of overlapping flights flown by the same pilot, as rows of
+    (pilot ID, flight ID, departure, arrival, overlapping flight ID, its departure, its arrival)
+    Each pair is listed once, with the flight departing first on the left
+    '''
+    with pooled_connection() as conn:
+        cur = conn.cursor()
+        #For each flight, look up (through the index) the pilot's flights departing within its window
+        cur.execute("""
+            SELECT f.personal_ID, f.flight_ID, f.departure_date_time, f.arrival_date_time,
+                   g.flight_ID, g.departure_date_time, g.arrival_date_time
+            FROM Flights f
+            JOIN Flights g
+              ON g.personal_ID = f.personal_ID
+             AND g.departure_date_time >= f.departure_date_time
+             AND g.departure_date_time < f.arrival_date_time
+            WHERE g.flight_ID != f.flight_ID
+              AND (g.departure_date_time > f.departure_date_time OR g.flight_ID > f.flight_ID)
+              AND f.status != 'Cancelled' AND g.status != 'Cancelled'
+            ORDER BY f.personal_ID, f.departure_date_time, g.departure_date_time
+        """)
+        rows = cur.fetchall()
+    return rows
+
+def view_schedule_conflicts(format_table):
+    """
+    Displays every pair of overlapping flights assigned to the same pilot.
+    """
+    try:
+        rows = get_schedule_conflicts()
+        if not rows:
+            print("No pilot is double-booked.")
+            return
+
+        headers = ["Pilot ID", "Flight ID", "Departure", "Arrival", "Overlapping Flight ID", "Departure", "Arrival"]
+        if format_table:
+            format_table(rows, headers)
+
+    except Exception as e:
+        print(f"Failed to check pilot schedules: {e}")
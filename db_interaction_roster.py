@@ -0,0 +1,299 @@
+##File handles automatic pilot rostering: assigning pilots to every flight departing in a date range in one go
+#Rules for each pilot: no overlapping flights, at least MIN_REST_MINUTES between arriving and departing again, and each flight
+#must depart from where the pilot last arrived (pilots who have not flown yet can start anywhere).
+#Flights in the range that have not departed (NotDeparted/Delayed) are rostered. Other flights in the range that are not cancelled
+#(e.g. already OnRoute) are "fixed": their pilot stays as it is, and the roster works around them (a pilot is only given a flight if they
+#can still make their next fixed flight in time and place). Each pilot starts the range wherever their last flight before it arrived.
+#Flights departing after the range, up to the latest arrival in it plus MIN_REST_MINUTES, are fixed too, so a flight late in the range
+#is never given to a pilot already booked just after it. Rostering a schedule is done range by range, in date order
+#
+#Greedy allocation, one pass over the flights in departure order: pilots waiting at each destination are kept in a heap ordered by
+#the time they are free, so finding a pilot for a flight is a heap lookup rather than a search of every pilot. A flight keeps its
+#current pilot when that pilot is still free, otherwise it goes to the pilot at the departure location who has been free the longest.
+#The whole roster is worked out and applied as one item on the write queue (so inside the writer thread's transaction, holding the
+#write lock), and every change is checked again before it is committed, with find_pilot_conflicts and against the pilot's previous and
+#next flight (so flights that keep their current pilot, such as uncovered ones, are taken into account too): any that would double-book
+#a pilot, or leave them somewhere other than where their next flight departs, are put back to their current pilot and reported
+
+import argparse
+import heapq
+from datetime import datetime, timedelta
+from db_interaction_flight_queries import invalidate_flight_cache
+#Import function to clear cached flight lookups after flights are changed
+from db_interaction_pilot_schedule import find_pilot_conflicts
+#Import function to find the flights a pilot is already booked on in a window
+from db_interaction_write_queue import submit_write
+#Import function to queue a change for the single writer thread, which commits many changes together
+
+MIN_REST_MINUTES = 60  #Shortest time between a pilot arriving and departing again
+ROSTER_STATUSES = ("NotDeparted", "Delayed")  #Flights which can still be given a different pilot
+ANYWHERE = None  #Location of pilots who have not flown yet
+
+def _minutes(text):
+    #"YYYY-MM-DD HH:MM:SS" -> minutes since 0001-01-01, so times can be compared and added as plain numbers
+    moment = datetime.fromisoformat(text)
+    return (moment - datetime.min).total_seconds() / 60
+
+def _read_schedule(cur, start, end, min_rest=MIN_REST_MINUTES):
+    #Returns (pilot IDs, flights to roster, fixed flights, horizon). Flights are (departure, arrival, flight_ID, pilot, from, to) in
+    #departure order. Flights departing from end up to horizon are fixed too (see below); horizon is None if nothing is in the range
+    cur.execute("SELECT personal_ID FROM Pilots ORDER BY personal_ID")
+    pilot_ids = [row[0] for row in cur.fetchall()]
+
+    columns = "f.departure_date_time, f.arrival_date_time, f.flight_ID, f.personal_ID, f.destination_ID, f.arrival_destination_ID"
+    #Where each pilot is at the start of the range: their last flight before it (one index lookup per pilot)
+    cur.execute(f"""
+        SELECT {columns}
+        FROM Pilots p
+        JOIN Flights f ON f.flight_ID = (
+            SELECT g.flight_ID FROM Flights g
+            WHERE g.personal_ID = p.personal_ID AND g.departure_date_time < ? AND g.status != 'Cancelled'
+            ORDER BY g.departure_date_time DESC
+            LIMIT 1
+        )
+    """, (start,))
+    fixed = [(_minutes(departure), _minutes(arrival), *rest) for departure, arrival, *rest in cur.fetchall()]
+
+    #Flights in the range: those not yet departed are rostered, the rest (e.g. already OnRoute) are fixed
+    status_list = ", ".join("?" for _ in ROSTER_STATUSES)
+    cur.execute(f"""
+        SELECT {columns}, f.status IN ({status_list})
+        FROM Flights f
+        WHERE f.departure_date_time >= ? AND f.departure_date_time < ? AND f.status != 'Cancelled'
+        ORDER BY f.departure_date_time, f.flight_ID
+    """, (*ROSTER_STATUSES, start, end))
+    roster = []
+    for departure, arrival, *rest, to_roster in cur:
+        flight = (_minutes(departure), _minutes(arrival), *rest)
+        (roster if to_roster else fixed).append(flight)
+
+    #Flights just after the range which a pilot flying in it could still be busy for: those departing before the latest arrival
+    #in the range plus the rest time (the horizon). They keep their pilot, so rostered flights have to fit around them
+    cur.execute("""
+        SELECT DATETIME(MAX(arrival_date_time), '+' || ? || ' minutes') FROM Flights
+        WHERE departure_date_time >= ? AND departure_date_time < ? AND status != 'Cancelled'
+    """, (min_rest, start, end))
+    horizon = cur.fetchone()[0]
+    cur.execute(f"""
+        SELECT {columns}
+        FROM Flights f
+        WHERE f.departure_date_time >= ? AND f.departure_date_time < ? AND f.status != 'Cancelled'
+    """, (end, horizon))
+    fixed.extend((_minutes(departure), _minutes(arrival), *rest) for departure, arrival, *rest in cur.fetchall())
+
+    fixed.sort()
+    return pilot_ids, roster, fixed, horizon
+
+def plan_roster(pilot_ids, roster, fixed, min_rest=MIN_REST_MINUTES):
+    '''
+    Work out the roster without touching the database. Flights are (departure, arrival, flight_ID, current pilot, from, to) tuples,
+    with times in minutes, in departure order
+    Returns ({flight_ID: pilot ID} for the flights covered, [flight_IDs that no pilot could take])
+    '''
+    #Fixed flights per pilot, in departure order. next_fixed[p] is the position of the next one the sweep has not reached yet
+    fixed_by_pilot = {}
+    for flight in fixed:
+        fixed_by_pilot.setdefault(flight[3], []).append(flight)
+    next_fixed = {pilot_id: 0 for pilot_id in pilot_ids}
+
+    free_at = {pilot_id: float("-inf") for pilot_id in pilot_ids}  #Time each pilot can next depart
+    location = {pilot_id: ANYWHERE for pilot_id in pilot_ids}
+    version = {pilot_id: 0 for pilot_id in pilot_ids}  #Heap entries with an older version are out of date and skipped
+    waiting = {ANYWHERE: [(float("-inf"), pilot_id, 0) for pilot_id in pilot_ids]}  #Location -> heap of (free at, pilot, version)
+    heapq.heapify(waiting[ANYWHERE])
+
+    def move(pilot_id, arrival, to_id):
+        #Pilot will be at to_id, ready to fly again after resting
+        free_at[pilot_id] = arrival + min_rest
+        location[pilot_id] = to_id
+        version[pilot_id] += 1
+        heapq.heappush(waiting.setdefault(to_id, []), (free_at[pilot_id], pilot_id, version[pilot_id]))
+
+    def can_fly(pilot_id, flight):
+        #True if the pilot is free and in place for the flight, and can still make their next fixed flight afterwards
+        departure, arrival, _, _, from_id, to_id = flight
+        if free_at[pilot_id] > departure or location[pilot_id] not in (from_id, ANYWHERE):
+            return False
+        upcoming = fixed_by_pilot.get(pilot_id, ())
+        position = next_fixed[pilot_id]
+        if position < len(upcoming):
+            next_departure, _, _, _, next_from, _ = upcoming[position]
+            return arrival + min_rest <= next_departure and to_id == next_from
+        return True
+
+    def take_from(heap, flight):
+        #Pops the pilot who has been free longest and can fly the flight, putting back any passed over
+        passed_over = []
+        chosen = None
+        while heap and heap[0][0] <= flight[0]:
+            entry = heapq.heappop(heap)
+            pilot_id = entry[1]
+            if entry[2] != version[pilot_id]:
+                continue  #Out of date entry, the pilot has moved on since
+            if can_fly(pilot_id, flight):
+                chosen = pilot_id
+                break
+            passed_over.append(entry)
+        for entry in passed_over:
+            heapq.heappush(heap, entry)
+        return chosen
+
+    #Sweep through the flights to roster in departure order, applying fixed flights as the sweep reaches them
+    assignments = {}
+    uncovered = []
+    fixed_position = 0
+    for flight in roster:
+        departure, arrival, flight_id, current_pilot, from_id, to_id = flight
+        while fixed_position < len(fixed) and fixed[fixed_position][0] <= departure:
+            fixed_departure, fixed_arrival, _, pilot_id, _, fixed_to = fixed[fixed_position]
+            if pilot_id in next_fixed:
+                next_fixed[pilot_id] += 1
+                move(pilot_id, fixed_arrival, fixed_to)
+            fixed_position += 1
+
+        if current_pilot in free_at and can_fly(current_pilot, flight):
+            chosen = current_pilot  #Keep the current pilot where possible, so fewer flights change hands
+        else:
+            chosen = take_from(waiting.get(from_id, []), flight)
+            if chosen is None:
+                chosen = take_from(waiting[ANYWHERE], flight)
+
+        if chosen is None:
+            uncovered.append(flight_id)
+            continue
+        assignments[flight_id] = chosen
+        move(chosen, arrival, to_id)
+
+    return assignments, uncovered
+
+#Pilot's flights either side of a departure time (both index lookups on (personal_ID, departure_date_time))
+#Parameters: (personal_ID, departure, flight_ID to leave out), and for the next flight the horizon it must depart before
+PREVIOUS_FLIGHT_SQL = """
+    SELECT arrival_date_time, arrival_destination_ID FROM Flights
+    WHERE personal_ID = ? AND departure_date_time < ? AND status != 'Cancelled' AND flight_ID != ?
+    ORDER BY departure_date_time DESC LIMIT 1
+"""
+NEXT_FLIGHT_SQL = """
+    SELECT departure_date_time, destination_ID FROM Flights
+    WHERE personal_ID = ? AND departure_date_time > ? AND status != 'Cancelled' AND flight_ID != ? AND departure_date_time < ?
+    ORDER BY departure_date_time LIMIT 1
+"""
+
+def _breaks_chain(cur, pilot_id, flight_id, flight, min_rest, horizon):
+    #True if the pilot's previous flight does not arrive where this one departs (with min_rest to spare), or their next flight does not
+    #depart from where this one arrives (with min_rest to spare). A pilot with no previous flight can start anywhere. Only next flights
+    #before the horizon are checked, the same ones plan_roster works around: later ones are rostered with a later range
+    departure, _, arrival, from_id, to_id = flight
+    cur.execute(PREVIOUS_FLIGHT_SQL, (pilot_id, departure, flight_id))
+    previous = cur.fetchone()
+    if previous and (previous[1] != from_id or _minutes(previous[0]) + min_rest > _minutes(departure)):
+        return True
+    cur.execute(NEXT_FLIGHT_SQL, (pilot_id, departure, flight_id, horizon))
+    upcoming = cur.fetchone()
+    return bool(upcoming) and (upcoming[1] != to_id or _minutes(arrival) + min_rest > _minutes(upcoming[0]))
+
+def _undo_conflicts(cur, changes, current, min_rest=MIN_REST_MINUTES, horizon=None):
+    #Checks each changed flight against its new pilot's other flights, now every change is written. Any that overlap, or break the
+    #pilot's chain of locations, are put back to their current pilot, which can free up or clash with others, so this repeats until
+    #no changed flight clashes. Returns the flight_IDs put back
+    flight_ids = [flight_id for _, flight_id in changes]
+    flights = {}  #flight_ID -> (departure, flight_time, arrival, from, to)
+    for position in range(0, len(flight_ids), 500):
+        chunk = flight_ids[position:position + 500]
+        cur.execute(f"""
+            SELECT flight_ID, departure_date_time, flight_time, arrival_date_time, destination_ID, arrival_destination_ID
+            FROM Flights WHERE flight_ID IN ({', '.join('?' for _ in chunk)})
+        """, chunk)
+        flights.update((row[0], row[1:]) for row in cur.fetchall())
+
+    pilots = dict((flight_id, pilot_id) for pilot_id, flight_id in changes)
+    undone = []
+    while True:
+        clashing = [flight_id for flight_id, pilot_id in pilots.items()
+                    if find_pilot_conflicts(cur, pilot_id, *flights[flight_id][:2], exclude_flight_id=flight_id)
+                    or _breaks_chain(cur, pilot_id, flight_id, flights[flight_id], min_rest, horizon)]
+        if not clashing:
+            return undone
+        for flight_id in clashing:
+            cur.execute("UPDATE Flights SET personal_ID = ? WHERE flight_ID = ?", (current[flight_id], flight_id))
+            del pilots[flight_id]
+        undone.extend(clashing)
+
+def _write_roster(cur, _, start, end, min_rest, dry_run):
+    #Runs on the writer thread inside its transaction, which already holds the write lock, so no flight changes between reading
+    #the schedule and applying the roster. A dry run undoes its own changes. Returns the result of assign_roster
+    cur.execute("SAVEPOINT roster")
+    pilot_ids, roster, fixed, horizon = _read_schedule(cur, start, end, min_rest)
+    assignments, uncovered = plan_roster(pilot_ids, roster, fixed, min_rest)
+
+    current = {flight[2]: flight[3] for flight in roster}
+    changes = [(pilot_id, flight_id) for flight_id, pilot_id in assignments.items() if current[flight_id] != pilot_id]
+    #Written first and then checked, so two flights swapping pilots are not seen as clashing half way through
+    cur.executemany("UPDATE Flights SET personal_ID = ? WHERE flight_ID = ?", changes)
+    conflicts = _undo_conflicts(cur, changes, current, min_rest, horizon)
+    if dry_run:
+        cur.execute("ROLLBACK TO roster")
+    cur.execute("RELEASE roster")
+
+    return {"flights": len(roster), "assigned": len(assignments) - len(conflicts), "changed": len(changes) - len(conflicts),
+            "uncovered": uncovered, "conflicts": conflicts}
+
+def _roster_written(_):
+    #After the writer commits: clear cached flight lookups
+    invalidate_flight_cache()
+
+def assign_roster(start_date, end_date, min_rest=MIN_REST_MINUTES, dry_run=False):
+    '''
+    Assign pilots to every NotDeparted/Delayed flight departing from start_date up to (not including) end_date (YYYY-MM-DD)
+    Reads, plans and writes as one item on the write queue. Unless dry_run, all changes are applied with one commit
+    Returns {"flights": flights rostered, "assigned": flights covered, "changed": flights given a different pilot, "uncovered": [flight_IDs],
+    "conflicts": [flight_IDs]}
+    Uncovered flights, and planned changes which would have double-booked a pilot or broken their chain of locations (conflicts),
+    keep their current pilot and should be checked by hand
+    '''
+    start = datetime.strptime(start_date, "%Y-%m-%d").date().isoformat()
+    end = datetime.strptime(end_date, "%Y-%m-%d").date().isoformat()
+    return submit_write(_write_roster, None, start, end, min_rest, dry_run, after_commit=None if dry_run else _roster_written).result()
+
+def run_roster():
+    '''
+    Prompts for a date range and assigns pilots to its flights
+    '''
+    try:
+        start_date = input("Enter first departure date to roster (YYYY-MM-DD): ")
+        end_date = input("Enter last departure date to roster (YYYY-MM-DD): ")
+        #Last date is inclusive for the user, so roster up to the start of the day after
+        end_date = (datetime.strptime(end_date, "%Y-%m-%d") + timedelta(days=1)).strftime("%Y-%m-%d")
+
+        result = assign_roster(start_date, end_date)
+        print(f"{result['assigned']} of {result['flights']} flights assigned a pilot ({result['changed']} changed).")
+        if result["uncovered"]:
+            shown = ", ".join(str(flight_id) for flight_id in result["uncovered"][:20])
+            more = f" and {len(result['uncovered']) - 20} more" if len(result["uncovered"]) > 20 else ""
+            print(f"{len(result['uncovered'])} flights could not be covered and keep their current pilot: {shown}{more}")
+        if result["conflicts"]:
+            shown = ", ".join(str(flight_id) for flight_id in result["conflicts"][:20])
+            more = f" and {len(result['conflicts']) - 20} more" if len(result["conflicts"]) > 20 else ""
+            print(f"{len(result['conflicts'])} flights would have double-booked a pilot or moved them out of place, and keep their current pilot: {shown}{more}")
+
+    except ValueError:
+        print("Invalid date format. Please use YYYY-MM-DD.")
+    except Exception as e:
+        print(f"Failed to assign pilots: {e}")
+
+#Entry point: roster a date range from the command line if this script is executed directly
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Automatically assign pilots to the flights departing in a date range")
+    parser.add_argument("start_date", help="first departure date (YYYY-MM-DD)")
+    parser.add_argument("end_date", help="departures up to, not including, this date (YYYY-MM-DD)")
+    parser.add_argument("--rest", type=int, default=MIN_REST_MINUTES, help="minimum minutes between arriving and departing again")
+    parser.add_argument("--dry-run", action="store_true", help="work out the roster without saving it")
+    args = parser.parse_args()
+
+    began = datetime.now()
+    result = assign_roster(args.start_date, args.end_date, args.rest, args.dry_run)
+    seconds = (datetime.now() - began).total_seconds()
+    print(f"{result['assigned']:,} of {result['flights']:,} flights assigned ({result['changed']:,} changed) in {seconds:.2f}s"
+          + (" - dry run, nothing saved" if args.dry_run else ""))
+    print(f"{len(result['uncovered']):,} flights could not be covered")
+    print(f"{len(result['conflicts']):,} changes would have double-booked a pilot and were not made")
@@ -0,0 +1,243 @@
+##File handles the route graph: finding the earliest way to get from one destination to another using scheduled flights
+#The graph is built from Flights once and kept in memory. For every (from, to) pair of destinations it holds that route's flights
+#sorted by departure time, plus, for each position, which flight from there onwards arrives first. So "first arrival at B when ready
+#to leave A at time T" is a binary search (O(log n)) however long the schedule is.
+#Searches are a time-dependent Dijkstra: journeys are extended in order of arrival time, each step being the binary search above,
+#and the search stops as soon as the destination is reached. With K connections allowed, each destination is expanded at most
+#K + 1 times (once per number of flights taken, and only when that is fewer than before), and the last flight allowed is only
+#looked for on routes into the destination.
+#Changing planes needs at least MIN_CONNECTION_MINUTES. Journeys arriving at the same time are compared on cost, where the cost of a
+#journey is the Destinations.cost of each destination flown to.
+#Flights added, re-timed or cancelled by this program are applied to the graph as they are committed (update_route_graph),
+#without rebuilding it. Call refresh_route_graph() after changing Flights any other way
+
+import heapq
+import threading
+from bisect import bisect_left, insort
+from datetime import datetime, timedelta
+import db_interaction_connection
+from db_interaction_connection import pooled_connection
+#Import function to borrow a connection to database from the connection pool
+from db_interaction_destination_cache import get_all_destinations
+#Import function to read destination costs without querying Destinations
+
+MIN_CONNECTION_MINUTES = 45  #Shortest time allowed between arriving on one flight and departing on the next
+MAX_CONNECTIONS = 2  #Default limit on the number of changes of plane
+ID_CHUNK = 500  #Flight IDs read per query when updating the graph
+
+_lock = threading.Lock()
+_graph_path = None  #Database the graph was built from (None until first used)
+_routes = {}  #from destination_ID -> {to destination_ID: _Route}
+_flight_routes = {}  #flight_ID -> (from, to, departure, arrival), so a flight can be found again when it changes
+
+def _minutes(text):
+    #"YYYY-MM-DD HH:MM:SS" -> minutes since 0001-01-01
+    return (datetime.fromisoformat(text) - datetime.min).total_seconds() / 60
+
+def _timestamp(minutes):
+    #Minutes since 0001-01-01 -> "YYYY-MM-DD HH:MM:SS"
+    return (datetime.min + timedelta(minutes=minutes)).strftime("%Y-%m-%d %H:%M:%S")
+
+class _Route:
+    '''
+    Flights between one pair of destinations, sorted by departure
+    '''
+    __slots__ = ("flights", "departures", "first_arrival", "stale")
+
+    def __init__(self):
+        self.flights = []  #(departure, arrival, flight_ID), sorted
+        self.departures = []  #Departure of each flight, for binary search
+        self.first_arrival = []  #first_arrival[i] = position of the earliest arriving flight among flights[i:]
+        self.stale = False  #True when flights have changed since first_arrival was worked out
+
+    def _reindex(self):
+        self.departures = [flight[0] for flight in self.flights]
+        self.first_arrival = [0] * len(self.flights)
+        best = None
+        for position in range(len(self.flights) - 1, -1, -1):
+            if best is None or self.flights[position][1] <= self.flights[best][1]:
+                best = position
+            self.first_arrival[position] = best
+        self.stale = False
+
+    def earliest(self, ready):
+        #Flight departing at or after "ready" that arrives first, or None
+        if self.stale:
+            self._reindex()
+        position = bisect_left(self.departures, ready)
+        if position == len(self.flights):
+            return None
+        return self.flights[self.first_arrival[position]]
+
+def _add(flight_id, from_id, to_id, departure, arrival):
+    route = _routes.setdefault(from_id, {}).get(to_id)
+    if route is None:
+        route = _routes[from_id][to_id] = _Route()
+    insort(route.flights, (departure, arrival, flight_id))
+    route.stale = True
+    _flight_routes[flight_id] = (from_id, to_id, departure, arrival)
+
+def _remove(flight_id):
+    entry = _flight_routes.pop(flight_id, None)
+    if entry is None:
+        return
+    from_id, to_id, departure, arrival = entry
+    route = _routes[from_id][to_id]
+    route.flights.remove((departure, arrival, flight_id))
+    route.stale = True
+
+def _build():
+    #Reads every flight that is not cancelled. Called with _lock held
+    global _graph_path
+    _routes.clear()
+    _flight_routes.clear()
+    with pooled_connection() as conn:
+        cur = conn.execute("""
+            SELECT flight_ID, destination_ID, arrival_destination_ID, departure_date_time, arrival_date_time
+            FROM Flights
+            WHERE status != 'Cancelled'
+            ORDER BY departure_date_time
+        """)
+        for flight_id, from_id, to_id, departure, arrival in cur:
+            route = _routes.setdefault(from_id, {}).get(to_id)
+            if route is None:
+                route = _routes[from_id][to_id] = _Route()
+            route.flights.append((_minutes(departure), _minutes(arrival), flight_id))  #Already in departure order
+            _flight_routes[flight_id] = (from_id, to_id, route.flights[-1][0], route.flights[-1][1])
+
+    for targets in _routes.values():
+        for route in targets.values():
+            route.flights.sort()  #Only re-orders flights with the same departure
+            route._reindex()
+    _graph_path = db_interaction_connection.DB_PATH
+
+def _ensure_built():
+    #Builds on first use, and again if the database file has been switched (see reset_pool). Called with _lock held
+    if _graph_path != db_interaction_connection.DB_PATH:
+        _build()
+
+def refresh_route_graph():
+    '''
+    Rebuild the route graph from Flights
+    '''
+    with _lock:
+        _build()
+
+def update_route_graph(flight_ids):
+    '''
+    Re-read the given flights and update the graph to match: new flights are added, re-timed ones moved and cancelled ones removed
+    Called by the flight functions straight after they commit. Does nothing if the graph has not been built yet
+    '''
+    flight_ids = list(dict.fromkeys(flight_ids))
+    with _lock:
+        if _graph_path != db_interaction_connection.DB_PATH or not flight_ids:
+            return
+
+        rows = []
+        with pooled_connection() as conn:
+            for start in range(0, len(flight_ids), ID_CHUNK):
+                chunk = flight_ids[start:start + ID_CHUNK]
+                placeholders = ", ".join("?" for _ in chunk)
+                rows += conn.execute(f"""
+                    SELECT flight_ID, destination_ID, arrival_destination_ID, departure_date_time, arrival_date_time
+                    FROM Flights
+                    WHERE flight_ID IN ({placeholders}) AND status != 'Cancelled'
+                """, chunk).fetchall()
+
+        for flight_id in flight_ids:
+            _remove(flight_id)
+        for flight_id, from_id, to_id, departure, arrival in rows:
+            _add(flight_id, from_id, to_id, _minutes(departure), _minutes(arrival))
+
+def route_graph_stats():
+    '''
+    Returns the number of destinations with departures, routes (destination pairs) and flights in the graph
+    '''
+    with _lock:
+        return {
+            "destinations": len(_routes),
+            "routes": sum(len(targets) for targets in _routes.values()),
+            "flights": len(_flight_routes),
+        }
+
+def find_earliest_arrival(from_id, to_id, depart_after, max_connections=MAX_CONNECTIONS, min_connection=MIN_CONNECTION_MINUTES):
+    '''
+    Find the journey from one destination to another, departing at or after depart_after ("YYYY-MM-DD HH:MM:SS"),
+    that arrives first, using at most max_connections changes of plane. Ties on arrival go to the cheaper journey
+    Returns {"arrival", "cost", "legs"} where legs is a list of (flight_ID, from, to, departure, arrival), or None if there is no journey
+    '''
+    from_id, to_id = int(from_id), int(to_id)
+    start = _minutes(depart_after)
+    if from_id == to_id:
+        return {"arrival": depart_after, "cost": 0.0, "legs": []}
+    costs = {row[0]: row[3] for row in get_all_destinations()}
+
+    with _lock:
+        _ensure_built()
+
+        #Journeys are taken from the heap in order of (arrival, cost), so the first one to reach to_id is the answer.
+        #Heap entries are (arrival, cost, flights taken, tie breaker, destination, legs), legs being (departure, arrival, flight_ID, from, to).
+        #The start is "arrived" early enough that its first flight can leave at depart_after
+        heap = [(start - min_connection, 0.0, 0, 0, from_id, ())]
+        fewest_flights = {}  #Destination -> fewest flights it has been reached with so far (always arriving no later)
+        pushed = 0
+        target = None  #Best (arrival, cost) pushed for to_id so far
+        answer = None
+        while heap:
+            arrived, cost, taken, _, stop, legs = heapq.heappop(heap)
+            if stop == to_id:
+                answer = (arrived, cost, legs)
+                break
+            if fewest_flights.get(stop, max_connections + 2) <= taken:
+                continue  #Already reached earlier (or as early) with no more flights, so this cannot do better
+            fewest_flights[stop] = taken
+            if taken > max_connections:
+                continue
+
+            ready = arrived + min_connection
+            routes = _routes.get(stop, {})
+            #The last flight allowed has to go to the destination itself
+            if taken == max_connections:
+                routes = {to_id: routes[to_id]} if to_id in routes else {}
+            for next_stop, route in routes.items():
+                flight = route.earliest(ready)
+                if flight is None:
+                    continue
+                departure, arrival, flight_id = flight
+                new_cost = cost + costs.get(next_stop, 0.0)
+                if target is not None and (arrival, new_cost) >= target:
+                    continue  #Cannot beat a journey to the destination already found
+                if fewest_flights.get(next_stop, max_connections + 2) <= taken + 1:
+                    continue
+                if next_stop == to_id:
+                    target = (arrival, new_cost)
+                pushed += 1
+                heapq.heappush(heap, (arrival, new_cost, taken + 1, pushed, next_stop, legs + ((departure, arrival, flight_id, stop, next_stop),)))
+
+    if answer is None:
+        return None
+    arrival, cost, legs = answer
+    return {
+        "arrival": _timestamp(arrival),
+        "cost": cost,
+        "legs": [(flight_id, stop, next_stop, _timestamp(departure), _timestamp(leg_arrival))
+                 for departure, leg_arrival, flight_id, stop, next_stop in legs],
+    }
+
+def view_route(from_id, to_id, depart_after, format_table, max_connections=MAX_CONNECTIONS):
+    """
+    Displays the journey from one destination to another that arrives first, departing at or after the given time.
+    """
+    try:
+        journey = find_earliest_arrival(from_id, to_id, depart_after, max_connections)
+        if journey is None:
+            print(f"No journey found with up to {max_connections} connections.")
+            return
+
+        headers = ["Flight ID", "From ID", "To ID", "Departure", "Arrival"]
+        if format_table:
+            format_table(journey["legs"], headers)
+        print(f"\nArrives {journey['arrival']} with {max(len(journey['legs']) - 1, 0)} connection(s), total cost {journey['cost']:.2f}")
+
+    except Exception as e:
+        print(f"Failed to find a route: {e}")
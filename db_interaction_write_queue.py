@@ -0,0 +1,225 @@
+##File handles the single writer: changes are queued and written by one thread, many at a time in one transaction ("group commit")
+#SQLite lets only one connection write at a time, and every commit waits for the disk (fsync). When many threads each open
+#their own write transaction they queue for the lock, fail with "database is locked" once busy_timeout runs out, and pay for one
+#fsync each. Instead, status changes, pilot assignments and log entries are handed to submit_write, which returns a Future
+#straight away. One writer thread takes whatever is queued, waiting at most WRITE_MAX_DELAY_MS after the first item for more
+#to arrive and taking at most WRITE_MAX_BATCH items, and applies them in a single transaction with a single commit.
+#Each item runs inside its own SAVEPOINT, so an item that fails is undone on its own and the rest of the batch is still saved.
+#Futures are resolved only after the commit has returned, with synchronous set to WRITE_SYNCHRONOUS (FULL by default, so the
+#change has reached the disk), meaning a caller that has its result knows the change is durable.
+#Writes that arrive while a commit is in progress wait for it and then go together in the next batch, so batches grow with the load
+#even with no delay at all, which is the default. A delay of a few milliseconds gives more writes per commit (throughput) on disks
+#where fsync is slow, at the cost of every write waiting that much longer for its answer (latency); a smaller WRITE_MAX_BATCH
+#bounds how long one commit takes
+#
+#Writes queued when the program exits are committed first (atexit). Queued writes whose Future is cancelled are skipped.
+#Operations must not queue further writes and wait for them, as they run on the writer thread itself
+#
+#Every change made by the menu, the command line and the HTTP service goes through here: new flights, status changes (single and
+#batch), pilot assignments and rosters, and adding, editing and deleting pilots and destinations. Bulk and maintenance jobs bypass
+#the queue on purpose and take the write lock with their own short BEGIN IMMEDIATE transactions: file imports (import_data.py),
+#log archiving (db_interaction_log_archive.py), flight state checkpoints (db_interaction_history.py) and delay summary rebuilds
+#(db_interaction_delay_stats.py). Each of their transactions is sized to be short, and running them on the writer thread would make
+#every queued change wait behind them; they wait for the writer's commits through busy_timeout instead
+
+import atexit
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from db_interaction_connection import pooled_connection
+#Import function to borrow a connection to database from the connection pool (the most recently returned, so a warm one)
+
+WRITE_MAX_BATCH = int(os.environ.get("FLYME_WRITE_MAX_BATCH", "256"))  #Most writes committed together
+WRITE_MAX_DELAY_MS = float(os.environ.get("FLYME_WRITE_MAX_DELAY_MS", "0"))  #Longest wait for more writes after the first arrives
+WRITE_SYNCHRONOUS = os.environ.get("FLYME_WRITE_SYNCHRONOUS", "FULL")  #PRAGMA synchronous for the writer's commits
+
+_STOP = object()  #Put on the queue to stop the writer thread once the writes ahead of it are done
+
+_writer_lock = threading.Lock()
+_writer_thread = None
+_queue = queue.SimpleQueue()  #Queue of the current writer thread (each thread gets its own, so a stopping thread never takes new writes)
+_stats_lock = threading.Lock()
+_write_stats = {
+    "writes": 0,
+    "failed": 0,
+    "cancelled": 0,
+    "batches": 0,
+    "batches_failed": 0,
+    "largest_batch": 0,
+    "queue_wait_total_s": 0.0,
+    "commit_total_s": 0.0,
+}
+
+class _Write:
+    '''
+    One queued change: operation(cur, flight_id, *args), the Future for its result, and the after commit callback
+    '''
+    __slots__ = ("operation", "flight_id", "args", "after_commit", "future", "queued_at")
+
+    def __init__(self, operation, flight_id, args, after_commit):
+        self.operation = operation
+        self.flight_id = flight_id
+        self.args = args
+        self.after_commit = after_commit
+        self.future = Future()
+        self.queued_at = time.perf_counter()
+
+def submit_write(operation, flight_id, *args, after_commit=None):
+    '''
+    Queue operation(cur, flight_id, *args) for the writer thread, and return a concurrent.futures.Future for its result
+    The operation runs on a cursor inside the writer's transaction and must not commit. If it raises, only its own changes are undone,
+    and the Future raises the same exception. after_commit(flight_ids), if given, is called once per batch after the commit
+    with the flight IDs of that batch's successful writes which used it (e.g. to clear caches), before any Future is resolved
+    '''
+    write = _Write(operation, flight_id, args, after_commit)
+    with _writer_lock:
+        _writer_queue().put(write)
+    return write.future
+
+def configure_write_queue(max_batch=None, max_delay_ms=None):
+    '''
+    Change the group commit bounds, taking effect from the next batch. Returns the (max_batch, max_delay_ms) now in use
+    '''
+    global WRITE_MAX_BATCH, WRITE_MAX_DELAY_MS
+    if max_batch is not None:
+        if max_batch < 1:
+            raise ValueError("max_batch must be at least 1")
+        WRITE_MAX_BATCH = max_batch
+    if max_delay_ms is not None:
+        if max_delay_ms < 0:
+            raise ValueError("max_delay_ms cannot be negative")
+        WRITE_MAX_DELAY_MS = max_delay_ms
+    return WRITE_MAX_BATCH, WRITE_MAX_DELAY_MS
+
+def write_queue_stats():
+    '''
+    Returns counts of writes and batches, the average batch size, and average time writes waited in the queue and commits took
+    '''
+    with _stats_lock:
+        stats = dict(_write_stats)
+    done = stats["writes"] + stats["failed"]
+    stats["queued"] = _queue.qsize()
+    stats["average_batch"] = done / stats["batches"] if stats["batches"] else 0.0
+    stats["queue_wait_avg_s"] = stats["queue_wait_total_s"] / done if done else 0.0
+    stats["commit_avg_s"] = stats["commit_total_s"] / stats["batches"] if stats["batches"] else 0.0
+    stats["max_batch"] = WRITE_MAX_BATCH
+    stats["max_delay_ms"] = WRITE_MAX_DELAY_MS
+    return stats
+
+def stop_write_queue():
+    '''
+    Commit the writes already queued, then stop the writer thread. It starts again if another write is queued
+    '''
+    global _writer_thread
+    with _writer_lock:
+        thread, _writer_thread = _writer_thread, None
+        if thread is None:
+            return
+        _queue.put(_STOP)
+    thread.join()
+
+atexit.register(stop_write_queue)
+
+def _writer_queue():
+    #Queue of the running writer thread, starting one if needed. Called with _writer_lock held
+    global _writer_thread, _queue
+    if _writer_thread is None:
+        _queue = queue.SimpleQueue()
+        _writer_thread = threading.Thread(target=_run_writer, args=(_queue,), name="flyme-write-queue", daemon=True)
+        _writer_thread.start()
+    return _queue
+
+def _run_writer(writes):
+    while True:
+        write = writes.get()
+        if write is _STOP:
+            return
+        batch = [write]
+        stopping = False
+        #Collect more writes until the batch is full or the delay since the first one has passed. Writes already waiting are
+        #always taken, so under load batches fill up without waiting at all
+        deadline = time.perf_counter() + WRITE_MAX_DELAY_MS / 1000
+        while len(batch) < WRITE_MAX_BATCH:
+            remaining = deadline - time.perf_counter()
+            try:
+                write = writes.get(timeout=remaining) if remaining > 0 else writes.get_nowait()
+            except queue.Empty:
+                break
+            if write is _STOP:
+                stopping = True
+                break
+            batch.append(write)
+        _commit_batch(batch)
+        if stopping:
+            return
+
+def _commit_batch(batch):
+    #Drop writes whose caller has cancelled them, and mark the rest as running so they can no longer be cancelled
+    live = [write for write in batch if write.future.set_running_or_notify_cancel()]
+    with _stats_lock:
+        _write_stats["cancelled"] += len(batch) - len(live)
+    if not live:
+        return
+
+    started = time.perf_counter()
+    outcomes = []  #(write, succeeded, result or exception)
+    try:
+        with pooled_connection() as conn:
+            #Put back afterwards, as the connection goes back to the pool and may be borrowed by another thread next
+            synchronous = conn.execute("PRAGMA synchronous").fetchone()[0]
+            conn.execute(f"PRAGMA synchronous = {WRITE_SYNCHRONOUS}")
+            try:
+                cur = conn.cursor()
+                cur.execute("BEGIN IMMEDIATE")
+                for write in live:
+                    cur.execute("SAVEPOINT queued_write")
+                    try:
+                        result = write.operation(cur, write.flight_id, *write.args)
+                    except Exception as e:
+                        cur.execute("ROLLBACK TO queued_write")
+                        outcomes.append((write, False, e))
+                    else:
+                        outcomes.append((write, True, result))
+                    cur.execute("RELEASE queued_write")
+                conn.commit()
+            finally:
+                if conn.in_transaction:
+                    conn.rollback()  #synchronous cannot be changed inside a transaction
+                conn.execute(f"PRAGMA synchronous = {synchronous}")
+    except Exception as e:
+        #The transaction itself failed (e.g. the lock was not free within busy_timeout, or the disk is full), so nothing in
+        #the batch was saved. Every write in it fails with the same error
+        with _stats_lock:
+            _write_stats["batches_failed"] += 1
+            _write_stats["failed"] += len(live)
+        for write in live:
+            write.future.set_exception(e)
+        return
+    committed = time.perf_counter()
+
+    #Callbacks (cache invalidation etc.) run before any Future is resolved, so callers never see stale caches after their write
+    callbacks = {}
+    for write, succeeded, _ in outcomes:
+        if succeeded and write.after_commit is not None:
+            callbacks.setdefault(write.after_commit, []).append(write.flight_id)
+    for callback, flight_ids in callbacks.items():
+        try:
+            callback(flight_ids)
+        except Exception as e:
+            print(f"Write queue: after commit callback failed: {e}")
+
+    with _stats_lock:
+        _write_stats["batches"] += 1
+        _write_stats["largest_batch"] = max(_write_stats["largest_batch"], len(live))
+        _write_stats["commit_total_s"] += committed - started
+        for write, succeeded, _ in outcomes:
+            _write_stats["writes" if succeeded else "failed"] += 1
+            _write_stats["queue_wait_total_s"] += started - write.queued_at
+    for write, succeeded, result in outcomes:
+        if succeeded:
+            write.future.set_result(result)
+        else:
+            write.future.set_exception(result)
@@ -0,0 +1,314 @@
+##Script to export the data behind the menu views to CSV, JSONL or a compact binary format (optionally gzipped)
+#Each export source runs one of the existing lookups (e.g. flights by status, delay events, a pilot's flights) and rows are
+#written as they come off the cursor, EXPORT_CHUNK rows at a time, so even the whole of FlightStatusLog can be exported without
+#holding it in memory. The row count, file size and rows per second are reported at the end
+#
+#Example: python export_data.py status-log -o status_log.jsonl.gz
+#         python export_data.py flights Delayed -o delayed.csv
+#
+#Binary format ("flyme binary", .fbin): the bytes b"FLYX" and a version byte, then records. Every record is a 4 byte big endian length
+#followed by that many bytes. The first record is the column names as a JSON list, every other record is one row, and a record of
+#length 0 marks the end. Each value in a row is a one byte type tag followed by the value:
+#   0 NULL, 1 integer (8 byte signed), 2 real (8 byte double), 3 text (4 byte length + UTF-8), 4 blob (4 byte length + bytes),
+#   5 integer (4 byte signed), 6 short text (1 byte length + UTF-8). Numbers are big endian; the small forms are used when the value fits
+#read_binary() reads a file back
+
+import argparse
+import csv
+import gzip
+import io
+import json
+import os
+import struct
+import sys
+import time
+from itertools import islice
+
+from db_interaction_connection import pooled_connection
+#Import function to borrow a connection to database from the connection pool
+from db_interaction_flight_queries import (
+    iter_flights_by_status,
+    iter_flights_by_date,
+    iter_flights_arriving_on,
+    iter_flights_by_destination_id,
+    iter_flights_by_arrival_id,
+    iter_flights_by_destination_country,
+    iter_flights_by_arrival_country,
+) #Import streaming flight lookups
+from db_interaction_pilot_queries import get_flights_for_pilot
+from db_interaction_log_out import iter_delay_events
+from db_interaction_log_archive import LOG_COLUMNS, log_partitions
+from db_interaction_pilot_schedule import get_schedule_conflicts
+
+EXPORT_CHUNK = 1000  #Rows fetched from the cursor and written per chunk
+GZIP_LEVEL = 6  #Compression level for .gz output (9 is much slower for little gain)
+BINARY_MAGIC = b"FLYX"
+BINARY_VERSION = 1
+
+#----------------------------------------------------------------------------
+#Sources: each returns (column names, iterable of rows)
+
+FLIGHT_COLUMNS = ["flight_ID", "personal_ID", "destination_ID", "arrival_destination_ID",
+                  "departure_date_time", "flight_time", "status", "arrival_date_time"]
+PILOT_FLIGHT_COLUMNS = ["personal_ID", "first_name", "flight_ID", "departure_date_time", "destination_ID", "destination_country",
+                        "arrival_destination_ID", "arrival_country", "arrival_date_time"]
+DELAY_EVENT_COLUMNS = ["flight_ID", "previous_departure", "delayed_departure", "delay_minutes", "cumulative_delay_minutes"]
+CONFLICT_COLUMNS = ["personal_ID", "flight_ID", "departure_date_time", "arrival_date_time",
+                    "overlapping_flight_ID", "overlapping_departure_date_time", "overlapping_arrival_date_time"]
+
+def _iter_query(sql, params=()):
+    #Streams the rows of a query, EXPORT_CHUNK at a time. The connection is held until the last row has been read, so the rows must
+    #all be read on one thread (db_interaction_async.stream_rows runs each stream on a thread of its own)
+    with pooled_connection() as conn:
+        cur = conn.execute(sql, params)
+        while True:
+            chunk = cur.fetchmany(EXPORT_CHUNK)
+            if not chunk:
+                return
+            yield from chunk
+
+def _status_log():
+    #The whole status log, including rows moved to the archive files (see db_interaction_log_archive.py)
+    def rows():
+        with pooled_connection() as conn, log_partitions(conn) as log:
+            cur = conn.execute(f"SELECT {LOG_COLUMNS} FROM {log} ORDER BY log_ID")
+            try:
+                while True:
+                    chunk = cur.fetchmany(EXPORT_CHUNK)
+                    if not chunk:
+                        return
+                    yield from chunk
+            finally:
+                cur.close()
+    return LOG_COLUMNS.split(", "), rows()
+
+def _table(table, order_by):
+    def source():
+        with pooled_connection() as conn:
+            columns = [info[1] for info in conn.execute(f"PRAGMA table_info({table})")]
+        return columns, _iter_query(f"SELECT * FROM {table} ORDER BY {order_by}")
+    return source
+
+def _flights(lookup):
+    def source(*args):
+        return FLIGHT_COLUMNS, lookup(*args, page_size=EXPORT_CHUNK)
+    return source
+
+#Export name -> (source, argument names, description)
+EXPORTS = {
+    "flights": (_flights(iter_flights_by_status), ["status"], "flights with a status, or all flights with status 'all'"),
+    "flights-on-date": (_flights(iter_flights_by_date), ["date"], "flights departing on a date (YYYY-MM-DD)"),
+    "flights-arriving-on": (_flights(iter_flights_arriving_on), ["date"], "flights arriving on a date (YYYY-MM-DD)"),
+    "flights-from": (_flights(iter_flights_by_destination_id), ["destination_id"], "flights leaving a destination"),
+    "flights-to": (_flights(iter_flights_by_arrival_id), ["destination_id"], "flights arriving at a destination"),
+    "flights-from-country": (_flights(iter_flights_by_destination_country), ["country"], "flights leaving a country"),
+    "flights-to-country": (_flights(iter_flights_by_arrival_country), ["country"], "flights arriving in a country"),
+    "pilot-flights": (lambda pilot_id: (PILOT_FLIGHT_COLUMNS, get_flights_for_pilot(pilot_id)), ["pilot_id"], "flights assigned to a pilot"),
+    "pilots": (_table("Pilots", "personal_ID"), [], "all pilots"),
+    "destinations": (_table("Destinations", "destination_ID"), [], "all destinations"),
+    "status-log": (_status_log, [], "the whole FlightStatusLog, archived rows included"),
+    "delay-events": (lambda: (DELAY_EVENT_COLUMNS, iter_delay_events()), [], "every delay, with its duration and running total"),
+    "schedule-conflicts": (lambda: (CONFLICT_COLUMNS, get_schedule_conflicts()), [], "overlapping flights flown by the same pilot"),
+}
+
+#----------------------------------------------------------------------------
+#Writers: each writes the column names and rows to a binary file object, a chunk at a time, and returns the number of rows
+
+def _chunks(rows):
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, EXPORT_CHUNK))
+        if not chunk:
+            return
+        yield chunk
+
+def write_csv(columns, rows, out):
+    text = io.TextIOWrapper(out, encoding="utf-8", newline="")
+    writer = csv.writer(text)
+    writer.writerow(columns)
+    count = 0
+    for chunk in _chunks(rows):
+        writer.writerows(chunk)
+        count += len(chunk)
+    text.flush()
+    text.detach()  #Leave "out" open for the caller
+    return count
+
+def write_jsonl(columns, rows, out):
+    count = 0
+    for chunk in _chunks(rows):
+        lines = "".join(json.dumps(dict(zip(columns, row)), default=str) + "\n" for row in chunk)
+        out.write(lines.encode("utf-8"))
+        count += len(chunk)
+    return count
+
+_INTEGER = struct.Struct(">Bq")
+_REAL = struct.Struct(">Bd")
+_SIZED = struct.Struct(">BI")
+_SMALL_INTEGER = struct.Struct(">Bi")
+_SHORT_SIZED = struct.Struct(">BB")
+_LENGTH = struct.Struct(">I")
+
+def _encode_value(value):
+    if value is None:
+        return b"\x00"
+    if isinstance(value, int):
+        if -2147483648 <= value <= 2147483647:
+            return _SMALL_INTEGER.pack(5, value)
+        return _INTEGER.pack(1, value)
+    if isinstance(value, float):
+        return _REAL.pack(2, value)
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        value = bytes(value)
+        return _SIZED.pack(4, len(value)) + value
+    value = str(value).encode("utf-8")
+    if len(value) < 256:
+        return _SHORT_SIZED.pack(6, len(value)) + value
+    return _SIZED.pack(3, len(value)) + value
+
+def _record(payload):
+    return _LENGTH.pack(len(payload)) + payload
+
+def write_binary(columns, rows, out):
+    out.write(BINARY_MAGIC + bytes([BINARY_VERSION]))
+    out.write(_record(json.dumps(columns).encode("utf-8")))
+    count = 0
+    for chunk in _chunks(rows):
+        out.write(b"".join(_record(b"".join(_encode_value(value) for value in row)) for row in chunk))
+        count += len(chunk)
+    out.write(_LENGTH.pack(0))
+    return count
+
+def _decode_row(payload):
+    values = []
+    position = 0
+    while position < len(payload):
+        tag = payload[position]
+        if tag == 0:
+            values.append(None)
+            position += 1
+        elif tag == 1:
+            values.append(_INTEGER.unpack_from(payload, position)[1])
+            position += _INTEGER.size
+        elif tag == 2:
+            values.append(_REAL.unpack_from(payload, position)[1])
+            position += _REAL.size
+        elif tag == 5:
+            values.append(_SMALL_INTEGER.unpack_from(payload, position)[1])
+            position += _SMALL_INTEGER.size
+        elif tag in (3, 4, 6):
+            header = _SHORT_SIZED if tag == 6 else _SIZED
+            size = header.unpack_from(payload, position)[1]
+            position += header.size
+            value = payload[position:position + size]
+            values.append(value if tag == 4 else value.decode("utf-8"))
+            position += size
+        else:
+            raise ValueError(f"Unknown value type {tag} in binary export")
+    return tuple(values)
+
+def read_binary(path):
+    '''
+    Read a binary export back. Returns (column names, generator of row tuples), reading one record at a time
+    '''
+    source = gzip.open(path, "rb") if path.endswith(".gz") else open(path, "rb")
+    header = source.read(len(BINARY_MAGIC) + 1)
+    if header[:len(BINARY_MAGIC)] != BINARY_MAGIC or header[-1:] != bytes([BINARY_VERSION]):
+        source.close()
+        raise ValueError(f"{path} is not a version {BINARY_VERSION} binary export")
+
+    def read_record():
+        size = _LENGTH.unpack(source.read(_LENGTH.size))[0]
+        return source.read(size) if size else None
+
+    columns = json.loads(read_record())
+
+    def rows():
+        with source:
+            while (payload := read_record()) is not None:
+                yield _decode_row(payload)
+    return columns, rows()
+
+WRITERS = {"csv": write_csv, "jsonl": write_jsonl, "binary": write_binary}
+EXTENSIONS = {".csv": "csv", ".jsonl": "jsonl", ".ndjson": "jsonl", ".fbin": "binary"}
+
+def _detect_format(path):
+    name = path[:-3] if path.endswith(".gz") else path
+    file_format = EXTENSIONS.get(os.path.splitext(name)[1].lower())
+    if file_format is None:
+        raise ValueError(f"Cannot tell the format of {path}, use --format")
+    return file_format
+
+#----------------------------------------------------------------------------
+
+def export_rows(columns, rows, path, file_format=None, compress=None):
+    '''
+    Write rows to path as CSV, JSONL or binary, gzipped if compress (default: when path ends in .gz). path "-" writes to stdout
+    Returns {"rows": rows written, "bytes": size of the output (None for stdout), "seconds": time taken}
+    '''
+    if path == "-":
+        file_format = file_format or "jsonl"
+        compress = bool(compress)
+    else:
+        file_format = file_format or _detect_format(path)
+        compress = path.endswith(".gz") if compress is None else compress
+    write = WRITERS[file_format]
+
+    began = time.perf_counter()
+    if path == "-":
+        out = sys.stdout.buffer
+        if compress:
+            with gzip.GzipFile(fileobj=out, mode="wb", compresslevel=GZIP_LEVEL) as zipped:
+                count = write(columns, rows, zipped)
+        else:
+            count = write(columns, rows, out)
+        out.flush()
+        size = None
+    else:
+        with (gzip.open(path, "wb", compresslevel=GZIP_LEVEL) if compress else open(path, "wb")) as out:
+            count = write(columns, rows, out)
+        size = os.path.getsize(path)
+    return {"rows": count, "bytes": size, "seconds": time.perf_counter() - began}
+
+def export_view(name, args, path, file_format=None, compress=None):
+    '''
+    Run the export source "name" (see EXPORTS) with its arguments and write the result to path (see export_rows)
+    '''
+    if name not in EXPORTS:
+        raise ValueError(f"Unknown export '{name}'. Choose from: {', '.join(EXPORTS)}")
+    source, arg_names, _ = EXPORTS[name]
+    if len(args) != len(arg_names):
+        expected = " ".join(f"<{arg}>" for arg in arg_names) or "no arguments"
+        raise ValueError(f"{name} takes {expected}")
+    columns, rows = source(*args)
+    return export_rows(columns, rows, path, file_format, compress)
+
+def describe_export(result):
+    #One line summary of an export's size and throughput
+    rate = result["rows"] / result["seconds"] if result["seconds"] > 0 else float("inf")
+    size = "" if result["bytes"] is None else f", {result['bytes'] / 1e6:,.1f}MB"
+    return f"{result['rows']:,} rows exported in {result['seconds']:.2f}s ({rate:,.0f} rows/s{size})"
+
+#Entry point: export a view from the command line if this script is executed directly
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Export the data behind a view to CSV, JSONL or binary",
+        epilog="Exports: " + "; ".join(f"{name} {' '.join(f'<{arg}>' for arg in arg_names)}".rstrip() + f" - {about}"
+                                       for name, (_, arg_names, about) in EXPORTS.items()),
+    )
+    parser.add_argument("export", choices=list(EXPORTS), metavar="export", help="what to export (listed below)")
+    parser.add_argument("args", nargs="*", help="arguments of the export, e.g. a status or date")
+    parser.add_argument("-o", "--output", default="-", help="file to write (.csv, .jsonl or .fbin, add .gz to compress). Default: stdout")
+    parser.add_argument("--format", choices=sorted(WRITERS), help="output format, if it cannot be told from the file name")
+    parser.add_argument("--gzip", action="store_true", default=None, help="compress the output even if the name does not end in .gz")
+    args = parser.parse_args()
+
+    try:
+        result = export_view(args.export, args.args, args.output, args.format, args.gzip)
+    except ValueError as e:
+        parser.error(str(e))
+    except BrokenPipeError:
+        #Output piped into something that stopped reading early (e.g. head). Point stdout at devnull so exiting does not fail again
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        sys.exit(1)
+    print(describe_export(result), file=sys.stderr)
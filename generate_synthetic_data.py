@@ -0,0 +1,276 @@
+##Script to generate large, realistic (but fake) datasets for capacity testing
+#Unlike populate_sample_data_db.py (10 hand written flights), this can produce millions of flights, each with a realistic
+#FlightStatusLog history (NotDeparted, possibly Delayed one or more times or Cancelled, then OnRoute and Arrived).
+#Output is deterministic for a given --seed, so the same dataset can be rebuilt for comparing runs
+#
+#Example: python generate_synthetic_data.py --db capacity.db --pilots 20000 --destinations 2000 --flights 1000000 --seed 42
+#
+#Speed comes from: the "bulk-load" tuning profile (no journal, no fsync), explicit IDs so no lastrowid lookups or follow up
+#UPDATEs are needed (e.g. pilot emails are built from the ID up front), and executemany over large batches, one commit per batch
+#
+#Flights are generated in departure order and each pilot's next free time (last arrival plus MIN_REST_MINUTES) is tracked, so no
+#pilot is double-booked. A flight no free pilot can be found for is left out. Flights already in the database are not checked
+
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+
+import db_interaction_connection
+from db_interaction_connection import get_connection, reset_pool
+from setup_db import create_database
+from db_interaction_delay_stats import rebuild_delay_stats
+from db_interaction_roster import MIN_REST_MINUTES
+
+FIRST_NAMES = [
+    "Oliver", "Amelia", "George", "Isla", "Harry", "Ava", "Noah", "Mia", "Jack", "Ivy", "Leo", "Lily", "Arthur", "Freya",
+    "Muhammad", "Florence", "Oscar", "Grace", "Charlie", "Willow", "Thomas", "Sophia", "James", "Emily", "William", "Evie",
+    "Henry", "Poppy", "Alfie", "Ella", "Joshua", "Ruby", "Freddie", "Isabella", "Archie", "Rosie", "Ethan", "Sienna",
+]
+SURNAMES = [
+    "Smith", "Jones", "Taylor", "Brown", "Williams", "Wilson", "Johnson", "Davies", "Patel", "Robinson", "Wright", "Thompson",
+    "Evans", "Walker", "White", "Roberts", "Green", "Hall", "Thomas", "Clarke", "Jackson", "Wood", "Harris", "Edwards",
+    "Turner", "Martin", "Cooper", "Hill", "Ward", "Hughes", "Moore", "Clark", "King", "Harrison", "Lewis", "Baker",
+]
+CITIES = [
+    "London", "Bath", "Bristol", "Leeds", "York", "Manchester", "Liverpool", "Oxford", "Cambridge", "Cardiff", "Glasgow",
+    "Edinburgh", "Belfast", "Exeter", "Norwich", "Brighton", "Sheffield", "Newcastle", "Nottingham", "Leicester",
+]
+STREETS = ["High Street", "Station Road", "Church Lane", "Mill Road", "Park Avenue", "Queens Road", "The Green", "Kings Way"]
+COUNTRIES = [
+    "United Kingdom", "France", "Spain", "Italy", "Germany", "Portugal", "Greece", "Turkey", "United States", "Canada",
+    "Brazil", "Mexico", "Japan", "China", "India", "Thailand", "Malaysia", "Australia", "New Zealand", "South Africa",
+    "Egypt", "Kenya", "Morocco", "Norway", "Sweden", "Iceland", "Ireland", "Netherlands", "Poland", "Argentina",
+]
+PLACE_PARTS = ["North", "South", "East", "West", "Port", "New", "Upper", "Lower", "Saint", "Fort"]
+
+#Chance of each event happening to a flight when its history is generated
+DELAY_CHANCE = 0.2
+REPEAT_DELAY_CHANCE = 0.25  #Chance of a further delay after each delay
+CANCEL_CHANCE = 0.03
+
+PILOT_PICKS = 20  #Random pilots tried for each flight before it is left out for having no free pilot
+
+def _next_id(cur, table, id_column):
+    #First free ID in a table, so new rows can be given explicit IDs
+    cur.execute(f"SELECT COALESCE(MAX({id_column}), 0) + 1 FROM {table}")
+    return cur.fetchone()[0]
+
+def _fmt(moment):
+    return moment.strftime("%Y-%m-%d %H:%M:%S")
+
+def _batches(total, batch_size):
+    #Yields (start offset, size) of each batch
+    for start in range(0, total, batch_size):
+        yield start, min(batch_size, total - start)
+
+def generate_pilots(conn, rng, count, batch_size):
+    '''
+    Insert "count" pilots. Returns (first ID, last ID) of the new pilots
+    '''
+    cur = conn.cursor()
+    first_id = _next_id(cur, "Pilots", "personal_ID")
+    sql = """
+        INSERT INTO Pilots (personal_ID, first_name, surname, DOB, email, postcode, city, street)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    """
+    for start, size in _batches(count, batch_size):
+        rows = []
+        for personal_id in range(first_id + start, first_id + start + size):
+            first = rng.choice(FIRST_NAMES)
+            last = rng.choice(SURNAMES)
+            dob = _fmt(datetime(1960, 1, 1) + timedelta(days=rng.randrange(0, 365 * 44)))[:10]
+            email = f"{first.lower()}.{last.lower()}.{personal_id}"  #Unique as it contains the ID, so no follow up UPDATE needed
+            postcode = f"{rng.choice('ABCEGHKLMNPRSTW')}{rng.choice('ABCEGHKLMNPRSTW')}{rng.randint(1, 99)} {rng.randint(1, 9)}{rng.choice('ABDEFGHJLNPQRSTUWXYZ')}{rng.choice('ABDEFGHJLNPQRSTUWXYZ')}"
+            street = f"{rng.randint(1, 300)} {rng.choice(STREETS)}"
+            rows.append((personal_id, first, last, dob, email, postcode[:8], rng.choice(CITIES), street))
+        cur.executemany(sql, rows)
+        conn.commit()
+    return first_id, first_id + count - 1
+
+def generate_destinations(conn, rng, count, batch_size):
+    '''
+    Insert "count" destinations. Returns (first ID, last ID) of the new destinations
+    '''
+    cur = conn.cursor()
+    first_id = _next_id(cur, "Destinations", "destination_ID")
+    sql = "INSERT INTO Destinations (destination_ID, country, name, cost, timezone) VALUES (?, ?, ?, ?, ?)"
+    for start, size in _batches(count, batch_size):
+        rows = []
+        for destination_id in range(first_id + start, first_id + start + size):
+            name = f"{rng.choice(PLACE_PARTS)} {rng.choice(CITIES)} {destination_id}"
+            rows.append((destination_id, rng.choice(COUNTRIES), name, round(rng.uniform(50, 1500), 2), rng.randint(-12, 14)))
+        cur.executemany(sql, rows)
+        conn.commit()
+    return first_id, first_id + count - 1
+
+def _flight_history(rng, flight_id, departure, flight_time, now):
+    #Works out the status history of one flight. Returns (final departure, final status, log rows)
+    logged_at = departure - timedelta(days=rng.randint(1, 180), minutes=rng.randint(0, 1439))
+    logs = [(flight_id, "NotDeparted", _fmt(departure), _fmt(logged_at))]
+    status = "NotDeparted"
+
+    #Delays and cancellations are announced between the flight being created and it departing
+    if rng.random() < DELAY_CHANCE:
+        while True:
+            logged_at = logged_at + (departure - logged_at) * rng.uniform(0.3, 0.99)
+            if logged_at > now:
+                break
+            departure = departure + timedelta(minutes=rng.choice([5, 10, 15, 20, 30, 45, 60, 90, 120, 180, 240, 360]))
+            logs.append((flight_id, "Delayed", _fmt(departure), _fmt(logged_at)))
+            status = "Delayed"
+            if rng.random() >= REPEAT_DELAY_CHANCE:
+                break
+
+    if rng.random() < CANCEL_CHANCE:
+        logged_at = logged_at + (departure - logged_at) * rng.uniform(0.1, 0.99)
+        if logged_at <= now:
+            logs.append((flight_id, "Cancelled", _fmt(departure), _fmt(logged_at)))
+            status = "Cancelled"
+
+    if status != "Cancelled" and departure <= now:
+        logs.append((flight_id, "OnRoute", _fmt(departure), _fmt(departure)))
+        status = "OnRoute"
+        arrival = departure + timedelta(minutes=flight_time)
+        if arrival <= now:
+            logs.append((flight_id, "Arrived", _fmt(departure), _fmt(arrival)))
+            status = "Arrived"
+
+    #A flight far enough ahead is "created" after now: log it as created at now, and never after its next status change
+    created = min([logs[0][3], _fmt(now)] + [log[3] for log in logs[1:2]])
+    logs[0] = (flight_id, "NotDeparted", logs[0][2], created)
+    return departure, status, logs
+
+def _free_pilot(rng, pilot_ids, free_at, departure):
+    #A random pilot who is free by "departure", or None if none of PILOT_PICKS tries is
+    for _ in range(PILOT_PICKS):
+        pilot_id = rng.randint(*pilot_ids)
+        if free_at.get(pilot_id, departure) <= departure:
+            return pilot_id
+    return None
+
+def generate_flights(conn, rng, count, batch_size, pilot_ids, destination_ids, start_date, days, now):
+    '''
+    Insert up to "count" flights and their FlightStatusLog history. Returns (flights inserted, log rows inserted)
+    Flights are generated in departure order and only given a pilot who is free (rested since their last arrival),
+    a flight with no free pilot is left out
+    '''
+    cur = conn.cursor()
+    flight_id = _next_id(cur, "Flights", "flight_ID")
+    flight_sql = """
+        INSERT INTO Flights (flight_ID, personal_ID, destination_ID, arrival_destination_ID, departure_date_time, flight_time, status, arrival_date_time)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    """  #Arrival time is given here, so the trigger which would otherwise fill it in does not need to update every row
+    log_sql = "INSERT INTO FlightStatusLog (flight_ID, status, departure_date_time, log_date_time) VALUES (?, ?, ?, ?)"
+    offsets = sorted(rng.randrange(0, days * 1440, 5) for _ in range(count))
+    free_at = {}  #Pilot ID -> time they can next depart
+    flight_count = 0
+    log_count = 0
+
+    for start, size in _batches(count, batch_size):
+        flights = []
+        logs = []
+        for offset in offsets[start:start + size]:
+            departure_id = rng.randint(*destination_ids)
+            arrival_id = rng.randint(*destination_ids)
+            if arrival_id == departure_id and destination_ids[0] != destination_ids[1]:
+                arrival_id = destination_ids[0] if departure_id == destination_ids[1] else departure_id + 1
+            departure = start_date + timedelta(minutes=offset)
+            flight_time = rng.choice([45, 60, 75, 90, 120, 150, 180, 240, 300, 420, 540, 720, 900])
+
+            departure, status, history = _flight_history(rng, flight_id, departure, flight_time, now)
+            pilot_id = _free_pilot(rng, pilot_ids, free_at, departure)
+            if pilot_id is None:
+                continue
+            arrival = departure + timedelta(minutes=flight_time)
+            if status != "Cancelled":
+                free_at[pilot_id] = arrival + timedelta(minutes=MIN_REST_MINUTES)
+            flights.append((flight_id, pilot_id, departure_id, arrival_id, _fmt(departure), flight_time, status, _fmt(arrival)))
+            logs.extend(history)
+            flight_id += 1
+
+        cur.executemany(flight_sql, flights)
+        cur.executemany(log_sql, logs)
+        conn.commit()
+        flight_count += len(flights)
+        log_count += len(logs)
+    return flight_count, log_count
+
+def _report(label, rows, seconds):
+    rate = rows / seconds if seconds > 0 else float("inf")
+    print(f"{label:<16} {rows:>12,} rows in {seconds:8.2f}s  ({rate:,.0f} rows/s)")
+
+def generate_dataset(db_path, pilots, destinations, flights, seed=1, batch_size=50000, start_date="2024-01-01", days=730, now=None):
+    '''
+    Create (if needed) and fill a database with synthetic data. Returns a dict of row counts and timings
+    "now" is the point in time the histories are generated up to (default: half way through the departure window),
+    so earlier flights have arrived and later ones are still to depart
+    '''
+    rng = random.Random(seed)
+    start = datetime.strptime(start_date, "%Y-%m-%d")
+    now = datetime.strptime(now, "%Y-%m-%d %H:%M:%S") if now else start + timedelta(days=days / 2)
+
+    previous_path = db_interaction_connection.DB_PATH
+    reset_pool(db_path=db_path)
+    try:
+        create_database(profile="bulk-load")
+        conn = get_connection(profile="bulk-load")
+        results = {}
+        try:
+            began = time.perf_counter()
+            pilot_ids = generate_pilots(conn, rng, pilots, batch_size) if pilots else None
+            results["pilots"] = (pilots, time.perf_counter() - began)
+
+            began = time.perf_counter()
+            destination_ids = generate_destinations(conn, rng, destinations, batch_size) if destinations else None
+            results["destinations"] = (destinations, time.perf_counter() - began)
+
+            if flights:
+                cur = conn.cursor()
+                #New flights may also use pilots/destinations already in the database
+                pilot_ids = (1, max(pilot_ids[1] if pilot_ids else 0, _next_id(cur, "Pilots", "personal_ID") - 1))
+                destination_ids = (1, max(destination_ids[1] if destination_ids else 0, _next_id(cur, "Destinations", "destination_ID") - 1))
+                if pilot_ids[1] < 1 or destination_ids[1] < 1:
+                    raise ValueError("Flights need at least one pilot and one destination")
+
+                began = time.perf_counter()
+                flight_count, log_count = generate_flights(conn, rng, flights, batch_size, pilot_ids, destination_ids, start, days, now)
+                seconds = time.perf_counter() - began
+                results["flights"] = (flight_count, seconds)
+                results["status log"] = (log_count, seconds)
+        finally:
+            conn.close()
+
+        #Log rows were written directly rather than through log_flight_status, so rebuild the delay summary from them
+        began = time.perf_counter()
+        rebuild_delay_stats()
+        results["delay stats"] = (0, time.perf_counter() - began)
+    finally:
+        reset_pool(db_path=previous_path)
+    return results
+
+#Entry point: parse command line options and generate the dataset if this script is executed directly
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a large synthetic FlyMe database for capacity testing")
+    parser.add_argument("--db", default=db_interaction_connection.DB_PATH, help="database file to create or add to")
+    parser.add_argument("--pilots", type=int, default=10000)
+    parser.add_argument("--destinations", type=int, default=1000)
+    parser.add_argument("--flights", type=int, default=100000)
+    parser.add_argument("--seed", type=int, default=1, help="random seed, the same seed gives the same data")
+    parser.add_argument("--batch-size", type=int, default=50000, help="rows per executemany/commit")
+    parser.add_argument("--start-date", default="2024-01-01", help="first departure date (YYYY-MM-DD)")
+    parser.add_argument("--days", type=int, default=730, help="number of days departures are spread over")
+    parser.add_argument("--now", default=None, help="time histories are generated up to (YYYY-MM-DD HH:MM:SS)")
+    args = parser.parse_args()
+
+    began = time.perf_counter()
+    results = generate_dataset(args.db, args.pilots, args.destinations, args.flights, args.seed, args.batch_size,
+                               args.start_date, args.days, args.now)
+    for label, (rows, seconds) in results.items():
+        if rows:
+            _report(label, rows, seconds)
+        else:
+            print(f"{label:<16} {'':>12}      in {seconds:8.2f}s")
+    total_rows = sum(rows for rows, seconds in results.values())
+    _report("total", total_rows, time.perf_counter() - began)
+    print(f"Database written to {args.db}")
@@ -0,0 +1,134 @@
+##Load generator for http_service.py: many clients sending a mix of requests for a fixed time, reporting requests per second
+#Each client is a thread with its own keep-alive connection, sending GETs picked at random (weighted) from the endpoint mix.
+#With --etag, clients send back the ETag of their last response for each path, as a dashboard polling for changes would,
+#so unchanged data comes back as "304 Not Modified". With --writes, a share of requests are status updates, so the ETags change
+#
+#Example: python http_load_test.py --clients 32 --seconds 10 --etag
+
+import argparse
+import http.client
+import json
+import random
+import threading
+import time
+from collections import Counter
+from urllib.parse import quote
+
+#(weight, path) of the GET requests sent. Heavy reports such as /pilots/conflicts are left out; add them with --path
+DEFAULT_MIX = [
+    (30, "/flights?status=Delayed"),
+    (15, "/flights?status=OnRoute"),
+    (10, "/delays/average"),
+    (10, "/delays/by-destination"),
+    (10, "/destinations"),
+    (10, "/pilots/1/flights?active=1"),
+    (5, "/destinations/1/flights"),
+    (5, "/flights?date=2025-06-01"),
+]
+
+def _percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+def _client(host, port, mix, deadline, etag, gzip, writes, flight_ids, results, lock, seed):
+    rng = random.Random(seed)
+    paths = [path for _, path in mix]
+    weights = [weight for weight, _ in mix]
+    etags = {}
+    latencies = []
+    statuses = Counter()
+    received = 0
+    errors = 0
+    conn = http.client.HTTPConnection(host, port, timeout=60)
+
+    while time.perf_counter() < deadline:
+        headers = {"Accept-Encoding": "gzip"} if gzip else {}
+        if writes and rng.random() < writes:
+            method, path = "POST", f"/flights/{rng.choice(flight_ids)}/status"
+            body = json.dumps({"status": rng.choice(["OnRoute", "Arrived", "NotDeparted"])})
+            headers["Content-Type"] = "application/json"
+        else:
+            method, path, body = "GET", rng.choices(paths, weights)[0], None
+            if etag and path in etags:
+                headers["If-None-Match"] = etags[path]
+
+        began = time.perf_counter()
+        try:
+            conn.request(method, path, body=body, headers=headers)
+            response = conn.getresponse()
+            data = response.read()
+        except (OSError, http.client.HTTPException):
+            errors += 1
+            conn.close()
+            conn = http.client.HTTPConnection(host, port, timeout=60)
+            time.sleep(0.1)  #Back off rather than spin while the service is down
+            continue
+        latencies.append(time.perf_counter() - began)
+        statuses[response.status] += 1
+        received += len(data)
+        if method == "GET" and response.getheader("ETag"):
+            etags[path] = response.getheader("ETag")
+    conn.close()
+
+    with lock:
+        results["latencies"].extend(latencies)
+        results["statuses"].update(statuses)
+        results["bytes"] += received
+        results["errors"] += errors
+
+def run_load(host="127.0.0.1", port=8080, clients=16, seconds=10.0, mix=DEFAULT_MIX, etag=False, gzip=True, writes=0.0, flight_ids=range(1, 101)):
+    '''
+    Run the load test and return {"requests", "seconds", "requests_per_second", "p50_ms", "p95_ms", "p99_ms", "statuses", "bytes", "errors"}
+    '''
+    results = {"latencies": [], "statuses": Counter(), "bytes": 0, "errors": 0}
+    lock = threading.Lock()
+    began = time.perf_counter()
+    deadline = began + seconds
+    threads = [
+        threading.Thread(target=_client, args=(host, port, mix, deadline, etag, gzip, writes, list(flight_ids), results, lock, seed))
+        for seed in range(clients)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - began
+
+    latencies = results["latencies"]
+    return {
+        "requests": len(latencies),
+        "seconds": elapsed,
+        "requests_per_second": len(latencies) / elapsed if elapsed > 0 else 0.0,
+        "p50_ms": _percentile(latencies, 0.50) * 1000,
+        "p95_ms": _percentile(latencies, 0.95) * 1000,
+        "p99_ms": _percentile(latencies, 0.99) * 1000,
+        "statuses": dict(results["statuses"]),
+        "bytes": results["bytes"],
+        "errors": results["errors"],
+    }
+
+#Entry point: run a load test from the command line if this script is executed directly
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Send a mix of requests to http_service.py and report requests per second")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--clients", type=int, default=16, help="concurrent clients (threads), each with a keep-alive connection")
+    parser.add_argument("--seconds", type=float, default=10.0, help="how long to run for")
+    parser.add_argument("--path", action="append", help="request only these paths (repeatable) instead of the default mix")
+    parser.add_argument("--etag", action="store_true", help="send If-None-Match with the last ETag seen for each path")
+    parser.add_argument("--no-gzip", action="store_true", help="do not ask for gzipped responses")
+    parser.add_argument("--writes", type=float, default=0.0, help="share of requests that are status updates, e.g. 0.05")
+    parser.add_argument("--flights", default="1-100", help="flight IDs the status updates pick from, as first-last")
+    args = parser.parse_args()
+
+    mix = [(1, quote(path, safe="/?=&")) for path in args.path] if args.path else DEFAULT_MIX
+    first, _, last = args.flights.partition("-")
+    report = run_load(args.host, args.port, args.clients, args.seconds, mix, args.etag, not args.no_gzip, args.writes,
+                      range(int(first), int(last or first) + 1))
+
+    print(f"{report['requests']:,} requests in {report['seconds']:.1f}s: {report['requests_per_second']:,.0f} requests/s")
+    print(f"Latency p50 {report['p50_ms']:.1f}ms, p95 {report['p95_ms']:.1f}ms, p99 {report['p99_ms']:.1f}ms")
+    print(f"Responses: {', '.join(f'{status}: {count:,}' for status, count in sorted(report['statuses'].items()))}"
+          f" ({report['bytes'] / 1e6:,.1f}MB received, {report['errors']} connection errors)")
@@ -0,0 +1,462 @@
+##Local HTTP/JSON service over the query functions, so many operators can share one process (and one warm connection pool and cache)
+#Built on asyncio streams and the asyncio API in db_interaction_async.py, with no packages beyond the standard library:
+#database work runs on that module's reader and writer lanes, while this thread handles the connections.
+#
+#   GET  /flights?status=Delayed          (or date=, arriving_on=, from=, to=, from_country=, to_country=; none for all flights)
+#   GET  /flights?as_of=2025-06-01 08:00:00   the board as it was then (with optional status=, from=, to=)
+#   GET  /pilots                          GET /pilots/{id}/flights?active=1        GET /pilots/conflicts
+#   GET  /destinations                    GET /destinations/{id}/flights           GET /destinations/by-cost    GET /destinations/unassigned
+#   GET  /delays                          GET /delays/average   GET /delays/by-destination   GET /delays/totals
+#        (/delays and /delays/totals take start= and end=, dates or times the delays were logged between)
+#   GET  /routes?from=1&to=5&depart_after=2025-06-01 08:00:00
+#   GET  /health                          pool, cache, lane and write queue statistics
+#   POST /flights/{id}/status             {"status": "Delayed", "departure_date_time": "2025-06-01 10:30:00"}
+#   POST /flights/{id}/pilot              {"personal_ID": 3}
+#   POST /status-events                   JSON list (or JSONL lines) of {"flight_ID", "status", "departure_date_time"}
+#
+#GET responses carry an ETag made from the database's data_version, which changes whenever anything is committed. A client
+#sending it back in If-None-Match gets "304 Not Modified" (no query, no body) until the data changes.
+#Responses are gzipped when the client accepts it and they are large enough to be worth it. Flight lists are streamed with chunked
+#transfer encoding a page at a time, so even all flights are sent without being held in memory. Other large results are sent
+#the same way, a batch at a time, so one big response never holds up the other connections.
+#
+#Example: python http_service.py --port 8080     (then e.g. curl "http://127.0.0.1:8080/flights?status=Delayed")
+
+import argparse
+import asyncio
+import json
+import os
+import re
+import time
+import zlib
+from datetime import datetime
+from urllib.parse import parse_qs, urlsplit
+
+import db_interaction_async as db_async
+from db_interaction_connection import pool_stats
+from db_interaction_write_queue import write_queue_stats
+from db_interaction_flight_queries import (
+    VALID_STATUSES,
+    flight_cache_stats,
+    get_data_version,
+    iter_flights_by_status,
+    iter_flights_by_date,
+    iter_flights_arriving_on,
+    iter_flights_by_destination_id,
+    iter_flights_by_arrival_id,
+    iter_flights_by_destination_country,
+    iter_flights_by_arrival_country,
+) #Import streaming flight lookups, and the data_version used for ETags
+from db_interaction_arrival_time import migrate_arrival_time
+from db_interaction_indexes import create_indexes
+from db_interaction_destination_cache import create_destination_version
+from export_data import FLIGHT_COLUMNS, PILOT_FLIGHT_COLUMNS, DELAY_EVENT_COLUMNS, CONFLICT_COLUMNS
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8080
+GZIP_MIN_BYTES = 1024  #Smaller responses are sent uncompressed
+GZIP_LEVEL = 6
+MAX_BODY_BYTES = 10 * 1024 * 1024  #Largest request body accepted
+KEEP_ALIVE_SECONDS = 15  #How long an idle connection is kept open
+REQUEST_TIMEOUT = 30.0  #Seconds a query may take before "504 Gateway Timeout"
+
+PILOT_COLUMNS = ["personal_ID", "first_name", "surname", "DOB", "email", "postcode", "city", "street"]
+DESTINATION_COLUMNS = ["destination_ID", "country", "name", "cost", "timezone"]
+DESTINATION_FLIGHT_COLUMNS = ["flight_ID", "destination_ID", "name"]
+DELAY_TOTAL_COLUMNS = ["flight_ID", "delays", "total_delay_minutes"]
+DELAY_BY_DESTINATION_COLUMNS = ["destination_ID", "country", "name", "delays", "average_minutes", "variance"]
+ROUTE_LEG_COLUMNS = ["flight_ID", "from_ID", "to_ID", "departure_date_time", "arrival_date_time"]
+
+REASONS = {200: "OK", 304: "Not Modified", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 409: "Conflict",
+           413: "Payload Too Large", 500: "Internal Server Error", 504: "Gateway Timeout"}
+
+#Tag for this run of the service, so ETags from an earlier run (whose data_version counted from a different start) never match
+_RUN_TAG = f"{os.getpid():x}{int(time.time()):x}"
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+class Request:
+    __slots__ = ("method", "path", "query", "headers", "body")
+
+    def __init__(self, method, path, query, headers, body):
+        self.method = method
+        self.path = path
+        self.query = query  #Name -> first value given
+        self.headers = headers  #Lower case name -> value
+        self.body = body
+
+    def param(self, name, required=False):
+        value = self.query.get(name)
+        if required and not value:
+            raise HTTPError(400, f"Query parameter '{name}' is required")
+        return value
+
+    def json(self):
+        try:
+            return json.loads(self.body or b"null")
+        except ValueError:
+            raise HTTPError(400, "Request body must be JSON")
+
+class Response:
+    '''
+    A response: "body" is bytes, or "chunks" an async iterator of bytes sent with chunked transfer encoding
+    '''
+    __slots__ = ("status", "body", "chunks", "headers")
+
+    def __init__(self, status=200, body=b"", chunks=None, headers=None):
+        self.status = status
+        self.body = body
+        self.chunks = chunks
+        self.headers = headers or {}
+
+def _json_response(data, status=200):
+    return Response(status, json.dumps(data, default=str).encode("utf-8"), headers={"Content-Type": "application/json"})
+
+def _rows_response(columns, rows):
+    if len(rows) <= db_async.STREAM_CHUNK:
+        return _json_response([dict(zip(columns, row)) for row in rows])
+    return _streamed_rows(columns, _batches(rows))
+
+async def _batches(rows):
+    #Large results are encoded and compressed a batch at a time, letting other connections run in between,
+    #instead of blocking them all while one big body is built
+    for start in range(0, len(rows), db_async.STREAM_CHUNK):
+        yield rows[start:start + db_async.STREAM_CHUNK]
+        await asyncio.sleep(0)
+
+def _streamed_rows(columns, chunks):
+    #Streams a JSON array, one chunk of rows (from db_async.stream_rows) at a time
+    async def body():
+        yield b"["
+        first = True
+        async for rows in chunks:
+            if not rows:
+                continue
+            text = ",".join(json.dumps(dict(zip(columns, row)), default=str) for row in rows)
+            yield (text if first else "," + text).encode("utf-8")
+            first = False
+        yield b"]"
+    return Response(200, chunks=body(), headers={"Content-Type": "application/json"})
+
+def _integer(text, name):
+    try:
+        return int(text)
+    except (TypeError, ValueError):
+        raise HTTPError(400, f"'{name}' must be a whole number")
+
+#----------------------------------------------------------------------------
+#Handlers: each takes the request and the regex match of its path, and returns a Response
+
+async def _flights(request, match):
+    query = request.query
+    if "as_of" in query:
+        #The board as it was at a past time, rebuilt from the status log (optionally for one status, departure or arrival)
+        status = query.get("status")
+        if status not in VALID_STATUSES + (None,):
+            raise HTTPError(400, f"status must be one of {', '.join(VALID_STATUSES)}")
+        rows = await db_async.get_flights_as_of(
+            query["as_of"], status,
+            destination_id=_integer(query["from"], "from") if "from" in query else None,
+            arrival_id=_integer(query["to"], "to") if "to" in query else None,
+            timeout=REQUEST_TIMEOUT,
+        )
+        return _rows_response(FLIGHT_COLUMNS, rows)
+    if "date" in query:
+        lookup, args = iter_flights_by_date, (query["date"],)
+    elif "arriving_on" in query:
+        lookup, args = iter_flights_arriving_on, (query["arriving_on"],)
+    elif "from" in query:
+        lookup, args = iter_flights_by_destination_id, (_integer(query["from"], "from"),)
+    elif "to" in query:
+        lookup, args = iter_flights_by_arrival_id, (_integer(query["to"], "to"),)
+    elif "from_country" in query:
+        lookup, args = iter_flights_by_destination_country, (query["from_country"],)
+    elif "to_country" in query:
+        lookup, args = iter_flights_by_arrival_country, (query["to_country"],)
+    else:
+        status = query.get("status", "all")
+        if status not in VALID_STATUSES + ("all",):
+            raise HTTPError(400, f"status must be one of {', '.join(VALID_STATUSES)} or all")
+        lookup, args = iter_flights_by_status, (status,)
+    if lookup in (iter_flights_by_date, iter_flights_arriving_on):
+        datetime.strptime(args[0], "%Y-%m-%d")  #Check the date before the response starts (a bad date raises ValueError, so 400)
+    return _streamed_rows(FLIGHT_COLUMNS, db_async.stream_rows(lookup, *args, timeout=REQUEST_TIMEOUT))
+
+async def _pilots(request, match):
+    return _rows_response(PILOT_COLUMNS, await db_async.get_all_pilots(timeout=REQUEST_TIMEOUT))
+
+async def _pilot_flights(request, match):
+    status_filter = "Arrived" if request.param("active") in ("1", "true", "yes") else None
+    rows = await db_async.get_flights_for_pilot(int(match["id"]), status_filter, timeout=REQUEST_TIMEOUT)
+    return _rows_response(PILOT_FLIGHT_COLUMNS, rows)
+
+async def _conflicts(request, match):
+    return _rows_response(CONFLICT_COLUMNS, await db_async.get_schedule_conflicts(timeout=REQUEST_TIMEOUT))
+
+async def _destinations(request, match):
+    return _rows_response(DESTINATION_COLUMNS, await db_async.get_all_destinations(timeout=REQUEST_TIMEOUT))
+
+async def _destinations_by_cost(request, match):
+    return _rows_response(DESTINATION_COLUMNS, await db_async.get_destinations_by_cost(timeout=REQUEST_TIMEOUT))
+
+async def _unassigned_destinations(request, match):
+    return _rows_response(DESTINATION_COLUMNS, await db_async.get_unassigned_destinations(timeout=REQUEST_TIMEOUT))
+
+async def _destination_flights(request, match):
+    rows = await db_async.get_flights_for_destination(int(match["id"]), timeout=REQUEST_TIMEOUT)
+    return _rows_response(DESTINATION_FLIGHT_COLUMNS, rows)
+
+async def _delays(request, match):
+    rows = await db_async.get_delay_events(request.param("start"), request.param("end"), timeout=REQUEST_TIMEOUT)
+    return _rows_response(DELAY_EVENT_COLUMNS, rows)
+
+async def _delay_average(request, match):
+    destination = request.param("destination")
+    stats = await db_async.get_delay_stats(None if destination is None else _integer(destination, "destination"), timeout=REQUEST_TIMEOUT)
+    return _json_response(stats or {"count": 0})
+
+async def _delays_by_destination(request, match):
+    return _rows_response(DELAY_BY_DESTINATION_COLUMNS, await db_async.get_delay_stats_by_destination(timeout=REQUEST_TIMEOUT))
+
+async def _delay_totals(request, match):
+    rows = await db_async.get_total_delay_by_flight(request.param("start"), request.param("end"), timeout=REQUEST_TIMEOUT)
+    return _rows_response(DELAY_TOTAL_COLUMNS, rows)
+
+async def _route(request, match):
+    from_id = _integer(request.param("from", required=True), "from")
+    to_id = _integer(request.param("to", required=True), "to")
+    depart_after = request.param("depart_after", required=True)
+    max_connections = _integer(request.param("max_connections") or db_async.routes.MAX_CONNECTIONS, "max_connections")
+    journey = await db_async.find_earliest_arrival(from_id, to_id, depart_after, max_connections, timeout=REQUEST_TIMEOUT)
+    if journey is None:
+        raise HTTPError(404, f"No journey found with up to {max_connections} connections")
+    journey["legs"] = [dict(zip(ROUTE_LEG_COLUMNS, leg)) for leg in journey["legs"]]
+    return _json_response(journey)
+
+async def _health(request, match):
+    return _json_response({"pool": pool_stats(), "flight_cache": flight_cache_stats(), "lanes": db_async.async_stats(),
+                           "write_queue": write_queue_stats()})
+
+def _status_event(item):
+    #{"flight_ID", "status", "departure_date_time"} (any case) -> (flight_ID, status, departure)
+    if not isinstance(item, dict):
+        raise HTTPError(400, "Each status event must be a JSON object")
+    item = {str(key).lower(): value for key, value in item.items()}
+    return (item.get("flight_id"), item.get("status"), item.get("departure_date_time") or item.get("departure"))
+
+def _result(flight_id, success, message):
+    return {"flight_ID": flight_id, "success": success, "message": message}
+
+async def _set_status(request, match):
+    body = request.json()
+    _, status, departure = _status_event(body)
+    result = await db_async.set_flight_status(int(match["id"]), status, departure, timeout=REQUEST_TIMEOUT)
+    return _json_response(_result(*result), 200 if result[1] else 409)
+
+async def _assign_pilot(request, match):
+    body = request.json()
+    if not isinstance(body, dict):
+        raise HTTPError(400, "Body must be {\"personal_ID\": ...}")
+    pilot_id = _integer({str(key).lower(): value for key, value in body.items()}.get("personal_id"), "personal_ID")
+    success, message = await db_async.assign_pilot(int(match["id"]), pilot_id, timeout=REQUEST_TIMEOUT)
+    return _json_response({"flight_ID": int(match["id"]), "success": success, "message": message}, 200 if success else 409)
+
+async def _status_events(request, match):
+    text = (request.body or b"").decode("utf-8").strip()
+    if text.startswith("["):
+        items = request.json()
+    else:
+        try:
+            items = [json.loads(line) for line in text.splitlines() if line.strip()]
+        except ValueError:
+            raise HTTPError(400, "Body must be a JSON list or JSON lines of status events")
+    results = await db_async.apply_status_events([_status_event(item) for item in items], timeout=REQUEST_TIMEOUT)
+    failed = sum(1 for result in results if not result[1])
+    return _json_response({"applied": len(results) - failed, "failed": failed, "results": [_result(*result) for result in results]})
+
+#(method, path pattern, handler)
+ROUTES = [
+    ("GET", r"/flights", _flights),
+    ("POST", r"/flights/(?P<id>\d+)/status", _set_status),
+    ("POST", r"/flights/(?P<id>\d+)/pilot", _assign_pilot),
+    ("POST", r"/status-events", _status_events),
+    ("GET", r"/pilots", _pilots),
+    ("GET", r"/pilots/conflicts", _conflicts),
+    ("GET", r"/pilots/(?P<id>\d+)/flights", _pilot_flights),
+    ("GET", r"/destinations", _destinations),
+    ("GET", r"/destinations/by-cost", _destinations_by_cost),
+    ("GET", r"/destinations/unassigned", _unassigned_destinations),
+    ("GET", r"/destinations/(?P<id>\d+)/flights", _destination_flights),
+    ("GET", r"/delays", _delays),
+    ("GET", r"/delays/average", _delay_average),
+    ("GET", r"/delays/by-destination", _delays_by_destination),
+    ("GET", r"/delays/totals", _delay_totals),
+    ("GET", r"/routes", _route),
+    ("GET", r"/health", _health),
+]
+_COMPILED_ROUTES = [(method, re.compile(pattern + r"/?"), handler) for method, pattern, handler in ROUTES]
+
+#----------------------------------------------------------------------------
+#HTTP/1.1 handling
+
+async def _read_request(reader):
+    #Returns a Request, or None when the client has closed the connection
+    try:
+        line = await asyncio.wait_for(reader.readline(), KEEP_ALIVE_SECONDS)
+    except asyncio.TimeoutError:
+        return None
+    if not line:
+        return None
+    try:
+        method, target, _ = line.decode("latin-1").split()
+    except ValueError:
+        raise HTTPError(400, "Malformed request line")
+
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+
+    length = int(headers.get("content-length") or 0)
+    if length > MAX_BODY_BYTES:
+        raise HTTPError(413, f"Request body is larger than {MAX_BODY_BYTES} bytes")
+    body = await reader.readexactly(length) if length else b""
+
+    url = urlsplit(target)
+    query = {name: values[0] for name, values in parse_qs(url.query).items()}
+    return Request(method.upper(), url.path, query, headers, body)
+
+def _route_request(request):
+    allowed = False
+    for method, pattern, handler in _COMPILED_ROUTES:
+        match = pattern.fullmatch(request.path)
+        if match:
+            if method == request.method:
+                return handler, match
+            allowed = True
+    if allowed:
+        raise HTTPError(405, f"{request.method} is not allowed on {request.path}")
+    raise HTTPError(404, f"No such endpoint: {request.path}")
+
+async def _respond(request):
+    #Works out the response for a request, including the ETag check. Errors become JSON error responses
+    try:
+        handler, match = _route_request(request)
+        etag = None
+        if request.method == "GET" and request.path.rstrip("/") != "/health":
+            #Read the version before the query, so the ETag can only be older than the data (never claim newer data than was sent)
+            etag = f'W/"{_RUN_TAG}-{await db_async.run_read(get_data_version)}"'
+            if etag in [tag.strip() for tag in request.headers.get("if-none-match", "").split(",")]:
+                return Response(304, headers={"ETag": etag})
+        response = await handler(request, match)
+        if etag:
+            response.headers["ETag"] = etag
+            response.headers["Cache-Control"] = "no-cache"
+        return response
+    except HTTPError as e:
+        return _json_response({"error": str(e)}, e.status)
+    except asyncio.TimeoutError:
+        return _json_response({"error": "The query took too long"}, 504)
+    except ValueError as e:
+        return _json_response({"error": str(e)}, 400)
+    except Exception as e:
+        print(f"Failed to handle {request.method} {request.path}: {e!r}")
+        return _json_response({"error": "Internal server error"}, 500)
+
+async def _write_response(writer, request, response, keep_alive):
+    headers = dict(response.headers)
+    headers["Connection"] = "keep-alive" if keep_alive else "close"
+    accepts_gzip = request is not None and "gzip" in request.headers.get("accept-encoding", "")
+    if response.status != 304:
+        headers["Vary"] = "Accept-Encoding"
+
+    if response.chunks is None:
+        body = response.body
+        if accepts_gzip and len(body) >= GZIP_MIN_BYTES:
+            compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)  #31 = gzip wrapper
+            body = compressor.compress(body) + compressor.flush()
+            headers["Content-Encoding"] = "gzip"
+        headers["Content-Length"] = str(len(body))
+        writer.write(_head(response.status, headers) + body)
+        await writer.drain()
+        return
+
+    #Streamed: chunked transfer encoding, compressing each piece as it goes when gzip is accepted
+    headers["Transfer-Encoding"] = "chunked"
+    compressor = None
+    if accepts_gzip:
+        compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+        headers["Content-Encoding"] = "gzip"
+    writer.write(_head(response.status, headers))
+    async for piece in response.chunks:
+        if compressor is not None:
+            piece = compressor.compress(piece)
+        if piece:
+            writer.write(b"%x\r\n%s\r\n" % (len(piece), piece))
+            await writer.drain()  #Waits for slow clients, so unread rows are not queued up in memory
+    tail = compressor.flush() if compressor is not None else b""
+    if tail:
+        writer.write(b"%x\r\n%s\r\n" % (len(tail), tail))
+    writer.write(b"0\r\n\r\n")
+    await writer.drain()
+
+def _head(status, headers):
+    lines = [f"HTTP/1.1 {status} {REASONS.get(status, '')}"] + [f"{name}: {value}" for name, value in headers.items()]
+    return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+async def _handle_connection(reader, writer):
+    try:
+        while True:
+            try:
+                request = await _read_request(reader)
+            except HTTPError as e:
+                await _write_response(writer, None, _json_response({"error": str(e)}, e.status), keep_alive=False)
+                return
+            if request is None:
+                return
+            keep_alive = request.headers.get("connection", "").lower() != "close"
+            response = await _respond(request)
+            await _write_response(writer, request, response, keep_alive)
+            if not keep_alive:
+                return
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass  #Client went away
+    except Exception as e:
+        #Failed part way through a streamed response. The status has already been sent, so the connection is closed
+        #without the final chunk, which the client sees as an incomplete response
+        print(f"Failed while sending a response: {e!r}")
+    finally:
+        writer.close()
+
+async def serve(host=DEFAULT_HOST, port=DEFAULT_PORT):
+    '''
+    Run the service until cancelled
+    '''
+    server = await asyncio.start_server(_handle_connection, host, port)
+    print(f"FlyMe service listening on http://{host}:{port}")
+    async with server:
+        await server.serve_forever()
+
+#Entry point: start the service if this script is executed directly
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve the FlyMe queries as a local HTTP/JSON service")
+    parser.add_argument("--host", default=DEFAULT_HOST, help="address to listen on (default: local connections only)")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    args = parser.parse_args()
+
+    #Bring an older database up to date first, as the menu does
+    migrate_arrival_time()
+    create_indexes()
+    create_destination_version()
+    try:
+        asyncio.run(serve(args.host, args.port))
+    except KeyboardInterrupt:
+        print("Stopped.")
+    finally:
+        db_async.shutdown_async()
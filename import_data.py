@@ -0,0 +1,327 @@
+##Script to bulk import pilots, destinations or flights from CSV or JSONL files (optionally gzipped)
+#Rows are read one at a time and checked against the same rules as the table definitions in setup_db.py (status values, timezone
+#range, postcode length, non-negative cost and flight time, date formats), and flights' pilot and destination IDs are checked
+#against ID sets read once at the start. Valid rows are inserted in large batches, one transaction per batch, and each new flight
+#is logged in FlightStatusLog in the same transaction as every other new flight is: first as NotDeparted, then (if the file gives
+#another status) its status as a second entry, so the log has the change from NotDeparted like any other status update. For a
+#Delayed flight the NotDeparted entry has the departure time before the delay, given in scheduled_departure_date_time, so the
+#delay reports count the delay. Rejected rows are written to an error file (JSONL) with the reason.
+#Only one batch is held in memory at a time, so memory use does not grow with the size of the file
+#
+#Example: python import_data.py flights new_flights.csv --errors rejected.jsonl
+#Column names are the table's column names (any case). ID columns (personal_ID, destination_ID, flight_ID) are optional, and
+#flights may also have scheduled_departure_date_time (required when the status is Delayed)
+
+import argparse
+import csv
+import gzip
+import json
+import os
+import sqlite3
+import time
+from datetime import datetime, timedelta
+
+from db_interaction_connection import get_connection
+from db_interaction_log import log_flight_statuses
+from db_interaction_flight_queries import VALID_STATUSES, invalidate_flight_cache
+from db_interaction_destination_cache import get_all_destinations, refresh_destination_cache
+from db_interaction_routes import update_route_graph
+from db_interaction_history import checkpoint_after_write
+
+BATCH_SIZE = 5000  #Rows per transaction
+
+#----------------------------------------------------------------------------
+#Readers: each yields (line number, row as a dict with lower case keys)
+
+def _open_text(path):
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8", newline="")
+    return open(path, "r", encoding="utf-8", newline="")
+
+def read_csv(path):
+    with _open_text(path) as source:
+        reader = csv.DictReader(source)
+        for row in reader:
+            yield reader.line_num, {key.strip().lower(): value for key, value in row.items() if key is not None}
+
+def read_jsonl(path):
+    with _open_text(path) as source:
+        for line_number, line in enumerate(source, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except json.JSONDecodeError as e:
+                yield line_number, ValueError(f"Invalid JSON: {e}")
+                continue
+            if not isinstance(row, dict):
+                yield line_number, ValueError("Each line must be a JSON object")
+                continue
+            yield line_number, {str(key).strip().lower(): value for key, value in row.items()}
+
+READERS = {"csv": read_csv, "jsonl": read_jsonl}
+
+def detect_format(path):
+    '''
+    Returns the reader name (a key of READERS) for a file, from its extension (.csv, .jsonl or .ndjson, optionally .gz)
+    Raises ValueError if it cannot be told
+    '''
+    name = path[:-3] if path.endswith(".gz") else path
+    if name.endswith(".csv"):
+        return "csv"
+    if name.endswith((".jsonl", ".ndjson")):
+        return "jsonl"
+    raise ValueError(f"Cannot tell the format of {path}, use --format")
+
+#----------------------------------------------------------------------------
+#Field checks, matching the constraints in setup_db.py. Each raises ValueError with the reason a row is rejected
+
+def _missing(value):
+    return value is None or (isinstance(value, str) and not value.strip())
+
+def _text(row, field, max_length=None):
+    value = row.get(field)
+    if _missing(value):
+        raise ValueError(f"{field} is required")
+    value = str(value).strip()
+    if max_length is not None and len(value) > max_length:
+        raise ValueError(f"{field} must be at most {max_length} characters")
+    return value
+
+def _integer(row, field, optional=False):
+    value = row.get(field)
+    if _missing(value):
+        if optional:
+            return None
+        raise ValueError(f"{field} is required")
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{field} must be a whole number")
+    if not number.is_integer():
+        raise ValueError(f"{field} must be a whole number")
+    return int(number)
+
+def _number(row, field):
+    value = row.get(field)
+    if _missing(value):
+        raise ValueError(f"{field} is required")
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{field} must be a number")
+
+def _datetime(row, field, date_format):
+    #fromisoformat is much faster than strptime, and formatting the result back must give the same text, so the format is still exact
+    value = _text(row, field)
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        parsed = None
+    if parsed is None or parsed.strftime(date_format) != value:
+        raise ValueError(f"{field} must be in the format {date_format.replace('%', '')}")
+    return parsed
+
+def _pilot_row(row, known):
+    first_name = _text(row, "first_name")
+    surname = _text(row, "surname")
+    dob = _datetime(row, "dob", "%Y-%m-%d").strftime("%Y-%m-%d")
+    email = _text(row, "email")
+    postcode = _text(row, "postcode", max_length=8)
+    city = _text(row, "city")
+    street = _text(row, "street")
+    return (_integer(row, "personal_id", optional=True), first_name, surname, dob, email, postcode, city, street)
+
+def _destination_row(row, known):
+    country = _text(row, "country")
+    name = _text(row, "name")
+    cost = _number(row, "cost")
+    if cost < 0:
+        raise ValueError("cost must be 0 or more")
+    timezone = _integer(row, "timezone")
+    if not -12 <= timezone <= 14:
+        raise ValueError("timezone must be between -12 and 14")
+    return (_integer(row, "destination_id", optional=True), country, name, cost, timezone)
+
+def _flight_row(row, known):
+    personal_id = _integer(row, "personal_id")
+    if personal_id not in known["pilots"]:
+        raise ValueError(f"No pilot with personal_ID {personal_id}")
+    destination_id = _integer(row, "destination_id")
+    arrival_id = _integer(row, "arrival_destination_id")
+    for field, value in (("destination_ID", destination_id), ("arrival_destination_ID", arrival_id)):
+        if value not in known["destinations"]:
+            raise ValueError(f"No destination with {field} {value}")
+    departure = _datetime(row, "departure_date_time", "%Y-%m-%d %H:%M:%S")
+    flight_time = _integer(row, "flight_time")
+    if flight_time < 0:
+        raise ValueError("flight_time must be 0 or more")
+    status = "NotDeparted" if _missing(row.get("status")) else str(row["status"]).strip()
+    if status not in VALID_STATUSES:
+        raise ValueError(f"status must be one of {', '.join(VALID_STATUSES)}")
+    #Departure time the flight was first logged with: before the delay for a Delayed flight, otherwise the departure time
+    if not _missing(row.get("scheduled_departure_date_time")):
+        scheduled = _datetime(row, "scheduled_departure_date_time", "%Y-%m-%d %H:%M:%S")
+    elif status == "Delayed":
+        raise ValueError("scheduled_departure_date_time (the departure time before the delay) is required for a Delayed flight")
+    else:
+        scheduled = departure
+    arrival = departure + timedelta(minutes=flight_time)
+    return (_integer(row, "flight_id", optional=True), personal_id, destination_id, arrival_id,
+            departure.strftime("%Y-%m-%d %H:%M:%S"), flight_time, status, arrival.strftime("%Y-%m-%d %H:%M:%S"),
+            scheduled.strftime("%Y-%m-%d %H:%M:%S"))
+
+#----------------------------------------------------------------------------
+#Writers: each inserts a batch of checked rows on the caller's connection, inside the caller's transaction
+
+def _insert_pilots(cur, rows):
+    cur.executemany("""
+        INSERT INTO Pilots (personal_ID, first_name, surname, DOB, email, postcode, city, street)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    """, rows)
+
+def _insert_destinations(cur, rows):
+    cur.executemany("INSERT INTO Destinations (destination_ID, country, name, cost, timezone) VALUES (?, ?, ?, ?, ?)", rows)
+
+def _insert_flights(cur, rows):
+    #New flights are given explicit IDs, so their FlightStatusLog entries can be written in the same batch
+    cur.execute("SELECT COALESCE(MAX(flight_ID), 0) + 1 FROM Flights")
+    next_id = cur.fetchone()[0]
+    flights = []
+    log_entries = []
+    for flight_id, *values, scheduled in rows:
+        if flight_id is None:
+            flight_id = next_id
+        next_id = max(next_id, flight_id + 1)
+        flights.append((flight_id, *values))
+        #Logged as NotDeparted first, as when a flight is added from the menu, then the status from the file as a change from that
+        status, departure = values[5], values[3]
+        log_entries.append((flight_id, "NotDeparted", scheduled))
+        if status != "NotDeparted":
+            log_entries.append((flight_id, status, departure))
+
+    cur.executemany("""
+        INSERT INTO Flights (flight_ID, personal_ID, destination_ID, arrival_destination_ID, departure_date_time, flight_time, status, arrival_date_time)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    """, flights)
+    log_flight_statuses(cur, log_entries)
+    return [flight[0] for flight in flights]
+
+#Table name -> (row check, batch writer)
+TABLES = {
+    "pilots": (_pilot_row, _insert_pilots),
+    "destinations": (_destination_row, _insert_destinations),
+    "flights": (_flight_row, _insert_flights),
+}
+
+def _known_ids(conn, table):
+    #ID sets the flight foreign keys are checked against, read once
+    if table != "flights":
+        return {}
+    return {
+        "pilots": {row[0] for row in conn.execute("SELECT personal_ID FROM Pilots")},
+        "destinations": {row[0] for row in get_all_destinations()},
+    }
+
+def import_file(table, path, file_format=None, errors_path=None, batch_size=BATCH_SIZE, profile=None):
+    '''
+    Import every row of a CSV or JSONL file into "pilots", "destinations" or "flights"
+    Rejected rows are written to errors_path (default: the input path + ".rejected.jsonl") as {"line", "error", "row"} objects.
+    The file is only there when this import rejected something: one left by an earlier import is removed first
+    Returns {"rows": rows read, "imported": rows inserted, "rejected": rows rejected}
+    '''
+    if table not in TABLES:
+        raise ValueError(f"Unknown table '{table}'. Choose from: {', '.join(TABLES)}")
+    check_row, insert_batch = TABLES[table]
+    reader = READERS[file_format or detect_format(path)]
+    errors_path = errors_path or path + ".rejected.jsonl"
+
+    counts = {"rows": 0, "imported": 0, "rejected": 0}
+    error_file = None
+    if os.path.exists(errors_path):
+        os.remove(errors_path)  #So an old file is never taken for this import's rejects
+
+    def reject(line_number, error, row):
+        nonlocal error_file
+        if error_file is None:
+            error_file = open(errors_path, "w", encoding="utf-8")
+        error_file.write(json.dumps({"line": line_number, "error": str(error), "row": row}, default=str) + "\n")
+        counts["rejected"] += 1
+
+    conn = get_connection(profile)
+    try:
+        known = _known_ids(conn, table)
+        batch = []  #(line number, original row, checked values)
+
+        def flush():
+            #Inserts the batch in one transaction. If the database refuses it (e.g. a duplicate email or ID), the batch is
+            #rolled back and retried one row at a time, so only the rows that actually fail are rejected
+            #Bulk imports bypass the write queue on purpose (see db_interaction_write_queue.py)
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                new_ids = insert_batch(conn.cursor(), [values for _, _, values in batch])
+                conn.commit()
+                counts["imported"] += len(batch)
+            except sqlite3.DatabaseError:
+                conn.rollback()
+                new_ids = []
+                for line_number, row, values in batch:
+                    try:
+                        conn.execute("BEGIN IMMEDIATE")
+                        new_ids += insert_batch(conn.cursor(), [values]) or []
+                        conn.commit()
+                        counts["imported"] += 1
+                    except sqlite3.DatabaseError as e:
+                        conn.rollback()
+                        reject(line_number, e, row)
+            if new_ids:
+                update_route_graph(new_ids)
+            batch.clear()
+
+        for line_number, row in reader(path):
+            counts["rows"] += 1
+            if isinstance(row, ValueError):
+                reject(line_number, row, None)
+                continue
+            try:
+                batch.append((line_number, row, check_row(row, known)))
+            except ValueError as e:
+                reject(line_number, e, row)
+                continue
+            if len(batch) >= batch_size:
+                flush()
+        if batch:
+            flush()
+    finally:
+        conn.close()
+        if error_file is not None:
+            error_file.close()
+
+    #Keep the in-memory caches in step with what was imported
+    if counts["imported"]:
+        if table == "destinations":
+            refresh_destination_cache()
+        elif table == "flights":
+            invalidate_flight_cache()
+            checkpoint_after_write()
+    return counts
+
+#Entry point: import a file from the command line if this script is executed directly
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bulk import pilots, destinations or flights from a CSV or JSONL file")
+    parser.add_argument("table", choices=sorted(TABLES), help="table to import into")
+    parser.add_argument("path", help="file to import (.csv, .jsonl or .ndjson, optionally .gz)")
+    parser.add_argument("--format", choices=sorted(READERS), help="file format, if it cannot be told from the file name")
+    parser.add_argument("--errors", help="file rejected rows are written to (default: <path>.rejected.jsonl)")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="rows per transaction")
+    parser.add_argument("--profile", default=None, help="tuning profile, default FLYME_DB_PROFILE or oltp. "
+                        "bulk-load is faster but cannot roll back a failed batch, so only use it on a fresh database")
+    args = parser.parse_args()
+
+    began = time.perf_counter()
+    counts = import_file(args.table, args.path, args.format, args.errors, args.batch_size, args.profile)
+    seconds = time.perf_counter() - began
+    rate = counts["rows"] / seconds if seconds > 0 else float("inf")
+    print(f"{counts['imported']:,} of {counts['rows']:,} rows imported into {args.table} in {seconds:.2f}s ({rate:,.0f} rows/s)")
+    if counts["rejected"]:
+        print(f"{counts['rejected']:,} rows rejected, see {args.errors or args.path + '.rejected.jsonl'}")
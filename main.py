@@ -1,16 +1,19 @@
+import sys
 from datetime import datetime
+from itertools import chain, islice
 
 #---------------------------------------------------------------------------------------------------------------------------------
 #Importing functions from each relevant file to be called in Main when selected from menu options
 
 #Calling functions related to queries from Flight table
 from db_interaction_flight_queries import (
-    get_flights_by_status,
-    get_flights_by_arrival_id,
-    get_flights_by_destination_id,
-    get_flights_by_destination_country,
-    get_flights_by_arrival_country,
-    get_flights_by_date,
+    iter_flights_by_status,
+    iter_flights_by_arrival_id,
+    iter_flights_by_destination_id,
+    iter_flights_by_destination_country,
+    iter_flights_by_arrival_country,
+    iter_flights_by_date,
+    iter_flights_arriving_on,
     add_new_flight,
     cancel_flight_by_id,
     update_flight_status,
@@ -27,6 +30,16 @@ from db_interaction_pilot_queries import (
     view_active_flights_for_pilot,
 )
 
+#Calling functions related to pilot double-booking checks
+from db_interaction_pilot_schedule import (
+    view_schedule_conflicts,
+)
+
+#Calling functions related to automatic pilot rostering
+from db_interaction_roster import (
+    run_roster,
+)
+
 #Calling functions related to queries from Destination table
 from db_interaction_destination_queries import (
     view_all_destinations,
@@ -38,12 +51,33 @@ from db_interaction_destination_queries import (
     view_unassigned_destinations,
 )
 
+#Calling functions related to the route graph (journeys between Destinations)
+from db_interaction_routes import (
+    view_route,
+)
+
 #Calling functions related to queries from FlightStatusLog table
 from db_interaction_log_out import (
     view_delayed_flights_with_duration,
     view_average_delay_duration,
 )
 
+#Calling functions related to the FlightDelayStats summary
+from db_interaction_delay_stats import (
+    view_delay_stats_by_destination,
+)
+
+#Calling function which shows flights as they were at a past time, rebuilt from the status log
+from db_interaction_history import view_flights_as_of
+
+#Calling functions which bring databases made by older versions up to date
+from db_interaction_arrival_time import migrate_arrival_time
+from db_interaction_indexes import create_indexes
+from db_interaction_destination_cache import create_destination_version
+
+#Calling the non-interactive command line, used when main.py is run with arguments
+from command_line import run_cli
+
 #---------------------------------------------------------------------------------------------------------------------------------
 
 #---------------------------------------------------------------------------------------------------------------------------------
@@ -76,7 +110,9 @@ def show_flight_menu():
     print("5. Flights by Departure ID")
     print("6. Flights by Departure Country")
     print("7. Flights by Date")
-    print("8. Back to Main Menu\n")
+    print("8. Flights Arriving on Date")
+    print("9. Flights As Of a Date and Time")
+    print("10. Back to Main Menu\n")
 
 def show_flight_update_menu():
     '''
@@ -108,7 +144,9 @@ def show_pilot_scheldule_menu():
     print("1. Re-assign Pilot")
     print("2. Pilot Scheldule and History")
     print("3. Pilots Scheldule")
-    print("4. Back to Main Menu\n")
+    print("4. Double-booked Pilots")
+    print("5. Auto-assign Pilots for a Date Range")
+    print("6. Back to Main Menu\n")
 
 def show_destination_manage_menu():
     '''
@@ -124,7 +162,8 @@ def show_destination_manage_menu():
     print("5. See Flights Assigned to Location")
     print("6. See Location Cost, Sort By Cost")
     print("7. View Destinations with No Assigned Flights")
-    print("8. Back to Main Menu\n")
+    print("8. Find Route Between Locations")
+    print("9. Back to Main Menu\n")
 
 def show_delay_manage_menu():
     '''
@@ -134,24 +173,43 @@ def show_delay_manage_menu():
     print("\n--- Delay Information ---")
     print("1. Show Delayed Flights")
     print("2. Average Time of Delay")
-    print("3. Back to Main Menu\n")
+    print("3. Delays by Departure Location")
+    print("4. Back to Main Menu\n")
 
 #---------------------------------------------------------------------------------------------------------------------------------
 #Function related to table formating
+#"rows" can be a list, or any iterable such as the streaming flight queries. For a list, column widths fit every row.
+#Otherwise widths are worked out from the first SAMPLE_ROWS rows only, and the rest are printed as they arrive,
+#so the first rows appear straight away and the full result never has to be held in memory
+SAMPLE_ROWS = 200
+
 def format_table(rows, headers):
-    col_widths = [max(len(str(cell)) for cell in col) for col in zip(*([headers] + rows))]
+    if isinstance(rows, list):
+        sample = rows
+        rest = []
+    else:
+        rows = iter(rows)
+        sample = list(islice(rows, SAMPLE_ROWS))
+        rest = rows
+
+    col_widths = [max(len(str(cell)) for cell in col) for col in zip(*([headers] + sample))]
     row_format = " | ".join("{:<" + str(width) + "}" for width in col_widths)
 
     print("\n" + row_format.format(*headers))
     print("-" * (sum(col_widths) + 3 * (len(headers) - 1)))
-    for row in rows:
-        print(row_format.format(*row))
+    for row in chain(sample, rest):
+        print(row_format.format(*(str(cell) for cell in row)))
 
 #---------------------------------------------------------------------------------------------------------------------------------
 #Main Function
 #Handles User Input, menu/sub-menu display and relevent Function calling
 
 def main():
+    #Add the stored arrival time column, any missing indexes and the Destinations version to an older database (does nothing once done)
+    migrate_arrival_time()
+    create_indexes()
+    create_destination_version()
+
     while True:
         show_menu() #Main menu which leads to sub-menu's
         choice = input("Select an option: ")
@@ -162,43 +220,43 @@ def main():
                 sub_choice = input("Select a flight view option: ")
 
                 if sub_choice == "1": #View all flights
-                    flights = get_flights_by_status("all") #Calls gets_flights_by_status but passes "all" which displays all data
-                    headers = ["Flight ID", "Personal ID", "Destination ID", "Arrival Destination ID", "Departure Time", "Flight Time", "Status"]
+                    flights = iter_flights_by_status("all") #Calls iter_flights_by_status but passes "all" which streams all data a page at a time
+                    headers = ["Flight ID", "Personal ID", "Destination ID", "Arrival Destination ID", "Departure Time", "Flight Time", "Status", "Arrival Time"]
                     format_table(flights, headers)
                     input("\nPress Enter to return to the flight menu...")
 
                 elif sub_choice == "2": #Displays Flights of specified Status
                     status = input("Enter flight status (e.g., Arrived, Cancelled): ")
-                    flights = get_flights_by_status(status)
-                    headers = ["Flight ID", "Personal ID", "Destination ID", "Arrival Destination ID", "Departure Time", "Flight Time", "Status"]
+                    flights = iter_flights_by_status(status)
+                    headers = ["Flight ID", "Personal ID", "Destination ID", "Arrival Destination ID", "Departure Time", "Flight Time", "Status", "Arrival Time"]
                     format_table(flights, headers) #Calls table for formatting
                     input("\nPress Enter to return to the flight menu...")
                 
                 elif sub_choice == "3": #Displays flights going to sepcified Destination (from ID)
                     dest_ID = input("Enter Destination Country ID: ")
-                    flights = get_flights_by_destination_id(dest_ID)
-                    headers = ["Flight ID", "Personal ID", "Destination ID", "Arrival Destination ID", "Departure Time", "Flight Time", "Status"]
+                    flights = iter_flights_by_destination_id(dest_ID)
+                    headers = ["Flight ID", "Personal ID", "Destination ID", "Arrival Destination ID", "Departure Time", "Flight Time", "Status", "Arrival Time"]
                     format_table(flights, headers)
                     input("\nPress Enter to return to the flight menu...")
 
                 elif sub_choice == "4": #Displays flights going to sepcified Destination (from country name)
                     dest_name = input("Enter Destination Country: ")
-                    flights = get_flights_by_destination_country(dest_name)
-                    headers = ["Flight ID", "Personal ID", "Destination ID", "Arrival Destination ID", "Departure Time", "Flight Time", "Status"]
+                    flights = iter_flights_by_destination_country(dest_name)
+                    headers = ["Flight ID", "Personal ID", "Destination ID", "Arrival Destination ID", "Departure Time", "Flight Time", "Status", "Arrival Time"]
                     format_table(flights, headers)
                     input("\nPress Enter to return to the flight menu...")
                 
                 elif sub_choice == "5": #Displays flights going to sepcified Departure Location (from ID)
                     arr_name = input("Enter Departure Country ID: ")
-                    flights = get_flights_by_arrival_id(arr_name)
-                    headers = ["Flight ID", "Personal ID", "Destination ID", "Arrival Destination ID", "Departure Time", "Flight Time", "Status"]
+                    flights = iter_flights_by_arrival_id(arr_name)
+                    headers = ["Flight ID", "Personal ID", "Destination ID", "Arrival Destination ID", "Departure Time", "Flight Time", "Status", "Arrival Time"]
                     format_table(flights, headers)
                     input("\nPress Enter to return to the flight menu...")
 
                 elif sub_choice == "6": #Displays flights going to sepcified Departure Location (from country name)
                     arr_name = input("Enter Departure Country: ")
-                    flights = get_flights_by_arrival_country(arr_name)
-                    headers = ["Flight ID", "Personal ID", "Destination ID", "Arrival Destination ID", "Departure Time", "Flight Time", "Status"]
+                    flights = iter_flights_by_arrival_country(arr_name)
+                    headers = ["Flight ID", "Personal ID", "Destination ID", "Arrival Destination ID", "Departure Time", "Flight Time", "Status", "Arrival Time"]
                     format_table(flights, headers)
                     input("\nPress Enter to return to the flight menu...")
 
@@ -206,14 +264,30 @@ def main():
                     date = input("Enter Departure Date (YYYY-MM-DD): ")
                     try:
                         datetime.strptime(date, "%Y-%m-%d")
-                        flights = get_flights_by_date(date)
-                        headers = ["Flight ID", "Personal ID", "Destination ID", "Arrival Destination ID", "Departure Time", "Flight Time", "Status"]
+                        flights = iter_flights_by_date(date)
+                        headers = ["Flight ID", "Personal ID", "Destination ID", "Arrival Destination ID", "Departure Time", "Flight Time", "Status", "Arrival Time"]
+                        format_table(flights, headers)
+                    except ValueError:
+                        print("Invalid date format. Please use YYYY-MM-DD.")
+                    input("\nPress Enter to return to the flight menu...")
+
+                elif sub_choice == "8": #Displays flights arriving on sepcified Date
+                    date = input("Enter Arrival Date (YYYY-MM-DD): ")
+                    try:
+                        datetime.strptime(date, "%Y-%m-%d")
+                        flights = iter_flights_arriving_on(date)
+                        headers = ["Flight ID", "Personal ID", "Destination ID", "Arrival Destination ID", "Departure Time", "Flight Time", "Status", "Arrival Time"]
                         format_table(flights, headers)
                     except ValueError:
                         print("Invalid date format. Please use YYYY-MM-DD.")
                     input("\nPress Enter to return to the flight menu...")
 
-                elif sub_choice == "8": #Leave sub-menu and return to menu
+                elif sub_choice == "9": #Displays every flight with the status and departure time it had at a past date and time
+                    timestamp = input("Enter Date and Time (YYYY-MM-DD HH:MM:SS): ")
+                    view_flights_as_of(timestamp, format_table)
+                    input("\nPress Enter to return to the flight menu...")
+
+                elif sub_choice == "10": #Leave sub-menu and return to menu
                     break
 
                 else:
@@ -291,7 +365,15 @@ def main():
                     view_active_flights_for_pilot(pilot_id, format_table)
                     input("\nPress Enter to return to the pilot menu...")
 
-                elif sub_choice == "4": #Exit sub-menu, return to Main Menu
+                elif sub_choice == "4": #View every pair of overlapping flights assigned to the same pilot
+                    view_schedule_conflicts(format_table)
+                    input("\nPress Enter to return to the pilot menu...")
+
+                elif sub_choice == "5": #Assign pilots to every flight departing in a date range automatically
+                    run_roster()
+                    input("\nPress Enter to return to the pilot menu...")
+
+                elif sub_choice == "6": #Exit sub-menu, return to Main Menu
                     break
 
                 else: #Error/Invalid input handling
@@ -333,7 +415,19 @@ def main():
                     view_unassigned_destinations(format_table)
                     input("\nPress Enter to return to the destination menu...")
 
-                elif sub_choice == "8": #Exity sub-menu, return to Main menu
+                elif sub_choice == "8": #Run Function to find the earliest arriving journey between two Destinations, with connections
+                    from_id = input("Enter Departure Destination ID: ")
+                    to_id = input("Enter Arrival Destination ID: ")
+                    depart_after = input("Depart at or after (YYYY-MM-DD HH:MM:SS): ")
+                    try:
+                        datetime.strptime(depart_after, "%Y-%m-%d %H:%M:%S")
+                        int(from_id), int(to_id)
+                        view_route(from_id, to_id, depart_after, format_table)
+                    except ValueError:
+                        print("Invalid input. Please check the destination IDs and date format.")
+                    input("\nPress Enter to return to the destination menu...")
+
+                elif sub_choice == "9": #Exity sub-menu, return to Main menu
                     break
 
                 else: #Error/Invalid input handling
@@ -352,7 +446,11 @@ def main():
                     view_average_delay_duration() #Calls function to calculcate average time of flight delay
                     input("\nPress Enter to return to the delay menu...")
 
-                elif sub_choice == "3": #Exit sub-menu, return to Main menu
+                elif sub_choice == "3": #Calls function to view number, average and variance of delays for each departure location
+                    view_delay_stats_by_destination(format_table)
+                    input("\nPress Enter to return to the delay menu...")
+
+                elif sub_choice == "4": #Exit sub-menu, return to Main menu
                     break
 
                 else: #Error/Invalid Input Handling
@@ -366,4 +464,9 @@ def main():
             print("Invalid option. Try again.")
 
 if __name__ == "__main__":
+    if len(sys.argv) > 1: #Arguments given, e.g. "python main.py flights --status Delayed", so run that command instead of the menu
+        try:
+            sys.exit(run_cli(sys.argv[1:], format_table))
+        except BrokenPipeError: #Output piped into something that stopped reading early (e.g. head)
+            sys.exit(1)
     main()
\ No newline at end of file
@@ -3,10 +3,11 @@ from faker import Faker
 from datetime import date
 from datetime import datetime, timedelta
 import random
+from db_interaction_connection import get_connection #Import function to connect to database with a storage tuning profile applied
 
 #Set Up
 fake_gb = Faker('en_GB') #Use UK specific formatting for Pilot addresses
-db_conn = sqlite3.connect("flight_management.db")
+db_conn = get_connection(profile="bulk-load") #Bulk load profile: no journal or fsync while populating, so much faster inserts
 cursor = db_conn.cursor()
 
 def generate_fake_pilots(n, cursor, db_conn):
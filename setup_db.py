@@ -2,13 +2,19 @@
 #Code to create SQLite database and all required table for flight management system
 #Tables only created if do not already exist
 
-import sqlite3 #Import the sqlite3 module needed to interact with SQL data/make tables
+from db_interaction_connection import get_connection #Import function to connect to database with a storage tuning profile applied
+from db_interaction_indexes import create_indexes #Import function to create secondary indexes used by the queries
+from db_interaction_delay_stats import CREATE_TABLE_SQL as CREATE_DELAY_STATS_SQL #Import SQL for the delay summary table
+from db_interaction_arrival_time import migrate_arrival_time #Import function to add/fill the stored arrival time on older databases
+from db_interaction_history import CREATE_TABLES_SQL as CREATE_HISTORY_SQL #Import SQL for the flight state checkpoint tables
+from db_interaction_log_archive import CREATE_TABLES_SQL as CREATE_ARCHIVE_SQL #Import SQL for the status log archive manifest
+from db_interaction_destination_cache import CREATE_TABLES_SQL as CREATE_DESTINATIONS_VERSION_SQL #Import SQL for the Destinations version kept by triggers
 
-#Function to make tables and database
-def create_database():
+#Function to make tables and database. "profile" picks the tuning profile (e.g. "oltp" or "bulk-load"), otherwise FLYME_DB_PROFILE is used
+def create_database(profile=None):
     
-    #Connect to SQLite database file (or create if doesn't exist). File called 'flight_management.db'
-    db_conn = sqlite3.connect('flight_management.db')
+    #Connect to SQLite database file (or create if doesn't exist). File called 'flight_management.db' unless FLYME_DB_PATH set
+    db_conn = get_connection(profile)
 
     #Create table to store personal details for pilots
     db_conn.execute('''
@@ -45,6 +51,7 @@ def create_database():
         departure_date_time DATETIME NOT NULL,
         flight_time INTEGER NOT NULL CHECK(flight_time >=0),
         status TEXT NOT NULL CHECK(status IN('NotDeparted', 'Delayed', 'OnRoute', 'Arrived', 'Cancelled')),
+        arrival_date_time DATETIME,
         FOREIGN KEY (personal_ID) REFERENCES Pilots(personal_ID) ON DELETE RESTRICT,
         FOREIGN KEY (destination_ID) REFERENCES Destinations(destination_ID) ON DELETE RESTRICT,
         FOREIGN KEY (arrival_destination_ID) REFERENCES Destinations(destination_ID) ON DELETE RESTRICT
@@ -63,6 +70,27 @@ def create_database():
         );
     ''')
 
+    #Create FlightDelayStats table, a running summary of delays kept up to date as "Delayed" entries are logged
+    db_conn.execute(CREATE_DELAY_STATS_SQL)
+
+    #Create the checkpoint tables used to rebuild flight states as of any time from FlightStatusLog (see db_interaction_history.py)
+    for sql in CREATE_HISTORY_SQL:
+        db_conn.execute(sql)
+
+    #Create the manifest of FlightStatusLog rows moved to per month archive files (see db_interaction_log_archive.py)
+    for sql in CREATE_ARCHIVE_SQL:
+        db_conn.execute(sql)
+
+    #Create the Destinations version number (and its triggers) used to spot edits to Destinations (see db_interaction_destination_cache.py)
+    for sql in CREATE_DESTINATIONS_VERSION_SQL:
+        db_conn.execute(sql)
+
+    #Create the triggers which keep Flights.arrival_date_time up to date (and add/fill the column on databases made before it existed)
+    migrate_arrival_time(db_conn)
+
+    #Create secondary indexes on Flights, Destinations and FlightStatusLog (see db_interaction_indexes.py)
+    create_indexes(db_conn)
+
     #Save changes to database
     db_conn.commit()
 